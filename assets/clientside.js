@@ -0,0 +1,58 @@
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    polygons: {
+        applyColors: function(colors) {
+            // Recolor the polygon collection without resending its geometry
+            return colors || window.dash_clientside.no_update;
+        }
+    },
+    voronoi: {
+        decodePolygons: function(encoded) {
+            // Rebuild the GeoJSON FeatureCollection from coordinate_codec.encode_polygons output
+            if (!encoded) {
+                return window.dash_clientside.no_update;
+            }
+            const bytes = Uint8Array.from(atob(encoded.coords), function(c) { return c.charCodeAt(0); });
+            const scale = Math.pow(10, encoded.precision);
+            // Zigzag varint deltas; per-axis running sums are the quantized coordinates
+            const coords = [];
+            const sums = [0, 0];
+            let result = 0;
+            let shift = 0;
+            for (let i = 0; i < bytes.length; i++) {
+                result += (bytes[i] & 0x7F) * Math.pow(2, shift);
+                if (bytes[i] & 0x80) {
+                    shift += 7;
+                    continue;
+                }
+                const delta = result % 2 ? -(result + 1) / 2 : result / 2;
+                const axis = coords.length % 2;
+                sums[axis] += delta;
+                coords.push(sums[axis] / scale);
+                result = 0;
+                shift = 0;
+            }
+            const keys = Object.keys(encoded.properties);
+            const features = [];
+            let point = 0;
+            let ring = 0;
+            for (let f = 0; f < encoded.rings.length; f++) {
+                const polygon = [];
+                for (let r = 0; r < encoded.rings[f]; r++, ring++) {
+                    const positions = [];
+                    for (let k = 0; k < encoded.lengths[ring]; k++, point++) {
+                        positions.push([coords[2 * point], coords[2 * point + 1]]);
+                    }
+                    polygon.push(positions);
+                }
+                const properties = {};
+                keys.forEach(function(key) { properties[key] = encoded.properties[key][f]; });
+                features.push({
+                    type: 'Feature',
+                    geometry: {type: 'Polygon', coordinates: polygon},
+                    properties: properties
+                });
+            }
+            return {type: 'FeatureCollection', features: features};
+        }
+    }
+});
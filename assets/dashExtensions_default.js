@@ -6,6 +6,174 @@ window.dashExtensions = Object.assign({}, window.dashExtensions, {
                 weight: 2,
                 fillColor: feature.properties.color
             };
+        },
+        placeStyle: function(feature, context) {
+            // Fill color comes from the GEOID -> color map in the hideout
+            return {
+                weight: 2,
+                opacity: 0.7,
+                color: '#4A4A4A',
+                fillOpacity: 0.4,
+                fillColor: context.hideout.colors[feature.properties.GEOID]
+            };
+        },
+        voronoiStyle: function(feature, context) {
+            // Cells carry a palette name, the hideout maps it to hex
+            const p = feature.properties;
+            const color = context.hideout.colors[p.color] || '#000000';
+            return {
+                color: color,
+                weight: 1,
+                opacity: 0.8,
+                fillColor: color,
+                fillOpacity: p.opacity,
+                dashArray: p.code === 'Unknown' ? '3' : '0'
+            };
+        },
+        placeFilter: function(feature, context) {
+            // Places missing from the color map are hidden
+            return feature.properties.GEOID in context.hideout.colors;
+        },
+        placeOnEachFeature: function(feature, layer, context) {
+            // Tooltip from the feature properties, popup fetched from /details/place
+            const ns = window.dashExtensions.default;
+            const escape = ns.escapeHtml;
+            const p = feature.properties;
+            const count = p.locations + ' location' + (p.locations === 1 ? '' : 's');
+            layer.bindTooltip(escape(p.NAME) + ': ' + count);
+            // The combined view has no single code to show
+            const code = context.hideout.code;
+            ns.bindLazyPopup(layer, '/details/place/' + encodeURIComponent(p.GEOID), function(details) {
+                const records = details.records;
+                const codeLine = records.length && code in records[0] ? code.toUpperCase() + ': ' + records[0][code] : '';
+                return '<div><h5>' + escape(details.NAME) + '</h5>' +
+                    (codeLine ? '<p>' + escape(codeLine) + '</p>' : '') +
+                    '<p>' + count + ':</p>' +
+                    '<ul>' + records.map(function(record) { return '<li>' + escape(record.name) + '</li>'; }).join('') + '</ul></div>';
+            });
+        },
+        bindLazyPopup: function(layer, url, render) {
+            // Fetch the popup content the first time the popup is opened
+            layer.bindPopup('Loading...');
+            let loaded = false;
+            layer.on('popupopen', function(event) {
+                if (loaded) {
+                    return;
+                }
+                fetch(url)
+                    .then(function(response) {
+                        if (!response.ok) {
+                            throw new Error(response.status);
+                        }
+                        return response.json();
+                    })
+                    .then(function(details) {
+                        loaded = true;
+                        event.popup.setContent(render(details));
+                    })
+                    .catch(function() {
+                        event.popup.setContent('Details unavailable');
+                    });
+            });
+        },
+        escapeHtml: function(text) {
+            const div = document.createElement('div');
+            div.textContent = text;
+            // innerHTML leaves quotes alone, escape them for use in attributes
+            return div.innerHTML.replace(/"/g, '&quot;');
+        },
+        pointToCircle: function(feature, latlng, context) {
+            // One canvas renderer per map is shared by every municipality point
+            const map = context.map;
+            map._pointRenderer = map._pointRenderer || L.canvas({padding: 0.5});
+            return L.circleMarker(latlng, {
+                renderer: map._pointRenderer,
+                radius: 6,
+                weight: 1,
+                color: '#FFFFFF',
+                fillColor: feature.properties.color,
+                fillOpacity: 0.9
+            });
+        },
+        clusterToCircle: function(feature, latlng) {
+            // Cluster bubble sized by the number of points it holds
+            const count = feature.properties.point_count;
+            const size = count < 10 ? 30 : count < 100 ? 36 : 44;
+            return L.marker(latlng, {
+                icon: L.divIcon({
+                    html: '<div style="width:' + size + 'px;height:' + size + 'px;line-height:' + size + 'px;' +
+                          'border-radius:50%;background:rgba(74,74,74,0.75);color:#FFFFFF;text-align:center;' +
+                          'font-weight:bold;">' + feature.properties.point_count_abbreviated + '</div>',
+                    className: '',
+                    iconSize: L.point(size, size)
+                })
+            });
+        },
+        pointOnEachFeature: function(feature, layer) {
+            // Tooltip from the feature properties, popup fetched from /details/point
+            if (feature.properties.cluster) {
+                return;
+            }
+            const ns = window.dashExtensions.default;
+            const escape = ns.escapeHtml;
+            const p = feature.properties;
+            layer.bindTooltip(escape(p.name));
+            ns.bindLazyPopup(layer, '/details/point/' + p.id, function(details) {
+                return '<div><h4>' + escape(p.name) + '</h4>' +
+                    '<p>Government: ' + escape(details.government) + '</p>' +
+                    '<p>County: ' + escape(details.county) + '</p>' +
+                    '<p>IRC: ' + escape(details.irc) + '</p>' +
+                    '<p>IECC: ' + escape(details.iecc) + '</p>' +
+                    '<p><a href="' + escape(details.website) + '" target="_blank">Website</a></p></div>';
+            });
+        },
+        addVectorTiles: function(e, ctx) {
+            // Draw a /tiles layer with Leaflet.VectorGrid inside the layer group
+            // that was just added; the layer name and query come from its id.
+            const group = e.target;
+            const id = ctx.id;
+            const styles = {
+                places: function(properties) {
+                    return {
+                        fill: true,
+                        weight: 2,
+                        opacity: 0.7,
+                        color: '#4A4A4A',
+                        fillOpacity: 0.4,
+                        fillColor: properties.fillColor
+                    };
+                },
+                voronoi: function(properties) {
+                    return {
+                        fill: true,
+                        weight: 1,
+                        opacity: 0.8,
+                        color: properties.fillColor,
+                        fillOpacity: properties.opacity,
+                        fillColor: properties.fillColor,
+                        dashArray: properties.code === 'Unknown' ? '3' : '0'
+                    };
+                }
+            };
+            const tiles = L.vectorGrid.protobuf(
+                '/tiles/' + id.layer + '/{z}/{x}/{y}.pbf?' + id.query, {
+                    rendererFactory: L.canvas.tile,
+                    vectorTileLayerStyles: {[id.layer]: styles[id.layer]},
+                    interactive: id.layer === 'places',
+                    maxNativeZoom: 16
+                });
+            if (id.layer === 'places') {
+                const escape = window.dashExtensions.default.escapeHtml;
+                tiles.on('click', function(event) {
+                    const p = event.layer.properties;
+                    const count = p.locations + ' location' + (p.locations === 1 ? '' : 's');
+                    L.popup()
+                        .setLatLng(event.latlng)
+                        .setContent('<h5>' + escape(p.NAME) + '</h5>' + (p.code ? '<p>' + escape(p.code) + '</p>' : '') + '<p>' + count + '</p>')
+                        .openOn(group._map);
+                });
+            }
+            group.addLayer(tiles);
         }
     }
-});
\ No newline at end of file
+});
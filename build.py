@@ -0,0 +1,443 @@
+"""
+Incremental data build: python build.py [targets...]
+
+Every data file the app uses is produced by a Step with declared inputs and
+outputs. A step reruns only when the content hash of an input, of one of its
+outputs, or of the source files that implement it differs from the last successful
+run recorded in data/.build_state.json. Steps whose inputs are ready run in
+parallel worker processes.
+"""
+import argparse
+import hashlib
+import inspect
+import json
+import os
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+BASE_DIR = os.path.dirname(os.path.realpath(__file__))
+DATA_DIR = os.path.join(BASE_DIR, 'data')
+STATE_FILENAME = '.build_state.json'
+
+
+class BuildError(Exception):
+    """Raised for an invalid step graph or a failed build"""
+
+
+class Step:
+    """
+    One node of the build graph.
+
+    Parameters:
+    - name (str): Target name used on the command line.
+    - inputs (list): Files or directories read by the step.
+    - outputs (list): Files or directories written by the step.
+    - action (callable): Module-level function called with `args`; it runs in a worker process.
+    - args (tuple): Arguments for the action, usually the input and output paths.
+    - default (bool): Whether a plain `python build.py` builds this step.
+    - code (list, optional): Further source files the result depends on (helper
+      modules, config.py); the action's own file is always included.
+    """
+
+    def __init__(self, name, inputs, outputs, action, args=(), default=True, code=()):
+        self.name = name
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.action = action
+        self.args = tuple(args)
+        self.default = default
+        self.code = list(code)
+
+    def code_paths(self):
+        """Source files of the step, hashed so edits to a script or its helpers rerun it"""
+        return [inspect.getsourcefile(self.action)] + self.code
+
+
+def hash_path(path):
+    """
+    Content hash of a file or of every file in a directory.
+
+    Returns:
+    - str: Hex SHA-256 digest, or None if the path does not exist.
+    """
+    if os.path.isfile(path):
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+    if os.path.isdir(path):
+        digest = hashlib.sha256()
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                file_path = os.path.join(root, name)
+                digest.update(os.path.relpath(file_path, path).encode())
+                digest.update(hash_path(file_path).encode())
+        return digest.hexdigest()
+    return None
+
+
+class HashCache:
+    """
+    Content hashes memoized by size and mtime, so unchanged files are not re-read.
+
+    Entries are stored in the build state and survive between runs.
+    """
+
+    def __init__(self, entries=None):
+        self.entries = dict(entries or {})
+        self._lock = threading.Lock()
+
+    def _stamp(self, path):
+        if os.path.isdir(path):
+            # Directories change when any file inside them changes
+            stamps = []
+            for root, dirs, files in os.walk(path):
+                for name in files:
+                    stat = os.stat(os.path.join(root, name))
+                    stamps.append((os.path.relpath(os.path.join(root, name), path), stat.st_size, stat.st_mtime_ns))
+            return sorted(stamps)
+        stat = os.stat(path)
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def get(self, path):
+        """Content hash of a path, None if it is missing"""
+        if not os.path.exists(path):
+            return None
+        stamp = json.loads(json.dumps(self._stamp(path)))
+        with self._lock:
+            cached = self.entries.get(path)
+        if cached and cached['stamp'] == stamp:
+            return cached['hash']
+        digest = hash_path(path)
+        with self._lock:
+            self.entries[path] = {'stamp': stamp, 'hash': digest}
+        return digest
+
+
+def _run_step(action, args):
+    """Worker process entry point; returns the step duration in seconds"""
+    start = time.time()
+    action(*args)
+    return time.time() - start
+
+
+class Pipeline:
+    """
+    A set of steps with their dependencies inferred from shared paths.
+
+    Parameters:
+    - steps (list): Step objects; every output must be produced by exactly one step.
+    - state_path (str): JSON file recording the hashes of the last successful runs.
+    """
+
+    def __init__(self, steps, state_path):
+        self.steps = {step.name: step for step in steps}
+        self.state_path = state_path
+        producers = {}
+        for step in steps:
+            for output in step.outputs:
+                if output in producers:
+                    raise BuildError(f"{output} is produced by both {producers[output]} and {step.name}")
+                producers[output] = step.name
+        # step -> names of the steps producing its inputs
+        self.dependencies = {
+            step.name: sorted({producers[path] for path in step.inputs if path in producers})
+            for step in steps
+        }
+        self._check_acyclic()
+
+    def _check_acyclic(self):
+        visiting, done = set(), set()
+
+        def visit(name, chain):
+            if name in done:
+                return
+            if name in visiting:
+                raise BuildError(f"Dependency cycle: {' -> '.join(chain + [name])}")
+            visiting.add(name)
+            for dependency in self.dependencies[name]:
+                visit(dependency, chain + [name])
+            visiting.discard(name)
+            done.add(name)
+
+        for name in self.steps:
+            visit(name, [])
+
+    def closure(self, targets):
+        """The targets plus every step they depend on"""
+        selected = set()
+        pending = list(targets)
+        while pending:
+            name = pending.pop()
+            if name not in self.steps:
+                raise BuildError(f"Unknown target {name}, choose from {', '.join(sorted(self.steps))}")
+            if name not in selected:
+                selected.add(name)
+                pending.extend(self.dependencies[name])
+        return selected
+
+    def _load_state(self):
+        if not os.path.exists(self.state_path):
+            return {'steps': {}, 'hashes': {}}
+        try:
+            with open(self.state_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {'steps': {}, 'hashes': {}}
+
+    def _save_state(self, state, hashes):
+        state['hashes'] = hashes.entries
+        tmp_path = self.state_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.state_path)
+
+    def _signature(self, step, hashes):
+        """Hashes of everything a step's result depends on"""
+        return {
+            'code': {path: hashes.get(path) for path in step.code_paths()},
+            'args': repr(step.args),
+            'inputs': {path: hashes.get(path) for path in step.inputs},
+        }
+
+    def _stale_reason(self, step, signature, record):
+        """Why a step must run, or None if its recorded outputs are current"""
+        missing = [path for path in step.inputs if signature['inputs'][path] is None]
+        if missing:
+            raise BuildError(f"{step.name}: missing input {', '.join(missing)}")
+        if record is None:
+            return "never built"
+        if record['code'] != signature['code'] or record['args'] != signature['args']:
+            return "step changed"
+        changed = [path for path in step.inputs if record['inputs'].get(path) != signature['inputs'][path]]
+        if changed:
+            return f"changed {', '.join(os.path.relpath(path, os.path.dirname(self.state_path)) for path in changed)}"
+        return None
+
+    def _outputs_current(self, step, record, hashes):
+        """Every output exists and is what the last run wrote (outputs added since count as missing)"""
+        for path in step.outputs:
+            current = hashes.get(path)
+            if current is None or record['outputs'].get(path) != current:
+                return False
+        return True
+
+    def run(self, targets, jobs=None, force=False, dry_run=False, log=print):
+        """
+        Bring the targets up to date.
+
+        Parameters:
+        - targets (list): Step names; their dependencies are built first.
+        - jobs (int): Worker processes (default: CPU count).
+        - force (bool): Rerun every selected step.
+        - dry_run (bool): Only report which steps would run; a step below a
+          stale one is reported as waiting since its inputs are not built yet.
+
+        Returns:
+        - dict: Step name -> 'built', 'current', 'failed' or 'skipped'.
+        """
+        selected = self.closure(targets)
+        state = self._load_state()
+        hashes = HashCache(state.get('hashes'))
+        records = state.setdefault('steps', {})
+        results = {}
+        running = {}
+        pending = set(selected)
+
+        def ready(name):
+            return all(results.get(dependency) in ('built', 'current') for dependency in self.dependencies[name])
+
+        def blocked(name):
+            return any(results.get(dependency) in ('failed', 'skipped') for dependency in self.dependencies[name])
+
+        def waits_for_dry_run(name):
+            return dry_run and any(results.get(dependency) == 'would build' for dependency in self.dependencies[name])
+
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            while pending or running:
+                for name in sorted(pending):
+                    step = self.steps[name]
+                    if blocked(name):
+                        pending.discard(name)
+                        results[name] = 'skipped'
+                        log(f"[skip] {name}: a dependency failed")
+                        continue
+                    if waits_for_dry_run(name):
+                        pending.discard(name)
+                        results[name] = 'would build'
+                        log(f"[would build] {name}: waits for {', '.join(self.dependencies[name])}")
+                        continue
+                    if not ready(name):
+                        continue
+                    pending.discard(name)
+                    try:
+                        signature = self._signature(step, hashes)
+                        record = records.get(name)
+                        reason = "forced" if force else self._stale_reason(step, signature, record)
+                        if reason is None and not self._outputs_current(step, record, hashes):
+                            reason = "outputs modified or missing"
+                    except BuildError as e:
+                        results[name] = 'failed'
+                        log(f"[fail] {e}")
+                        continue
+                    if reason is None:
+                        results[name] = 'current'
+                        log(f"[ok] {name}")
+                    elif dry_run:
+                        results[name] = 'would build'
+                        log(f"[would build] {name}: {reason}")
+                    else:
+                        log(f"[run] {name}: {reason}")
+                        for output in step.outputs:
+                            os.makedirs(os.path.dirname(output), exist_ok=True)
+                        running[executor.submit(_run_step, step.action, step.args)] = (name, signature)
+
+                if not running:
+                    if pending and not any(ready(name) or blocked(name) or waits_for_dry_run(name) for name in pending):
+                        raise BuildError(f"Stuck with pending steps {', '.join(sorted(pending))}")
+                    continue
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name, signature = running.pop(future)
+                    step = self.steps[name]
+                    try:
+                        duration = future.result()
+                        missing = [path for path in step.outputs if not os.path.exists(path)]
+                        if missing:
+                            raise BuildError(f"did not write {', '.join(missing)}")
+                    except Exception as e:
+                        results[name] = 'failed'
+                        records.pop(name, None)
+                        log(f"[fail] {name}: {e}")
+                        if not isinstance(e, BuildError):
+                            log(traceback.format_exc())
+                        continue
+                    records[name] = dict(signature, outputs={path: hashes.get(path) for path in step.outputs})
+                    results[name] = 'built'
+                    log(f"[done] {name} in {duration:.1f}s")
+                    # Saved after every step, so an interrupted build keeps its progress
+                    self._save_state(state, hashes)
+
+        if not dry_run:
+            self._save_state(state, hashes)
+        return results
+
+
+def define_steps(data_dir=DATA_DIR, base_dir=BASE_DIR):
+    """
+    The data build graph.
+
+    Raw inputs (edited by hand or downloaded): data/gracy_3-3.csv,
+    data/denver-metro.csv, data/counties.json and the TIGER place shapefile.
+    The census spreadsheet needs the Census API, so it is only built when asked
+    for by name (`python build.py census`).
+    """
+    from add_denver_metro import add_denver_metro
+    from building_code_map.config import (GEOJSON_FILENAME, JOIN_INDEX_FILENAME, PLACE_GEOJSON_PATH,
+                                          PLACE_SIMPLIFY_LEVELS)
+    from building_code_map.geostore import store_path_for
+    from building_code_map.simplify import build_levels, level_store_path
+    from clean_point_data import clean_point_data
+    from format_geojson import format_counties
+    from parse_gracy_data import csv_to_points
+    from to_geojson import convert_with_store
+
+    def data(*parts):
+        return os.path.join(data_dir, *parts)
+
+    def source(*parts):
+        return os.path.join(base_dir, *parts)
+
+    # Modules whose changes affect every step that writes or reads binary stores
+    config = source('building_code_map', 'config.py')
+    geostore = source('building_code_map', 'geostore.py')
+
+    raw_points = data('gracy_3-3.geojson')
+    metro_points = data('gracy_3-9.geojson')
+    points = data(GEOJSON_FILENAME)
+    # PLACE_GEOJSON_PATH is relative to the repository root and starts with data/
+    places = data(os.path.relpath(PLACE_GEOJSON_PATH, 'data'))
+    shapefile_path = os.path.splitext(places)[0] + '.shp'
+
+    return [
+        Step('points', [data('gracy_3-3.csv')], [raw_points], csv_to_points,
+             (data('gracy_3-3.csv'), raw_points)),
+        Step('denver_metro', [data('denver-metro.csv'), raw_points], [metro_points], add_denver_metro,
+             (data('denver-metro.csv'), raw_points, metro_points)),
+        Step('clean_points', [metro_points], [points, store_path_for(points)], clean_point_data,
+             (metro_points, points), code=[geostore]),
+        Step('counties', [data('counties.json')], [data('counties_updated.json')], format_counties,
+             (data('counties.json'), data('counties_updated.json'))),
+        Step('places', [shapefile_path, os.path.splitext(shapefile_path)[0] + '.dbf'],
+             [places, store_path_for(places)], convert_with_store, (shapefile_path, places), code=[geostore]),
+        # The levels are passed explicitly so a tolerance change in config.py shows up in the args
+        Step('place_levels', [places, store_path_for(places)],
+             [level_store_path(places, min_zoom) for min_zoom, _ in PLACE_SIMPLIFY_LEVELS],
+             build_levels, (places, [tuple(level) for level in PLACE_SIMPLIFY_LEVELS]), code=[geostore, config]),
+        Step('join_index', [points, store_path_for(points), places, store_path_for(places)],
+             [data(JOIN_INDEX_FILENAME)], build_join_index_file, (points, places, data(JOIN_INDEX_FILENAME)),
+             code=[source('building_code_map', 'join_index.py'), source('building_code_map', 'place_resolver.py'),
+                   source('building_code_map', 'utils.py'), geostore]),
+        Step('census', [metro_points, places],
+             [os.path.join(base_dir, 'municipality_census_data.csv'),
+              os.path.join(base_dir, 'municipality_census_data.xlsx')],
+             collect_census_data,
+             (metro_points, places,
+              os.path.join(base_dir, 'municipality_census_data.csv'),
+              os.path.join(base_dir, 'municipality_census_data.xlsx')),
+             default=False, code=[source('get_census_data.py'), source('census_lib.py'),
+                                  source('collection_journal.py'), source('variable_catalog.py')]),
+    ]
+
+
+def build_join_index_file(point_path, polygon_path, index_path):
+    """Precompute the place join index the app would otherwise build on first start"""
+    from building_code_map.geostore import load_geojson, source_path
+    from building_code_map.join_index import build_join_index, save_join_index
+
+    index = build_join_index(load_geojson(point_path), load_geojson(polygon_path))
+    save_join_index(index, index_path, source_path(point_path), source_path(polygon_path))
+
+
+def collect_census_data(municipalities_file, places_file, output_file, excel_file):
+    """Run get_census_data (imported here, it sets up the Census API client on import)"""
+    import get_census_data
+
+    get_census_data.main(municipalities_file=municipalities_file, places_file=places_file,
+                         output_file=output_file, excel_file=excel_file)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rebuild the data files whose inputs changed")
+    parser.add_argument('targets', nargs='*', help="Steps to build with their dependencies (default: all default steps)")
+    parser.add_argument('-j', '--jobs', type=int, default=None, help="Parallel worker processes (default: CPU count)")
+    parser.add_argument('--force', action='store_true', help="Rerun the selected steps even if they are current")
+    parser.add_argument('-n', '--dry-run', action='store_true', help="Show what would run without running it")
+    parser.add_argument('--list', action='store_true', help="List the steps and their dependencies")
+    parser.add_argument('--data-dir', default=DATA_DIR, help="Directory holding the data files")
+    args = parser.parse_args(argv)
+
+    steps = define_steps(args.data_dir)
+    pipeline = Pipeline(steps, os.path.join(args.data_dir, STATE_FILENAME))
+    if args.list:
+        for step in steps:
+            dependencies = ', '.join(pipeline.dependencies[step.name]) or '-'
+            print(f"{step.name:14} {'default' if step.default else 'on demand':10} after: {dependencies}")
+        return 0
+
+    targets = args.targets or [step.name for step in steps if step.default]
+    start = time.time()
+    results = pipeline.run(targets, jobs=args.jobs, force=args.force, dry_run=args.dry_run)
+    counts = {status: list(results.values()).count(status) for status in sorted(set(results.values()))}
+    print(f"Finished in {time.time() - start:.1f}s: " + ', '.join(f"{count} {status}" for status, count in counts.items()))
+    return 1 if 'failed' in results.values() or 'skipped' in results.values() else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,3 +1,21 @@
-from .app import create_dash_app
-from .callbacks import register_callbacks
-from .layout import create_layout
\ No newline at end of file
+import importlib
+
+# The app modules import dash and configure logging, so they are only loaded on
+# first use; offline tools (place_resolver, geostore, ...) import without them
+_EXPORTS = {
+    'create_dash_app': '.app',
+    'register_callbacks': '.callbacks',
+    'register_detail_routes': '.details',
+    'create_layout': '.layout',
+    'register_tile_routes': '.tiles',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_EXPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
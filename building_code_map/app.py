@@ -6,6 +6,8 @@ from flask import Flask
 
 from .layout import create_layout
 from .callbacks import register_callbacks
+from .config import USE_VECTOR_TILES, VECTOR_GRID_SCRIPT
+from .data import get_store
 
 def create_dash_app(server: Flask, url_base_pathname: str = "/"):
     """
@@ -16,9 +18,14 @@ def create_dash_app(server: Flask, url_base_pathname: str = "/"):
         server=server,
         url_base_pathname=url_base_pathname,
         external_stylesheets=[dbc.themes.BOOTSTRAP],
+        # Leaflet.VectorGrid renders the /tiles layers in the browser
+        external_scripts=[VECTOR_GRID_SCRIPT] if USE_VECTOR_TILES else [],
         suppress_callback_exceptions=True
     )
 
+    # Parse the datasets once up front; callbacks read them from the shared store
+    get_store().get()
+
     # Set the layout
     app.layout = create_layout()
 
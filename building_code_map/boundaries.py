@@ -0,0 +1,143 @@
+import json
+import logging
+import os
+import threading
+
+import numpy as np
+import shapely
+from shapely.geometry import shape
+
+from .config import BOUNDARY_GEOJSON_PATH, BOUNDARY_TILE_SIZE
+from .data import BASE_PATH
+from .geostore import store_geometries
+from .utils import parse_bounds, polygons_from_leaflet, polygons_to_leaflet
+
+logger = logging.getLogger(__name__)
+
+
+def _polygonal_parts(geometries):
+    """
+    Replace GeometryCollections with the MultiPolygon of their polygonal parts
+
+    Intersections and unions return a collection when a cell also touches the
+    outline along an edge or in a point; the lines and points are dropped.
+    Collections without any polygon become None.
+    """
+    collections = shapely.get_type_id(geometries) == shapely.GeometryType.GEOMETRYCOLLECTION
+    if not collections.any():
+        return geometries
+
+    parts, owners = shapely.get_parts(geometries[collections], return_index=True)
+    # Collections can hold MultiPolygons, flatten those to polygons as well
+    parts, part_owners = shapely.get_parts(parts, return_index=True)
+    owners = owners[part_owners]
+    polygons = shapely.get_type_id(parts) == shapely.GeometryType.POLYGON
+
+    rebuilt = np.full(collections.sum(), None, dtype=object)
+    if polygons.any():
+        shapely.multipolygons(parts[polygons], indices=owners[polygons], out=rebuilt)
+    geometries = geometries.copy()
+    geometries[collections] = rebuilt
+    return geometries
+
+
+class Boundary:
+    """
+    A state or county outline prepared for clipping many Voronoi cells at once.
+
+    The outline is cut into a grid of tiles that are prepared and indexed with
+    an STRtree, so each cell is only intersected with the few tiles it touches
+    instead of the whole outline.
+    """
+
+    def __init__(self, geometry, tile_size=BOUNDARY_TILE_SIZE):
+        self.geometry = shapely.make_valid(geometry)
+        self.bounds = self.geometry.bounds
+
+        # Cut the outline into grid tiles
+        min_lon, min_lat, max_lon, max_lat = self.bounds
+        lons = np.arange(min_lon, max_lon + tile_size, tile_size)
+        lats = np.arange(min_lat, max_lat + tile_size, tile_size)
+        grid_lon, grid_lat = np.meshgrid(lons[:-1], lats[:-1])
+        boxes = shapely.box(grid_lon.ravel(), grid_lat.ravel(),
+                            grid_lon.ravel() + tile_size, grid_lat.ravel() + tile_size)
+        tiles = shapely.intersection(self.geometry, boxes)
+        self.tiles = tiles[~shapely.is_empty(tiles)]
+
+        shapely.prepare(self.tiles)
+        self.tree = shapely.STRtree(self.tiles)
+
+    @classmethod
+    def from_geojson(cls, path, tile_size=BOUNDARY_TILE_SIZE):
+        """Load and union every feature of a GeoJSON FeatureCollection, or of its binary store"""
+        geometries = store_geometries(path)
+        if geometries is None:
+            with open(path) as f:
+                collection = json.load(f)
+            geometries = np.array([shape(feature['geometry']) for feature in collection['features']
+                                   if feature.get('geometry')], dtype=object)
+        geometries = geometries[shapely.is_geometry(geometries)]
+        return cls(shapely.union_all(shapely.make_valid(geometries)), tile_size)
+
+    def clip(self, polygons, bounds=None):
+        """
+        Clip Voronoi polygons to the boundary, and optionally to map bounds
+
+        Parameters:
+        polygons (list): List of (polygon_coords, point_index) tuples
+        bounds (list, optional): Map bounds in any format accepted by parse_bounds
+
+        Returns:
+        list: List of clipped polygons with format [(polygon_coords, point_index), ...]
+        """
+        cells, point_indices = polygons_from_leaflet(polygons)
+        if bounds is not None:
+            cells = shapely.clip_by_rect(cells, *parse_bounds(bounds))
+        if not len(cells):
+            return []
+
+        # All (cell, tile) pairs that touch, found in one tree query
+        cell_idx, tile_idx = self.tree.query(cells, predicate='intersects')
+        if not len(cell_idx):
+            return []
+        order = np.argsort(cell_idx, kind='stable')
+        cell_idx, tile_idx = cell_idx[order], tile_idx[order]
+
+        # Cells lying completely inside a tile keep their geometry, the rest are intersected
+        pieces = cells[cell_idx]
+        crossing = ~shapely.contains_properly(self.tiles[tile_idx], pieces)
+        pieces[crossing] = shapely.intersection(pieces[crossing], self.tiles[tile_idx[crossing]])
+
+        # Reassemble cells that were split across tiles
+        cell_ids, starts, counts = np.unique(cell_idx, return_index=True, return_counts=True)
+        clipped = pieces[starts]
+        for i in np.flatnonzero(counts > 1):
+            clipped[i] = shapely.union_all(pieces[starts[i]:starts[i] + counts[i]])
+
+        return polygons_to_leaflet(_polygonal_parts(clipped), point_indices[cell_ids])
+
+
+_boundary = None
+_boundary_loaded = False
+_boundary_lock = threading.Lock()
+
+
+def get_boundary():
+    """
+    Return the shared Boundary, loading it on first use
+
+    Returns None if the boundary file does not exist, so callers can fall back
+    to clipping by map bounds.
+    """
+    global _boundary, _boundary_loaded
+    if not _boundary_loaded:
+        with _boundary_lock:
+            if not _boundary_loaded:
+                path = os.path.join(BASE_PATH, BOUNDARY_GEOJSON_PATH)
+                if os.path.exists(path):
+                    logger.info(f"Loading clipping boundary from {path}")
+                    _boundary = Boundary.from_geojson(path)
+                else:
+                    logger.warning(f"Boundary file {path} not found, clipping Voronoi cells to map bounds")
+                _boundary_loaded = True
+    return _boundary
@@ -1,11 +1,15 @@
-from dash.dependencies import Input, Output, State
-from dash import html
+from dash.dependencies import ClientsideFunction, Input, Output, State
+from dash import dcc, html
+from dash.exceptions import PreventUpdate
 import dash_leaflet as dl
-import json
-import os
-from .utils import compute_voronoi_polygons, clip_polygons_to_bounds
+from dash_extensions.javascript import Namespace, arrow_function
+from .voronoi_cache import voronoi_cache
 from collections import Counter
-from .config import GEOJSON_FILENAME
+from .config import (COLOR_TO_HEX, COORDINATE_PRECISION, ENCODE_VORONOI_COORDINATES, MARKER_CLUSTER,
+                     MARKER_CLUSTER_MAX_ZOOM, MARKER_CLUSTER_RADIUS, MARKER_LAYER_MODE, POLYGON_LAYER_MODE,
+                     SHOW_VORONOI_LAYER, USE_VECTOR_TILES)
+from .coordinate_codec import encode_polygons
+from .data import get_dataset
 
 def register_callbacks(app):
     @app.callback(
@@ -19,7 +23,11 @@ def register_callbacks(app):
         """
         Toggle between displaying IRC, IECC, or combined codes on the map and control visibility of unknown pins
         """
-        if selected_code == "combined":
+        if MARKER_LAYER_MODE == 'geojson':
+            classified_points = classify_points(selected_code, show_unknown)
+            point_data = [(position, color, code) for _, position, color, code, _, _ in classified_points]
+            markers = [create_point_layer(classified_points)] if classified_points else []
+        elif selected_code == "combined":
             markers, point_data = create_markers_for_combined_mode(show_unknown)
         else:
             markers, point_data = create_markers_for_code_type(selected_code, show_unknown)
@@ -30,79 +38,35 @@ def register_callbacks(app):
         
         # We need to recreate the markers every time to ensure proper rendering
         voronoi_layer = None
-        if point_data:
-            # points format is [[lat, lon], ...]
-            points = [pos for pos, _, _ in point_data]
-            colors = [color for _, color, _ in point_data]
-            opacities = [0.5 if code != 'Unknown' else 0.2 for _, _, code in point_data]
-            
+        show_voronoi = SHOW_VORONOI_LAYER and point_data
+        if show_voronoi and USE_VECTOR_TILES:
+            # Cells are drawn from the tile endpoint, which tessellates the whole point set
+            voronoi_layer = create_vector_tile_layer('voronoi', selected_code, show_unknown)
+        elif show_voronoi:
             # Use Colorado state bounds if map bounds aren't available yet
             map_bounds = bounds if bounds else [[-109.5, 37.0], [-102.0, 41.0]]
             
-            # Calculate Voronoi polygons using map bounds
-            voronoi_polygons = compute_voronoi_polygons(points, map_bounds)
-            voronoi_polygons = clip_polygons_to_bounds(voronoi_polygons, map_bounds)
-            
-            # Create GeoJSON features for the Voronoi cells
-            features = []
-            for (polygon_coords, point_index) in voronoi_polygons:
-                if point_index < len(colors):
-                    color = colors[point_index]
-                    opacity = opacities[point_index]
-                    code = point_data[point_index][2]
-                    
-                    # Skip unknown codes if not showing them
-                    if code == 'Unknown' and not show_unknown:
-                        continue
-                    
-                    # Create GeoJSON feature
-                    feature = {
-                        'type': 'Feature',
-                        'geometry': {
-                            'type': 'Polygon',
-                            'coordinates': [[list(coord) for coord in polygon_coords]]
-                        },
-                        'properties': {
-                            'color': color,
-                            'opacity': opacity,
-                            'code': code
-                        }
-                    }
-                    features.append(feature)
-            
-            # Create GeoJSON object
-            geojson_data = {
-                'type': 'FeatureCollection',
-                'features': features
-            }
+            features = create_voronoi_features(point_data, selected_code, show_unknown, map_bounds)
             
-            # Create the Voronoi layer
-            color_to_hex = {
-                'blue': '#2A81CB',
-                'gold': '#FFD326',
-                'red': '#CB2B3E',
-                'green': '#2AAD27',
-                'orange': '#CB8427',
-                'yellow': '#CAC428',
-                'violet': '#9C2BCB',
-                'grey': '#7B7B7B',
-                'black': '#3D3D3D'
-            }
+            encoded_store = None
+            if ENCODE_VORONOI_COORDINATES:
+                # Sent as a compact buffer, decoded into the layer's data by a clientside callback;
+                # the encoder also swaps the cells from [lat, lon] to GeoJSON order
+                encoded_store = dcc.Store(id='voronoi-encoded',
+                                          data=encode_polygons(features, COORDINATE_PRECISION, swap_axes=True))
+                geojson_data = None
+            else:
+                geojson_data = {'type': 'FeatureCollection', 'features': voronoi_features_to_geojson(features)}
             
+            # Create the Voronoi layer, styled in the browser with the palette in the hideout
             voronoi_layer = dl.GeoJSON(
                 data=geojson_data,
                 id='voronoi-layer',
-                options={
-                    'style': lambda feature: {
-                        'color': color_to_hex.get(feature['properties']['color'], '#000000'),
-                        'weight': 1,
-                        'opacity': 0.8,
-                        'fillColor': color_to_hex.get(feature['properties']['color'], '#000000'),
-                        'fillOpacity': feature['properties']['opacity'],
-                        'dashArray': '3' if feature['properties']['code'] == 'Unknown' else '0'
-                    }
-                }
+                style=Namespace('dashExtensions', 'default')('voronoiStyle'),
+                hideout={'colors': COLOR_TO_HEX}
             )
+            if encoded_store is not None:
+                voronoi_layer = dl.LayerGroup(children=[voronoi_layer, encoded_store])
         
         # Create markers layer (updated to remove combined_mode variable)
         markers_layer = dl.LayerGroup(
@@ -111,186 +75,82 @@ def register_callbacks(app):
         )
         
         # Create a group for both layers and use selected_code to form the layer id
-        layers = [voronoi_layer, markers_layer] if voronoi_layer else [markers_layer]
+        # Components are falsy when they have no children, compare with None
+        layers = [voronoi_layer, markers_layer] if voronoi_layer is not None else [markers_layer]
         
         return dl.LayerGroup(
             id=f'{selected_code}-layer',  # Updated to use selected_code only
             children=layers
         )
     
-    @app.callback(
-        Output('polygon-layer', 'children'),
-        [Input('code-toggle', 'value'),
-         Input('show-unknown-toggle', 'value')]  # Removed combined-mode-toggle
-    )
-    def update_polygon_colors(selected_code, show_unknown):
-        import os, json
-        from collections import Counter
-        base_path = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
-        point_geojson_path = os.path.join(base_path, 'data', GEOJSON_FILENAME)
-        with open(point_geojson_path) as f:
-            points = json.load(f)
-        polygon_geojson_path = os.path.join(base_path, 'data/tl_2024_08_place/tl_2024_08_place.geojson')
-        with open(polygon_geojson_path) as f:
-            polygons = json.load(f)
-        # Color to hex mapping remains constant
-        color_to_hex = {
-            'blue': '#2A81CB',
-            'gold': '#FFD326',
-            'red': '#CB2B3E',
-            'green': '#2AAD27',
-            'orange': '#CB8427',
-            'yellow': '#CAC428',
-            'violet': '#9C2BCB',
-            'grey': '#7B7B7B',
-            'black': '#3D3D3D'
-        }
-        # Build mapping from polygon IDs to matching point names (based on normalized names)
-        polygon_point_names = {}
-        def normalize_name(name):
-            import re
-            return re.sub(r'\[.*?\]|\?', '', str(name)).strip().lower() if name else ""
-        point_name_mapping = {}
-        for feature in points['features']:
-            if 'properties' in feature:
-                raw_name = feature['properties'].get('name', '')
-                normalized = normalize_name(raw_name)
-                point_name_mapping[normalized] = raw_name
-        for feature in polygons['features']:
-            if 'properties' in feature:
-                polygon_id = feature['properties'].get('GEOID', '')
-                polygon_name = feature['properties'].get('NAME', '')
-                polygon_namelsad = feature['properties'].get('NAMELSAD', '')
-                normalized1 = normalize_name(polygon_name)
-                normalized2 = normalize_name(polygon_namelsad)
-                polygon_point_names[polygon_id] = []
-                if normalized1 in point_name_mapping:
-                    polygon_point_names[polygon_id].append(point_name_mapping[normalized1])
-                elif normalized2 in point_name_mapping:
-                    polygon_point_names[polygon_id].append(point_name_mapping[normalized2])
-        updated_polygon_layers = []
-        if selected_code == "combined":
-            # Build global combined mapping from point name to combined key
-            combined_keys = []
-            point_name_to_combined = {}
-            for feature in points['features']:
-                if feature.get('geometry', {}).get('type') == 'Point' and 'properties' in feature:
-                    props = feature['properties']
-                    irc = props.get('irc', 'Unknown')
-                    iecc = props.get('iecc', 'Unknown')
-                    if isinstance(irc, (int, float)):
-                        irc = str(irc)
-                    if isinstance(iecc, (int, float)):
-                        iecc = str(iecc)
-                    # NEW: Only use ("Other", "Other") if both codes are Unknown
-                    if irc == 'Unknown' and iecc == 'Unknown':
-                        key = ("Other", "Other")
-                    else:
-                        key = (irc, iecc)
-                    if key == ("Other", "Other") and not show_unknown:
-                        continue
-                    combined_keys.append(key)
-                    point_name = props.get('name', '')
-                    point_name_to_combined[point_name] = key
-            # Determine top combined classes (limited to available colors)
-            available_colors = ['blue', 'gold', 'red', 'green', 'orange', 'yellow', 'violet', 'black']
-            counter = Counter(combined_keys)
-            top_classes = {k for k, _ in counter.most_common(len(available_colors))}
-            # ---- Modified sorting: order by IECC then IRC (both descending) ----
-            sorted_top = sorted(
-                top_classes,
-                key=lambda k: ((int(k[1]) if k[1].isdigit() else -1), (int(k[0]) if k[0].isdigit() else -1)),
-                reverse=True
-            )
-            class_color_mapping = {cls: available_colors[i] for i, cls in enumerate(sorted_top)}
-            # For each polygon, use the first matched point's combined key if available
-            for feature in polygons['features']:
-                if 'properties' in feature and 'geometry' in feature:
-                    polygon_id = feature['properties'].get('GEOID', None)
-                    point_names = polygon_point_names.get(polygon_id, [])
-                    # NEW: Skip polygon if no matching points and show_unknown is unchecked
-                    if not show_unknown and len(point_names) == 0:
-                        continue
-                    city_name = feature['properties'].get('NAME', 'Unknown Area')
-                    fill_color = color_to_hex.get('grey')
-                    for name in point_names:
-                        key = point_name_to_combined.get(name)
-                        # NEW: If key not in mapping, reassign to ("Other", "Other")
-                        if key not in class_color_mapping:
-                            key = ("Other", "Other")
-                        if key and key in class_color_mapping:
-                            color_name = class_color_mapping.get(key) or "black"
-                            fill_color = color_to_hex.get(color_name, color_to_hex.get('grey'))
-                            break
-                    single_feature_geojson = {"type": "FeatureCollection", "features": [feature]}
-                    tooltip_content = f"{city_name}: {len(point_names)} location{'s' if len(point_names)!=1 else ''}"
-                    popup_content = html.Div([
-                        html.H5(f"{city_name}"),
-                        html.P(f"{len(point_names)} location{'s' if len(point_names)!=1 else ''}:"),
-                        html.Ul([html.Li(n) for n in point_names])
-                    ])
-                    polygon = dl.GeoJSON(
-                        data=single_feature_geojson,
-                        id=f'polygon-{polygon_id}',
-                        style={'weight': 2, 'opacity': 0.7, 'color': '#4A4A4A',
-                               'fillOpacity': 0.4, 'fillColor': fill_color},
-                        hoverStyle=dict(weight=3, color='#666', dashArray=''),
-                        children=[dl.Tooltip(tooltip_content), dl.Popup(popup_content)]
-                    )
-                    updated_polygon_layers.append(polygon)
-        else:
-            # Use single code logic (existing behavior)
-            from .callbacks import collect_all_codes, create_color_mapping  # if needed adjust import
-            all_codes = collect_all_codes(points)
-            color_mapping = create_color_mapping(all_codes)
-            for feature in polygons['features']:
-                if 'properties' in feature and 'geometry' in feature:
-                    polygon_id = feature['properties'].get('GEOID', None)
-                    point_names = polygon_point_names.get(polygon_id, [])
-                    # NEW: Skip polygon if no matching points and show_unknown is unchecked
-                    if not show_unknown and len(point_names) == 0:
-                        continue
-                    city_name = feature['properties'].get('NAME', 'Unknown Area')
-                    fill_color = color_to_hex.get('grey')
-                    code_value = 'Unknown'
-                    # Use first matched point's single code from the selected type
-                    # (Note: here selected_code determines which code is used)
-                    point_name_to_code = {}
-                    for feat in points['features']:
-                        if 'properties' in feat:
-                            name = feat.get('properties', {}).get('name', '')
-                            code_val = feat.get('properties', {}).get(selected_code.lower(), 'Unknown')
-                            if isinstance(code_val, (int, float)):
-                                code_val = str(code_val)
-                            point_name_to_code[name] = code_val
-                    for name in point_names:
-                        code_value = point_name_to_code.get(name, 'Unknown')
-                        if code_value != 'Unknown' or show_unknown:
-                            c_name = color_mapping.get(code_value, 'grey')
-                            fill_color = color_to_hex.get(c_name, color_to_hex.get('grey'))
-                            break
-                    # Skip polygon if code is unknown and show_unknown False
-                    if code_value == 'Unknown' and not show_unknown:
-                        continue
-                    single_feature_geojson = {"type": "FeatureCollection", "features": [feature]}
-                    tooltip_content = f"{city_name}: {len(point_names)} location{'s' if len(point_names)!=1 else ''}"
-                    code_info = f"{selected_code.upper()}: {code_value}"
-                    popup_content = html.Div([
-                        html.H5(f"{city_name}"),
-                        html.P(code_info),
-                        html.P(f"{len(point_names)} location{'s' if len(point_names)!=1 else ''}:"),
-                        html.Ul([html.Li(n) for n in point_names])
-                    ])
-                    polygon = dl.GeoJSON(
-                        data=single_feature_geojson,
-                        id=f'polygon-{polygon_id}',
-                        style={'weight': 2, 'opacity': 0.7, 'color': '#4A4A4A',
-                               'fillOpacity': 0.4, 'fillColor': fill_color},
-                        hoverStyle=dict(weight=3, color='#666', dashArray=''),
-                        children=[dl.Tooltip(tooltip_content), dl.Popup(popup_content)]
-                    )
-                    updated_polygon_layers.append(polygon)
-        return updated_polygon_layers
+    if SHOW_VORONOI_LAYER and ENCODE_VORONOI_COORDINATES and not USE_VECTOR_TILES:
+        app.clientside_callback(
+            ClientsideFunction(namespace='voronoi', function_name='decodePolygons'),
+            Output('voronoi-layer', 'data'),
+            Input('voronoi-encoded', 'data')
+        )
+
+    if POLYGON_LAYER_MODE == 'collection' and not USE_VECTOR_TILES:
+        # Polygon geometry is sent once in the layout; toggles only send new colors
+        @app.callback(
+            Output('polygon-colors', 'data'),
+            [Input('code-toggle', 'value'),
+             Input('show-unknown-toggle', 'value')]
+        )
+        def update_polygon_color_map(selected_code, show_unknown):
+            return create_polygon_color_map(selected_code, show_unknown)
+
+        # Hand the color map to the GeoJSON style and filter functions in the browser
+        app.clientside_callback(
+            ClientsideFunction(namespace='polygons', function_name='applyColors'),
+            Output('polygon-collection', 'hideout'),
+            Input('polygon-colors', 'data')
+        )
+
+        @app.callback(
+            [Output('polygon-collection', 'data'),
+             Output('polygon-level', 'data')],
+            Input('map', 'zoom'),
+            State('polygon-level', 'data')
+        )
+        def update_polygon_level(zoom, current_level):
+            # Geometry is only resent when the zoom crosses into another simplification level
+            level = get_dataset().polygon_level(zoom)
+            if level == current_level:
+                raise PreventUpdate
+            return create_polygon_collection_data(level), level
+    else:
+        @app.callback(
+            Output('polygon-layer', 'children'),
+            [Input('code-toggle', 'value'),
+             Input('show-unknown-toggle', 'value')]  # Removed combined-mode-toggle
+        )
+        def update_polygon_colors(selected_code, show_unknown):
+            if USE_VECTOR_TILES:
+                return [create_vector_tile_layer('places', selected_code, show_unknown)]
+            updated_polygon_layers = []
+            for feature, fill_color, point_names, code_value in style_polygons(selected_code, show_unknown):
+                polygon_id = feature['properties'].get('GEOID', None)
+                city_name = feature['properties'].get('NAME', 'Unknown Area')
+                single_feature_geojson = {"type": "FeatureCollection", "features": [feature]}
+                tooltip_content = f"{city_name}: {len(point_names)} location{'s' if len(point_names)!=1 else ''}"
+                popup_children = [html.H5(f"{city_name}")]
+                if code_value is not None:
+                    popup_children.append(html.P(f"{selected_code.upper()}: {code_value}"))
+                popup_children += [
+                    html.P(f"{len(point_names)} location{'s' if len(point_names)!=1 else ''}:"),
+                    html.Ul([html.Li(n) for n in point_names])
+                ]
+                polygon = dl.GeoJSON(
+                    data=single_feature_geojson,
+                    id=f'polygon-{polygon_id}',
+                    style={'weight': 2, 'opacity': 0.7, 'color': '#4A4A4A',
+                           'fillOpacity': 0.4, 'fillColor': fill_color},
+                    hoverStyle=dict(weight=3, color='#666', dashArray=''),
+                    children=[dl.Tooltip(tooltip_content), dl.Popup(html.Div(popup_children))]
+                )
+                updated_polygon_layers.append(polygon)
+            return updated_polygon_layers
 
     @app.callback(
         Output("legend-div", "children"),
@@ -298,25 +158,10 @@ def register_callbacks(app):
          Input("show-unknown-toggle", 'value')]  # Removed combined-mode-toggle
     )
     def update_legend(selected_code, show_unknown):
-        import os, json
-        from collections import Counter
-        base_path = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
-        point_geojson_path = os.path.join(base_path, "data", GEOJSON_FILENAME)
-        with open(point_geojson_path) as f:
-            points = json.load(f)
+        points = get_dataset().points
         # Define available colors and hex mapping
         available_colors = ['blue', 'gold', 'red', 'green', 'orange', 'yellow', 'violet', 'black']
-        color_to_hex = {
-            'blue': '#2A81CB',
-            'gold': '#FFD326',
-            'red': '#CB2B3E',
-            'green': '#2AAD27',
-            'orange': '#CB8427',
-            'yellow': '#CAC428',
-            'violet': '#9C2BCB',
-            'grey': '#7B7B7B',
-            'black': '#3D3D3D'
-        }
+        color_to_hex = COLOR_TO_HEX
         if selected_code == "combined":
             # Build combined keys frequency
             combined_keys = []
@@ -396,164 +241,314 @@ def register_callbacks(app):
             ]
         return legend_items
 
-def create_markers_for_code_type(code_type, show_unknown=True):
+def create_vector_tile_layer(layer, selected_code, show_unknown):
     """
-    Create markers for the selected code type (IRC or IECC)
+    Create a layer that draws one of the /tiles layers in the browser
+    
+    The tile URL is carried in the component id and picked up by the
+    addVectorTiles handler in assets/dashExtensions_default.js, which adds a
+    Leaflet.VectorGrid layer when this group is added to the map.
+    """
+    return dl.LayerGroup(
+        id={
+            'type': 'vector-tiles',
+            'layer': layer,
+            'query': f"code={selected_code}&unknown={int(bool(show_unknown))}"
+        },
+        eventHandlers={'add': Namespace('dashExtensions', 'default')('addVectorTiles')}
+    )
+
+def create_polygon_collection_layer(level=None):
+    """
+    Create a single GeoJSON layer holding every place polygon
+    
+    The geometry is sent with the layout and again only when the map zooms into
+    another simplification level (see Dataset.polygon_level). Fill colors and
+    visibility come from the color map in the layer's hideout (see
+    create_polygon_color_map). Tooltips are rendered in the browser from the
+    feature properties, popups are fetched from /details/place/<GEOID> when opened.
+    """
+    ns = Namespace('dashExtensions', 'default')
+    return dl.GeoJSON(
+        data=create_polygon_collection_data(level),
+        id='polygon-collection',
+        style=ns('placeStyle'),
+        filter=ns('placeFilter'),
+        onEachFeature=ns('placeOnEachFeature'),
+        hoverStyle=arrow_function(dict(weight=3, color='#666', dashArray='')),
+        hideout=create_polygon_color_map('irc', False)
+    )
+
+def create_polygon_collection_data(level=None):
+    """
+    FeatureCollection of the place polygons at a simplification level
     
     Parameters:
-    code_type (str): The type of code to display ('irc' or 'iecc')
-    show_unknown (bool): Whether to show pins with 'Unknown' codes
+    level (int): Min zoom of the level in Dataset.polygon_levels, full resolution if None
     
     Returns:
-    tuple: (markers_list, point_data)
-    where point_data is a list of tuples (position, color, code)
+    dict: FeatureCollection with only the properties the client needs
     """
-    # Load points geojson data
-    base_path = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
-    point_geojson_path = os.path.join(base_path, 'data', GEOJSON_FILENAME)
-    with open(point_geojson_path) as f:
-        points = json.load(f)
+    dataset = get_dataset()
+    join_index = dataset.join_index
+    polygons = dataset.polygon_levels.get(level, dataset.polygons)
+    features = []
+    for feature in polygons['features']:
+        if 'properties' in feature and 'geometry' in feature:
+            props = feature['properties']
+            records = join_index.get(props.get('GEOID', None), {}).get('records', [])
+            features.append({
+                'type': 'Feature',
+                'geometry': feature['geometry'],
+                # Only the properties the client needs, not every TIGER attribute
+                'properties': {
+                    'GEOID': props.get('GEOID', ''),
+                    'NAME': props.get('NAME', 'Unknown Area'),
+                    'locations': len(records)
+                }
+            })
+    return {'type': 'FeatureCollection', 'features': features}
+
+def create_polygon_color_map(selected_code, show_unknown):
+    """
+    Compact recolor update for the polygon collection layer
     
-    # NEW: Clean name fields from points
-    import re
-    for feature in points['features']:
-        if 'properties' in feature and 'name' in feature['properties']:
-            feature['properties']['name'] = re.sub(r'\[.*?\]|\?', '', feature['properties']['name']).strip()
+    Returns:
+    dict: {'code': selected_code, 'colors': {GEOID: fill_color}}, where places
+          missing from 'colors' are hidden
+    """
+    return {
+        'code': selected_code,
+        'colors': {
+            feature['properties'].get('GEOID', None): fill_color
+            for feature, fill_color, _, _ in style_polygons(selected_code, show_unknown)
+        }
+    }
+
+def voronoi_features_to_geojson(features):
+    """
+    Copy Voronoi features with their coordinates swapped from Leaflet [lat, lon]
+    to the GeoJSON [lon, lat] order that dl.GeoJSON expects
+    """
+    return [
+        {
+            'type': 'Feature',
+            'geometry': {
+                'type': 'Polygon',
+                'coordinates': [[[lon, lat] for lat, lon in ring] for ring in feature['geometry']['coordinates']]
+            },
+            'properties': feature['properties']
+        }
+        for feature in features
+    ]
+
+def create_voronoi_features(point_data, selected_code, show_unknown, bounds):
+    """
+    Create GeoJSON features for the Voronoi cells of the displayed points
     
-    # Create color mapping
-    all_codes = collect_all_codes(points)
-    color_mapping = create_color_mapping(all_codes)
+    Parameters:
+    point_data (list): List of (position, color, code) tuples from the marker functions
+    selected_code (str): The selected code type ('irc', 'iecc' or 'combined')
+    show_unknown (bool): Whether to include cells with 'Unknown' codes
+    bounds (list): Map bounds used to clip the cells
     
-    # Create markers list and point data
-    markers = []
-    point_data = []  # List of (position, color, code) tuples
+    Returns:
+    list: GeoJSON Polygon features with color, opacity and code properties
+    """
+    # points format is [[lat, lon], ...]
+    points = [pos for pos, _, _ in point_data]
+    colors = [color for _, color, _ in point_data]
+    opacities = [0.5 if code != 'Unknown' else 0.2 for _, _, code in point_data]
     
-    # Process each feature from the GeoJSON
-    for feature in points['features']:
-        if 'geometry' in feature and feature['geometry']['type'] == 'Point':
-            props = feature['properties']
-            
-            # Get the specific code based on type (IRC or IECC)
-            code_value = props.get(code_type.lower(), 'Unknown')
+    # Voronoi polygons clipped to the map bounds, memoized per point set and viewport
+    voronoi_polygons = voronoi_cache.get_polygons(points, selected_code, bounds)
+    
+    features = []
+    for (polygon_coords, point_index) in voronoi_polygons:
+        if point_index < len(colors):
+            color = colors[point_index]
+            opacity = opacities[point_index]
+            code = point_data[point_index][2]
             
-            # Convert numeric code to string for comparison
-            if isinstance(code_value, (int, float)):
-                code_value = str(code_value)
-                
-            # Skip unknown codes if show_unknown is False
-            if code_value == 'Unknown' and not show_unknown:
+            # Skip unknown codes if not showing them
+            if code == 'Unknown' and not show_unknown:
                 continue
-                
-            coordinates = feature['geometry']['coordinates']
             
-            # Extract original coordinates
-            orig_x, orig_y = coordinates[0], coordinates[1]
-            
-            # Apply the correct transformation: "Longitude sign fixed"
-            # Convert from GeoJSON [lon, lat] to Leaflet [lat, lon] and fix longitude sign
-            position = [orig_y, -abs(orig_x)]
-            
-            tooltip_text = props.get('name', 'Unnamed Point')
-            name = props.get('name', 'Unnamed Point')
-            
-            # Get color based on code value
-            marker_color = color_mapping.get(code_value, "grey")
-            
-            # Store point data for Voronoi calculation
-            point_data.append((position, marker_color, code_value))
-            
-            # Create icon
-            icon = {
-                'iconUrl': f'https://raw.githubusercontent.com/pointhi/leaflet-color-markers/master/img/marker-icon-2x-{marker_color}.png',
-                'shadowUrl': 'https://cdnjs.cloudflare.com/ajax/libs/leaflet/1.0.0/images/marker-shadow.png',
-                'iconSize': [25, 41],
-                'iconAnchor': [12, 41],
-                'popupAnchor': [1, -34],
-                'shadowSize': [41, 41]
+            # Create GeoJSON feature
+            feature = {
+                'type': 'Feature',
+                'geometry': {
+                    'type': 'Polygon',
+                    'coordinates': [polygon_coords]
+                },
+                'properties': {
+                    'color': color,
+                    'opacity': opacity,
+                    'code': code
+                }
             }
-            
-            # Create popup content
-            irc_code = props.get('irc', 'Unknown')
-            if isinstance(irc_code, (int, float)):
-                irc_code = str(irc_code)
-                
-            iecc_code = props.get('iecc', 'Unknown')
-            if isinstance(iecc_code, (int, float)):
-                iecc_code = str(iecc_code)
-                
-            popup_content = html.Div([
-                html.H4(name),
-                html.P(f"Government: {props.get('government', 'N/A')}"),
-                html.P(f"County: {props.get('county', 'N/A')}"),
-                html.P(f"IRC: {irc_code}"),
-                html.P(f"IECC: {iecc_code}"),
-                html.P([
-                    html.A("Website", href=props.get('website', '#'), target="_blank")
-                ])
-            ], id=f"popup-{name.lower().replace(' ', '-')}")
-            
-            # Create marker
-            marker = dl.Marker(
-                position=position,
-                icon=icon,
-                children=[
-                    dl.Tooltip(tooltip_text),
-                    dl.Popup(popup_content)
-                ]
-            )
-            markers.append(marker)
-    
-    return markers, point_data
+            features.append(feature)
+    return features
 
-def create_markers_for_combined_mode(show_unknown=True):
+def style_polygons(selected_code, show_unknown):
     """
-    Create markers using a combined key (IRC, IECC) and classify markers based on the combination.
-    Only the top classes (by frequency) limited to the number of available colors are rendered.
+    Work out which place polygons to display and their fill colors
+    
+    Parameters:
+    selected_code (str): The selected code type ('irc', 'iecc' or 'combined')
+    show_unknown (bool): Whether to include places without a known code
     
     Returns:
-         tuple: (markers_list, point_data)
-         where point_data is a list of tuples (position, color, combined_key)
+    list: (feature, fill_color, point_names, code_value) tuples, where code_value is
+          the selected single code or None in combined mode
+    """
+    dataset = get_dataset()
+    points = dataset.points
+    polygons = dataset.polygons
+    # Matched point names per polygon come from the precomputed join index
+    join_index = dataset.join_index
+    styled = []
+    if selected_code == "combined":
+        # Build global combined mapping from point name to combined key
+        combined_keys = []
+        point_name_to_combined = {}
+        for feature in points['features']:
+            if feature.get('geometry', {}).get('type') == 'Point' and 'properties' in feature:
+                props = feature['properties']
+                irc = props.get('irc', 'Unknown')
+                iecc = props.get('iecc', 'Unknown')
+                if isinstance(irc, (int, float)):
+                    irc = str(irc)
+                if isinstance(iecc, (int, float)):
+                    iecc = str(iecc)
+                # NEW: Only use ("Other", "Other") if both codes are Unknown
+                if irc == 'Unknown' and iecc == 'Unknown':
+                    key = ("Other", "Other")
+                else:
+                    key = (irc, iecc)
+                if key == ("Other", "Other") and not show_unknown:
+                    continue
+                combined_keys.append(key)
+                point_name = props.get('name', '')
+                point_name_to_combined[point_name] = key
+        # Determine top combined classes (limited to available colors)
+        available_colors = ['blue', 'gold', 'red', 'green', 'orange', 'yellow', 'violet', 'black']
+        counter = Counter(combined_keys)
+        top_classes = {k for k, _ in counter.most_common(len(available_colors))}
+        # ---- Modified sorting: order by IECC then IRC (both descending) ----
+        sorted_top = sorted(
+            top_classes,
+            key=lambda k: ((int(k[1]) if k[1].isdigit() else -1), (int(k[0]) if k[0].isdigit() else -1)),
+            reverse=True
+        )
+        class_color_mapping = {cls: available_colors[i] for i, cls in enumerate(sorted_top)}
+        # For each polygon, use the first matched point's combined key if available
+        for feature in polygons['features']:
+            if 'properties' in feature and 'geometry' in feature:
+                polygon_id = feature['properties'].get('GEOID', None)
+                records = join_index.get(polygon_id, {}).get('records', [])
+                point_names = [record['name'] for record in records]
+                # NEW: Skip polygon if no matching points and show_unknown is unchecked
+                if not show_unknown and len(point_names) == 0:
+                    continue
+                fill_color = COLOR_TO_HEX.get('grey')
+                for record in records:
+                    key = point_name_to_combined.get(record['name'])
+                    # NEW: If key not in mapping, reassign to ("Other", "Other")
+                    if key not in class_color_mapping:
+                        key = ("Other", "Other")
+                    if key and key in class_color_mapping:
+                        color_name = class_color_mapping.get(key) or "black"
+                        fill_color = COLOR_TO_HEX.get(color_name, COLOR_TO_HEX.get('grey'))
+                        break
+                styled.append((feature, fill_color, point_names, None))
+    else:
+        # Use single code logic (existing behavior)
+        color_mapping = dataset.color_mapping
+        for feature in polygons['features']:
+            if 'properties' in feature and 'geometry' in feature:
+                polygon_id = feature['properties'].get('GEOID', None)
+                records = join_index.get(polygon_id, {}).get('records', [])
+                point_names = [record['name'] for record in records]
+                # NEW: Skip polygon if no matching points and show_unknown is unchecked
+                if not show_unknown and len(point_names) == 0:
+                    continue
+                fill_color = COLOR_TO_HEX.get('grey')
+                code_value = 'Unknown'
+                # Use first matched point's single code from the selected type
+                # (Note: here selected_code determines which code is used)
+                for record in records:
+                    code_value = record.get(selected_code.lower(), 'Unknown')
+                    if code_value != 'Unknown' or show_unknown:
+                        c_name = color_mapping.get(code_value, 'grey')
+                        fill_color = COLOR_TO_HEX.get(c_name, COLOR_TO_HEX.get('grey'))
+                        break
+                # Skip polygon if code is unknown and show_unknown False
+                if code_value == 'Unknown' and not show_unknown:
+                    continue
+                styled.append((feature, fill_color, point_names, code_value))
+    return styled
+
+def classify_points(code_type, show_unknown=True):
     """
-    base_path = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
-    point_geojson_path = os.path.join(base_path, 'data', GEOJSON_FILENAME)
-    with open(point_geojson_path) as f:
-        points = json.load(f)
+    Assign a marker color and code label to every point shown for a code type
     
-    # NEW: Clean name fields from points
-    import re
-    for feature in points['features']:
-        if 'properties' in feature and 'name' in feature['properties']:
-            feature['properties']['name'] = re.sub(r'\[.*?\]|\?', '', feature['properties']['name']).strip()
+    In "combined" mode points are classified by their (IRC, IECC) pair. Only the
+    most frequent pairs, limited to the number of available colors, get their own
+    color; the remaining pairs are drawn in black.
     
-    markers = []
-    point_data = []
-    combined_keys = []
-    items = []  # Temporarily store (feature, combined_key)
+    Parameters:
+    code_type (str): The type of code to display ('irc', 'iecc' or 'combined')
+    show_unknown (bool): Whether to include points with 'Unknown' codes
+    
+    Returns:
+    list: (feature, position, color, code, irc_code, iecc_code) tuples, where feature
+          is the point from Dataset.marker_points, position is Leaflet [lat, lon] and
+          code is the label used for the Voronoi cells
+    """
+    # Points with cleaned names and the code color mapping come from the shared store
+    dataset = get_dataset()
+    points = dataset.marker_points
     
-    # First pass to gather all combined keys and frequency
+    items = []  # (feature, position, irc_code, iecc_code) of each point to show
     for feature in points['features']:
         if 'geometry' in feature and feature['geometry']['type'] == 'Point':
             props = feature['properties']
+            
+            # Convert numeric codes to strings for comparison
             irc_code = props.get('irc', 'Unknown')
             iecc_code = props.get('iecc', 'Unknown')
             if isinstance(irc_code, (int, float)):
                 irc_code = str(irc_code)
             if isinstance(iecc_code, (int, float)):
                 iecc_code = str(iecc_code)
-            # NEW: Use ("Other","Other") only if both codes are Unknown
-            if irc_code == 'Unknown' and iecc_code == 'Unknown':
-                key = ("Unknown", "Unknown")
+            
+            # Skip unknown codes if show_unknown is False
+            if code_type == 'combined':
+                unknown = irc_code == 'Unknown' and iecc_code == 'Unknown'
             else:
-                key = (irc_code, iecc_code)
-            # Skip if both are Unknown and show_unknown is False
-            if key == ("Unknown", "Unknown") and not show_unknown:
+                unknown = (irc_code if code_type.lower() == 'irc' else iecc_code) == 'Unknown'
+            if unknown and not show_unknown:
                 continue
-            combined_keys.append(key)
-            items.append((feature, key))
+            
+            # Apply the correct transformation: "Longitude sign fixed"
+            # Convert from GeoJSON [lon, lat] to Leaflet [lat, lon] and fix longitude sign
+            orig_x, orig_y = feature['geometry']['coordinates'][:2]
+            position = [orig_y, -abs(orig_x)]
+            items.append((feature, position, irc_code, iecc_code))
+    
+    if code_type != 'combined':
+        color_mapping = dataset.color_mapping
+        classified = []
+        for feature, position, irc_code, iecc_code in items:
+            code_value = irc_code if code_type.lower() == 'irc' else iecc_code
+            classified.append((feature, position, color_mapping.get(code_value, "grey"),
+                               code_value, irc_code, iecc_code))
+        return classified
     
     # Count frequency and select top classes (limited to available colors)
     available_colors = ['blue', 'gold', 'red', 'green', 'orange', 'yellow', 'violet', 'black']
-    counter = Counter(combined_keys)
+    counter = Counter((irc_code, iecc_code) for _, _, irc_code, iecc_code in items)
     top_classes = {k for k, _ in counter.most_common(len(available_colors))}
     # ---- Modified sorting: order by IECC then IRC (both descending) ----
     sorted_top = sorted(
@@ -563,90 +558,104 @@ def create_markers_for_combined_mode(show_unknown=True):
     )
     class_color_mapping = {cls: available_colors[i] for i, cls in enumerate(sorted_top)}
     
-    # Second pass: for features not in top classes, reassign key to ("Other", "Other")
-    for feature, combined_key in items:
-        if combined_key not in class_color_mapping:
-            combined_key = ("Other", "Other")
-        props = feature['properties']
-        # Get both codes for popup display
-        irc_code = props.get('irc', 'Unknown')
-        iecc_code = props.get('iecc', 'Unknown')
-        if isinstance(irc_code, (int, float)):
-            irc_code = str(irc_code)
-        if isinstance(iecc_code, (int, float)):
-            iecc_code = str(iecc_code)
-        coordinates = feature['geometry']['coordinates']
-        orig_x, orig_y = coordinates[0], coordinates[1]
-        position = [orig_y, -abs(orig_x)]
-        tooltip_text = props.get('name', 'Unnamed Point')
-        name = props.get('name', 'Unnamed Point')
-        # Use fallback "black" if no color is returned
-        marker_color = class_color_mapping.get(combined_key) or "black"
-        point_data.append((position, marker_color, f"{irc_code}-{iecc_code}"))
-        icon = {
-            'iconUrl': f'https://raw.githubusercontent.com/pointhi/leaflet-color-markers/master/img/marker-icon-2x-{marker_color}.png',
-            'shadowUrl': 'https://cdnjs.cloudflare.com/ajax/libs/leaflet/1.0.0/images/marker-shadow.png',
-            'iconSize': [25, 41],
-            'iconAnchor': [12, 41],
-            'popupAnchor': [1, -34],
-            'shadowSize': [41, 41]
-        }
-        popup_content = html.Div([
-            html.H4(name),
-            html.P(f"Government: {props.get('government', 'N/A')}"),
-            html.P(f"County: {props.get('county', 'N/A')}"),
-            html.P(f"IRC: {irc_code}"),
-            html.P(f"IECC: {iecc_code}"),
-            html.P([html.A("Website", href=props.get('website', '#'), target="_blank")])
-        ], id=f"popup-{name.lower().replace(' ', '-')}" )
-        marker = dl.Marker(
-            position=position,
-            icon=icon,
-            children=[
-                dl.Tooltip(tooltip_text),
-                dl.Popup(popup_content)
-            ]
-        )
-        markers.append(marker)
-    
-    return markers, point_data
+    # Use fallback "black" for pairs outside the top classes
+    return [
+        (feature, position, class_color_mapping.get((irc_code, iecc_code)) or "black",
+         f"{irc_code}-{iecc_code}", irc_code, iecc_code)
+        for feature, position, irc_code, iecc_code in items
+    ]
 
-def collect_all_codes(points):
-    """Collect all unique codes from the GeoJSON data"""
-    all_codes = set()
-    
-    for feature in points['features']:
-        props = feature.get('properties', {})
-        irc_code = props.get('irc')
-        iecc_code = props.get('iecc')
-        
-        # Handle IRC codes
-        if isinstance(irc_code, (int, float)) and str(irc_code) != "Unknown":
-            all_codes.add(str(irc_code))
-        elif isinstance(irc_code, str) and irc_code != "Unknown":
-            all_codes.add(irc_code)
-            
-        # Handle IECC codes
-        if isinstance(iecc_code, (int, float)) and str(iecc_code) != "Unknown":
-            all_codes.add(str(iecc_code))
-        elif isinstance(iecc_code, str) and iecc_code != "Unknown":
-            all_codes.add(iecc_code)
+def create_marker(props, position, marker_color, irc_code, iecc_code):
+    """
+    Create a dl.Marker with a colored pin icon, tooltip and popup for one point
+    """
+    name = props.get('name', 'Unnamed Point')
+    icon = {
+        'iconUrl': f'https://raw.githubusercontent.com/pointhi/leaflet-color-markers/master/img/marker-icon-2x-{marker_color}.png',
+        'shadowUrl': 'https://cdnjs.cloudflare.com/ajax/libs/leaflet/1.0.0/images/marker-shadow.png',
+        'iconSize': [25, 41],
+        'iconAnchor': [12, 41],
+        'popupAnchor': [1, -34],
+        'shadowSize': [41, 41]
+    }
+    popup_content = html.Div([
+        html.H4(name),
+        html.P(f"Government: {props.get('government', 'N/A')}"),
+        html.P(f"County: {props.get('county', 'N/A')}"),
+        html.P(f"IRC: {irc_code}"),
+        html.P(f"IECC: {iecc_code}"),
+        html.P([
+            html.A("Website", href=props.get('website', '#'), target="_blank")
+        ])
+    ], id=f"popup-{name.lower().replace(' ', '-')}")
+    return dl.Marker(
+        position=position,
+        icon=icon,
+        children=[
+            dl.Tooltip(name),
+            dl.Popup(popup_content)
+        ]
+    )
+
+def create_markers_for_code_type(code_type, show_unknown=True):
+    """
+    Create markers for the selected code type (IRC or IECC)
     
-    # Add "Unknown" as a special case
-    all_codes.add("Unknown")
+    Parameters:
+    code_type (str): The type of code to display ('irc' or 'iecc')
+    show_unknown (bool): Whether to show pins with 'Unknown' codes
     
-    return all_codes
+    Returns:
+    tuple: (markers_list, point_data)
+    where point_data is a list of tuples (position, color, code)
+    """
+    markers = []
+    point_data = []  # List of (position, color, code) tuples
+    for feature, position, color, code, irc_code, iecc_code in classify_points(code_type, show_unknown):
+        point_data.append((position, color, code))
+        markers.append(create_marker(feature['properties'], position, color, irc_code, iecc_code))
+    return markers, point_data
 
-def create_color_mapping(all_codes):
-    """Create a mapping of codes to colors"""
-    available_colors = ['blue', 'gold', 'red', 'green', 'orange', 'yellow', 'violet', 'black'][::-1]
-    
-    color_mapping = {}
-    for i, code in enumerate(sorted(all_codes)):
-        color_index = i % len(available_colors)
-        color_mapping[code] = available_colors[color_index]
+def create_markers_for_combined_mode(show_unknown=True):
+    """
+    Create markers using a combined key (IRC, IECC) and classify markers based on the combination.
+    Only the top classes (by frequency) limited to the number of available colors are rendered.
     
-    # Make sure "Unknown" is always grey
-    color_mapping["Unknown"] = "grey"
+    Returns:
+         tuple: (markers_list, point_data)
+         where point_data is a list of tuples (position, color, combined_key)
+    """
+    return create_markers_for_code_type('combined', show_unknown)
+
+def create_point_layer(classified_points):
+    """
+    Create a single GeoJSON layer for the points returned by classify_points
     
-    return color_mapping
\ No newline at end of file
+    Points are clustered per zoom level by dash-leaflet's bundled supercluster and
+    drawn as canvas circle markers, so the browser keeps one layer instead of a
+    Marker, Tooltip and Popup component per municipality. Features only carry the
+    tooltip name and color; popups are fetched from /details/point/<id> when opened.
+    """
+    features = [
+        {
+            'type': 'Feature',
+            'geometry': {'type': 'Point', 'coordinates': [position[1], position[0]]},
+            'properties': {
+                'id': feature['id'],
+                'name': feature['properties'].get('name', 'Unnamed Point'),
+                'color': COLOR_TO_HEX.get(color, COLOR_TO_HEX['black'])
+            }
+        }
+        for feature, position, color, _, _, _ in classified_points
+    ]
+    ns = Namespace('dashExtensions', 'default')
+    return dl.GeoJSON(
+        data={'type': 'FeatureCollection', 'features': features},
+        id='point-layer',
+        cluster=MARKER_CLUSTER,
+        zoomToBoundsOnClick=True,
+        superClusterOptions={'radius': MARKER_CLUSTER_RADIUS, 'maxZoom': MARKER_CLUSTER_MAX_ZOOM},
+        pointToLayer=ns('pointToCircle'),
+        clusterToLayer=ns('clusterToCircle'),
+        onEachFeature=ns('pointOnEachFeature')
+    )
@@ -1 +1,67 @@
 GEOJSON_FILENAME = "cleaned_gracy_3-9.geojson"
+PLACE_GEOJSON_PATH = "data/tl_2024_08_place/tl_2024_08_place.geojson"
+JOIN_INDEX_FILENAME = "place_join_index.json"
+
+# Voronoi cache: viewport bounds are snapped to this grid (degrees) before keying,
+# and each cache level evicts least recently used entries past this many vertices
+VORONOI_BOUNDS_QUANTUM = 0.25
+VORONOI_CACHE_MAX_VERTICES = 500_000
+
+# Voronoi cells are clipped to this outline ("boundary" mode) or only to the map
+# bounds ("bounds" mode); boundary mode falls back to bounds if the file is missing.
+# The outline is indexed in square tiles of BOUNDARY_TILE_SIZE degrees.
+VORONOI_CLIP_MODE = "boundary"
+BOUNDARY_GEOJSON_PATH = "data/counties_updated.json"
+BOUNDARY_TILE_SIZE = 0.5
+
+# Hex values of the leaflet-color-markers palette
+COLOR_TO_HEX = {
+    'blue': '#2A81CB',
+    'gold': '#FFD326',
+    'red': '#CB2B3E',
+    'green': '#2AAD27',
+    'orange': '#CB8427',
+    'yellow': '#CAC428',
+    'violet': '#9C2BCB',
+    'grey': '#7B7B7B',
+    'black': '#3D3D3D'
+}
+
+# Vector tiles: when enabled the map draws place polygons and Voronoi cells from
+# /tiles/<layer>/<z>/<x>/<y>.pbf instead of embedding GeoJSON in the layout.
+# Encoded tiles are cached on disk under TILE_CACHE_DIR.
+USE_VECTOR_TILES = False
+TILE_CACHE_DIR = "data/tile_cache"
+TILE_EXTENT = 4096
+TILE_BUFFER = 64
+TILE_SIMPLIFY_PIXELS = 1.0
+TILE_MAX_ZOOM = 16
+VECTOR_GRID_SCRIPT = "https://unpkg.com/leaflet.vectorgrid@1.3.0/dist/Leaflet.VectorGrid.bundled.js"
+
+# How place polygons are sent when vector tiles are off: "collection" sends one
+# FeatureCollection styled in the browser, "components" one dl.GeoJSON per place
+POLYGON_LAYER_MODE = "collection"
+
+# How municipality pins are sent: "geojson" sends one GeoJSON point layer drawn
+# as canvas circle markers, "markers" one dl.Marker per municipality. GeoJSON
+# points are clustered in the browser below MARKER_CLUSTER_MAX_ZOOM.
+MARKER_LAYER_MODE = "geojson"
+MARKER_CLUSTER = True
+MARKER_CLUSTER_RADIUS = 40
+MARKER_CLUSTER_MAX_ZOOM = 10
+
+# Simplified place geometry: (min zoom, Douglas-Peucker tolerance in degrees)
+# levels built offline with `python -m building_code_map.simplify`. The
+# collection layer shows the level for the current zoom and the full TIGER
+# geometry from PLACE_FULL_RESOLUTION_ZOOM on; tolerances are about a pixel.
+PLACE_SIMPLIFY_LEVELS = [(0, 0.002), (8, 0.0005), (10, 0.00015)]
+PLACE_FULL_RESOLUTION_ZOOM = 12
+
+# Draw the Voronoi cells of the visible pins under the markers (off: pins only)
+SHOW_VORONOI_LAYER = False
+
+# Opt-in compact transport for Voronoi cells: coordinates are rounded to
+# COORDINATE_PRECISION decimal places, delta-encoded and sent as base64 zigzag
+# varints that assets/clientside.js decodes (see coordinate_codec)
+ENCODE_VORONOI_COORDINATES = False
+COORDINATE_PRECISION = 5
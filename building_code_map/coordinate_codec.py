@@ -0,0 +1,114 @@
+import base64
+from itertools import chain
+
+import numpy as np
+
+# A zigzag varint of a 32-bit value takes at most five bytes
+_MAX_VARINT_BYTES = 5
+
+
+def _zigzag_varints(values):
+    """
+    Pack signed integers as zigzag LEB128 varints: 0, -1, 1, -2 ... become
+    0, 1, 2, 3 ... and each byte carries 7 bits plus a continuation flag
+
+    Returns:
+    bytes: The packed values
+    """
+    if len(values) and np.abs(values).max() >= 2 ** 31:
+        raise ValueError("Quantized coordinate deltas do not fit 32 bits")
+    unsigned = ((values << 1) ^ (values >> 63)).astype(np.uint64)
+    sizes = np.ones(len(unsigned), dtype=np.int64)
+    for k in range(1, _MAX_VARINT_BYTES):
+        sizes += unsigned >= (1 << (7 * k))
+    starts = np.cumsum(sizes) - sizes
+    packed = np.zeros(int(sizes.sum()), dtype=np.uint8)
+    for k in range(_MAX_VARINT_BYTES):
+        mask = sizes > k
+        chunk = (unsigned[mask] >> np.uint64(7 * k)) & np.uint64(0x7F)
+        more = (sizes[mask] > k + 1).astype(np.uint64) << np.uint64(7)
+        packed[starts[mask] + k] = (chunk | more).astype(np.uint8)
+    return packed.tobytes()
+
+
+def _read_zigzag_varints(data):
+    """Unpack the output of _zigzag_varints"""
+    values = []
+    result, shift = 0, 0
+    for byte in data:
+        result |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        values.append((result >> 1) ^ -(result & 1))
+        result, shift = 0, 0
+    return np.array(values, dtype=np.int64)
+
+
+def encode_polygons(features, precision, swap_axes=False):
+    """
+    Encode Polygon features as quantized, delta-encoded coordinates
+
+    Every coordinate is rounded to `precision` decimal places and stored as the
+    integer difference from the same axis of the previous vertex, so
+    neighbouring vertices become small numbers. The differences are packed as
+    zigzag varints (one to three bytes for most vertices) in one base64
+    string, and properties are sent as columns so their keys appear once.
+    decodePolygons in assets/clientside.js reverses this.
+
+    Parameters:
+    features (list): GeoJSON features with Polygon geometries
+    precision (int): Decimal places kept (5 is about a meter)
+    swap_axes (bool): Emit [y, x] pairs, e.g. to turn Leaflet [lat, lon] into GeoJSON order
+
+    Returns:
+    dict: {'precision', 'rings' (ring count per feature), 'lengths' (points per
+          ring), 'coords' (base64 varint deltas), 'properties' (key -> values
+          per feature)}
+    """
+    rings = [feature['geometry']['coordinates'] for feature in features]
+    ring_lists = list(chain.from_iterable(rings))
+    coords = np.fromiter(chain.from_iterable(chain.from_iterable(ring_lists)), dtype=np.float64).reshape(-1, 2)
+    if swap_axes:
+        coords = coords[:, ::-1]
+
+    quantized = np.rint(coords * 10 ** precision).astype(np.int64)
+    # Per-axis differences, interleaved as dx0, dy0, dx1, dy1, ...
+    deltas = np.diff(quantized, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).reshape(-1)
+
+    properties = [feature.get('properties', {}) for feature in features]
+    keys = list(dict.fromkeys(chain.from_iterable(properties)))
+    return {
+        'precision': precision,
+        'rings': [len(polygon) for polygon in rings],
+        'lengths': [len(ring) for ring in ring_lists],
+        'coords': base64.b64encode(_zigzag_varints(deltas)).decode('ascii'),
+        'properties': {key: [props.get(key) for props in properties] for key in keys},
+    }
+
+
+def decode_polygons(encoded):
+    """
+    Rebuild the features from encode_polygons output (the Python twin of the JS decoder)
+
+    Returns:
+    dict: GeoJSON FeatureCollection with coordinates rounded to the precision
+    """
+    deltas = _read_zigzag_varints(base64.b64decode(encoded['coords']))
+    coords = (np.cumsum(deltas.reshape(-1, 2), axis=0) / 10 ** encoded['precision']).tolist()
+    columns = encoded['properties']
+
+    features = []
+    point, ring = 0, 0
+    for index, ring_count in enumerate(encoded['rings']):
+        polygon = []
+        for length in encoded['lengths'][ring:ring + ring_count]:
+            polygon.append(coords[point:point + length])
+            point += length
+        ring += ring_count
+        features.append({
+            'type': 'Feature',
+            'geometry': {'type': 'Polygon', 'coordinates': polygon},
+            'properties': {key: values[index] for key, values in columns.items()},
+        })
+    return {'type': 'FeatureCollection', 'features': features}
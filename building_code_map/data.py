@@ -0,0 +1,137 @@
+import copy
+import hashlib
+import logging
+import os
+import re
+import threading
+
+import numpy as np
+from shapely.geometry import shape
+
+from .config import GEOJSON_FILENAME, PLACE_FULL_RESOLUTION_ZOOM, PLACE_GEOJSON_PATH, JOIN_INDEX_FILENAME
+from .geostore import load_geojson, source_path, store_geometries
+from .join_index import get_join_index
+from .simplify import level_sources, load_levels
+from .utils import collect_all_codes, create_color_mapping
+
+logger = logging.getLogger(__name__)
+
+BASE_PATH = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+
+class Dataset:
+    """
+    Parsed point and place data plus everything derived from it.
+
+    A Dataset is never modified after it is built, so callbacks can keep using
+    one while the store swaps in a newer one.
+    """
+
+    def __init__(self, points, polygons, join_index, version=None, polygon_levels=None,
+                 polygon_geometries=None):
+        # Identifies the source file versions, used to key derived caches
+        self.version = version
+        self.points = points
+        self.polygons = polygons
+        # min zoom -> simplified copy of polygons, see simplify.build_levels
+        self.polygon_levels = dict(polygon_levels or {})
+        self.polygon_levels[PLACE_FULL_RESOLUTION_ZOOM] = polygons
+        # GEOID -> matched municipality records, see join_index.build_join_index
+        self.join_index = join_index
+        # Shapely geometry per place feature, read from the binary store when there is one
+        self._polygon_geometries = polygon_geometries
+
+        # Copy of the points with cleaned names for marker display, each feature's id
+        # is its position so popups can be looked up with details.point_details
+        self.marker_points = copy.deepcopy(points)
+        for index, feature in enumerate(self.marker_points['features']):
+            feature['id'] = index
+            if 'properties' in feature and 'name' in feature['properties']:
+                feature['properties']['name'] = re.sub(r'\[.*?\]|\?', '', feature['properties']['name']).strip()
+
+        self.all_codes = collect_all_codes(points)
+        self.color_mapping = create_color_mapping(self.all_codes)
+
+    def polygon_geometries(self):
+        """
+        Shapely geometry of every place feature, in feature order
+
+        Returns:
+        np.ndarray: Geometries, None for features without one
+        """
+        if self._polygon_geometries is None:
+            self._polygon_geometries = np.array(
+                [shape(feature['geometry']) if feature.get('geometry') else None
+                 for feature in self.polygons['features']], dtype=object)
+        return self._polygon_geometries
+
+    def polygon_level(self, zoom):
+        """The min zoom of the place geometry level to draw at a map zoom"""
+        eligible = [min_zoom for min_zoom in self.polygon_levels if min_zoom <= (zoom or 0)]
+        return max(eligible) if eligible else min(self.polygon_levels)
+
+
+class DatasetStore:
+    """
+    Process-wide cache of the GeoJSON files used by the app.
+
+    Files are parsed once and re-parsed only when one of their mtimes changes.
+    A binary geometry store next to a GeoJSON file is read instead when present.
+    """
+
+    def __init__(self, base_path=BASE_PATH):
+        self.point_path = os.path.join(base_path, 'data', GEOJSON_FILENAME)
+        self.polygon_path = os.path.join(base_path, PLACE_GEOJSON_PATH)
+        self.join_index_path = os.path.join(base_path, 'data', JOIN_INDEX_FILENAME)
+        self._lock = threading.Lock()
+        self._mtimes = None
+        self._dataset = None
+
+    def _sources(self):
+        """The files that will be read, binary stores are preferred over GeoJSON"""
+        return source_path(self.point_path), source_path(self.polygon_path)
+
+    def _current_mtimes(self):
+        watched = list(self._sources()) + level_sources(self.polygon_path)
+        return tuple(os.path.getmtime(path) for path in watched)
+
+    def get(self):
+        """Return the current Dataset, reloading it if a source file changed"""
+        mtimes = self._current_mtimes()
+        if self._dataset is not None and mtimes == self._mtimes:
+            return self._dataset
+
+        with self._lock:
+            # Another thread may have reloaded while we waited for the lock
+            mtimes = self._current_mtimes()
+            if self._dataset is None or mtimes != self._mtimes:
+                logger.info("Loading datasets from %s and %s", self.point_path, self.polygon_path)
+                point_source, polygon_source = self._sources()
+                points = load_geojson(self.point_path)
+                polygons = load_geojson(self.polygon_path)
+                join_index = get_join_index(points, polygons, self.join_index_path,
+                                            point_source, polygon_source)
+                version = hashlib.md5(repr(mtimes).encode()).hexdigest()[:12]
+                self._dataset = Dataset(points, polygons, join_index, version,
+                                        load_levels(self.polygon_path), store_geometries(self.polygon_path))
+                self._mtimes = mtimes
+            return self._dataset
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """Return the shared DatasetStore, creating it on first use"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = DatasetStore()
+    return _store
+
+
+def get_dataset():
+    """Shortcut for get_store().get()"""
+    return get_store().get()
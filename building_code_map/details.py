@@ -0,0 +1,60 @@
+import logging
+
+from flask import abort, jsonify
+
+from .data import get_dataset
+from .join_index import make_record
+
+logger = logging.getLogger(__name__)
+
+
+def point_details(point_id):
+    """
+    Popup fields for one municipality point
+
+    Parameters:
+    point_id (int): The point's feature id in Dataset.marker_points
+
+    Returns:
+    dict: The point record (see join_index.make_record), or None if there is no such point
+    """
+    features = get_dataset().marker_points['features']
+    if not 0 <= point_id < len(features) or 'properties' not in features[point_id]:
+        return None
+    return make_record(features[point_id]['properties'])
+
+
+def place_details(geoid):
+    """
+    Popup fields for one place polygon
+
+    Returns:
+    dict: {'GEOID', 'NAME', 'records'} with the matched point records, or None
+          if the GEOID is unknown
+    """
+    entry = get_dataset().join_index.get(geoid)
+    if entry is None:
+        return None
+    return {'GEOID': geoid, 'NAME': entry['name'], 'records': entry['records']}
+
+
+def register_detail_routes(server):
+    """
+    Add the /details/point/<id> and /details/place/<GEOID> popup routes to a Flask server
+
+    The map layers only carry what their tooltips need; popups request the rest
+    from these routes when they are opened.
+    """
+    @server.route('/details/point/<int:point_id>')
+    def point_detail(point_id):
+        details = point_details(point_id)
+        if details is None:
+            abort(404)
+        return jsonify(details)
+
+    @server.route('/details/place/<geoid>')
+    def place_detail(geoid):
+        details = place_details(geoid)
+        if details is None:
+            abort(404)
+        return jsonify(details)
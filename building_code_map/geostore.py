@@ -0,0 +1,252 @@
+import json
+import logging
+import os
+
+import numpy as np
+import shapely
+from shapely.geometry import shape
+
+logger = logging.getLogger(__name__)
+
+# Bump when the on-disk layout changes; stores with another version are ignored
+STORE_VERSION = 2
+STORE_SUFFIX = ".geostore"
+MANIFEST = "manifest.json"
+# Holds only STORE_VERSION, so the check on every dataset refresh stays cheap
+VERSION_FILE = "VERSION"
+
+
+def store_path_for(geojson_path):
+    """The binary store that sits next to a GeoJSON file (data/x.geojson -> data/x.geostore)"""
+    return os.path.splitext(geojson_path)[0] + STORE_SUFFIX
+
+
+def write_store(features, path):
+    """
+    Write GeoJSON features to a columnar binary store
+
+    The store is a directory holding the coordinates and ring/part offsets as
+    .npy arrays (the layout of shapely.to_ragged_array) and the properties in
+    manifest.json. Polygons and MultiPolygons are stored together as
+    MultiPolygons with a flag to restore the original type. The VERSION file
+    is written last, so a store without one is incomplete and ignored.
+
+    Parameters:
+    features (iterable): GeoJSON features, consumed once
+    path (str): The store directory
+
+    Returns:
+    int: The number of features written
+    """
+    geometries = []
+    geometry_types = []
+    properties = []
+    for feature in features:
+        geometry = feature.get('geometry')
+        geometries.append(shape(geometry) if geometry else None)
+        geometry_types.append(geometry['type'] if geometry else None)
+        properties.append(feature.get('properties', {}))
+
+    # Empty geometries are kept out of the arrays (shapely.from_ragged_array cannot
+    # rebuild them) and restored from their type on read
+    present = np.array([geometry is not None and not geometry.is_empty for geometry in geometries], dtype=bool)
+    geometry_array = np.array([geometry for geometry, kept in zip(geometries, present) if kept], dtype=object)
+    if len(geometry_array):
+        kind, coords, offsets = shapely.to_ragged_array(geometry_array, include_z=False)
+        kind = kind.name
+    else:
+        kind, coords, offsets = None, np.empty((0, 2)), ()
+
+    os.makedirs(path, exist_ok=True)
+    manifest_path = os.path.join(path, MANIFEST)
+    version_path = os.path.join(path, VERSION_FILE)
+    for stale_path in (version_path, manifest_path):
+        if os.path.exists(stale_path):
+            os.remove(stale_path)
+    np.save(os.path.join(path, "coords.npy"), np.ascontiguousarray(coords, dtype=np.float64))
+    for level, level_offsets in enumerate(offsets):
+        np.save(os.path.join(path, f"offsets_{level}.npy"), np.asarray(level_offsets, dtype=np.int64))
+
+    manifest = {
+        'version': STORE_VERSION,
+        'kind': kind,
+        'offset_levels': len(offsets),
+        'present': present.tolist(),
+        'types': geometry_types,
+        'properties': properties,
+    }
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, separators=(',', ':'), default=str)
+    os.replace(tmp_path, manifest_path)
+    with open(version_path, "w") as f:
+        f.write(str(STORE_VERSION))
+    return len(properties)
+
+
+def store_is_valid(path):
+    """Whether a complete store of the current version exists at path"""
+    try:
+        with open(os.path.join(path, VERSION_FILE)) as f:
+            return f.read().strip() == str(STORE_VERSION)
+    except OSError:
+        return False
+
+
+def read_arrays(path):
+    """
+    Memory-map the coordinate and offset arrays of a store
+
+    Returns:
+    tuple: (manifest, coords, offsets); coords and offsets are read-only memory maps
+    """
+    with open(os.path.join(path, MANIFEST)) as f:
+        manifest = json.load(f)
+    coords = np.load(os.path.join(path, "coords.npy"), mmap_mode='r')
+    offsets = [np.load(os.path.join(path, f"offsets_{level}.npy"), mmap_mode='r')
+               for level in range(manifest['offset_levels'])]
+    return manifest, coords, offsets
+
+
+def _geometries_to_geojson(kind, coords, offsets, geometry_types):
+    """
+    Rebuild GeoJSON geometry dicts from ragged arrays
+
+    This copies every coordinate into Python lists, use read_geometries for
+    shapely geometries built straight from the memory-mapped arrays.
+    """
+    # One conversion of the whole coordinate block, then cheap list slicing
+    points = coords.tolist()
+    if kind == 'POINT':
+        return [{'type': 'Point', 'coordinates': point} for point in points]
+
+    if kind in ('POLYGON', 'MULTIPOLYGON'):
+        ring_offsets = offsets[0].tolist()
+        rings = [points[ring_offsets[i]:ring_offsets[i + 1]] for i in range(len(ring_offsets) - 1)]
+        polygon_offsets = offsets[1].tolist()
+        polygons = [rings[polygon_offsets[i]:polygon_offsets[i + 1]] for i in range(len(polygon_offsets) - 1)]
+        if kind == 'POLYGON':
+            return [{'type': 'Polygon', 'coordinates': polygon} for polygon in polygons]
+        multi_offsets = offsets[2].tolist()
+        geometries = []
+        for i, geometry_type in enumerate(geometry_types):
+            parts = polygons[multi_offsets[i]:multi_offsets[i + 1]]
+            if geometry_type == 'Polygon':
+                geometries.append({'type': 'Polygon', 'coordinates': parts[0]})
+            else:
+                geometries.append({'type': 'MultiPolygon', 'coordinates': parts})
+        return geometries
+
+    raise ValueError(f"Unsupported geometry kind {kind} in store")
+
+
+def read_store(path):
+    """
+    Load a store as a GeoJSON FeatureCollection dict, the format the app sends
+    to the browser
+
+    The coordinates are read from the memory maps and copied into lists once,
+    which is faster than parsing GeoJSON text but not zero-copy. Geometry work
+    should use read_geometries instead.
+
+    Returns:
+    dict: FeatureCollection with the original geometry types and properties
+    """
+    manifest, coords, offsets = read_arrays(path)
+    present = manifest['present']
+    geometry_types = [t for t, p in zip(manifest['types'], present) if p]
+    geometries = iter(_geometries_to_geojson(manifest['kind'], coords, offsets, geometry_types)
+                      if manifest['kind'] else [])
+
+    features = []
+    for has_geometry, geometry_type, properties in zip(present, manifest['types'], manifest['properties']):
+        if has_geometry:
+            geometry = next(geometries)
+        else:
+            geometry = {'type': geometry_type, 'coordinates': []} if geometry_type else None
+        features.append({'type': 'Feature', 'geometry': geometry, 'properties': properties})
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+def read_geometries(path):
+    """
+    Load the geometries of a store as shapely objects without GeoJSON dicts
+
+    The memory-mapped arrays are handed to shapely.from_ragged_array, so the
+    coordinates go straight into GEOS and never become Python lists.
+
+    Returns:
+    np.ndarray: One geometry per feature in store order, None where a feature
+                had no geometry and an empty geometry where it had an empty one
+    """
+    manifest, coords, offsets = read_arrays(path)
+    present = np.array(manifest['present'], dtype=bool)
+    types = np.array(manifest['types'], dtype=object)
+    geometries = np.full(len(present), None, dtype=object)
+    if manifest['kind']:
+        geometries[present] = shapely.from_ragged_array(
+            shapely.GeometryType[manifest['kind']], coords, tuple(offsets))
+    if manifest['kind'] == 'MULTIPOLYGON':
+        # Polygons were stored as one-part MultiPolygons
+        polygons = present & (types == 'Polygon')
+        geometries[polygons] = shapely.get_geometry(geometries[polygons], 0)
+    for index, (kept, geometry_type) in enumerate(zip(present, types)):
+        if not kept and geometry_type is not None:
+            geometries[index] = shape({'type': geometry_type, 'coordinates': []})
+    return geometries
+
+
+def _usable_store(geojson_path):
+    """The store next to a GeoJSON file if it is valid and not older than the file, else None"""
+    store_path = store_path_for(geojson_path)
+    if not store_is_valid(store_path):
+        return None
+    if os.path.exists(geojson_path) and \
+            os.path.getmtime(os.path.join(store_path, MANIFEST)) < os.path.getmtime(geojson_path):
+        logger.warning(f"Ignoring {store_path}, it is older than {geojson_path}")
+        return None
+    return store_path
+
+
+def load_geojson(geojson_path):
+    """
+    Load a GeoJSON file, from its binary store when a current one exists next to it
+
+    Returns:
+    dict: GeoJSON FeatureCollection
+    """
+    store_path = _usable_store(geojson_path)
+    if store_path:
+        return read_store(store_path)
+    with open(geojson_path) as f:
+        return json.load(f)
+
+
+def store_geometries(geojson_path):
+    """
+    Geometries of the current store next to a GeoJSON file (see read_geometries)
+
+    Returns:
+    np.ndarray or None: None when there is no usable store, callers then build
+                        the geometries from the parsed GeoJSON
+    """
+    store_path = _usable_store(geojson_path)
+    return read_geometries(store_path) if store_path else None
+
+
+def source_path(geojson_path):
+    """The file load_geojson would read, used to watch for changes"""
+    store_path = _usable_store(geojson_path)
+    return os.path.join(store_path, MANIFEST) if store_path else geojson_path
+
+
+if __name__ == "__main__":
+    # Build stores for existing files: python -m building_code_map.geostore data/x.geojson ...
+    import sys
+
+    logging.basicConfig(level=logging.INFO)
+    for geojson_path in sys.argv[1:]:
+        with open(geojson_path) as f:
+            collection = json.load(f)
+        count = write_store(collection['features'], store_path_for(geojson_path))
+        logger.info(f"Wrote {count} features to {store_path_for(geojson_path)}")
@@ -0,0 +1,154 @@
+import json
+import logging
+import os
+
+from .place_resolver import PlaceResolver
+from .utils import normalize_name
+
+logger = logging.getLogger(__name__)
+
+# Point properties copied into each matched record
+RECORD_FIELDS = ['name', 'government', 'county', 'website']
+CODE_FIELDS = ['irc', 'iecc']
+
+
+def _code_string(value):
+    """Convert a code property to the string form used for color lookups"""
+    if isinstance(value, (int, float)):
+        return str(value)
+    return value
+
+
+def make_record(props):
+    """
+    Build the record kept for a municipality point
+
+    Returns:
+    dict: The point's RECORD_FIELDS ('N/A' if missing, '#' for a missing website like
+          the marker popups) and CODE_FIELDS as strings
+    """
+    record = {field: props.get(field, 'N/A') for field in RECORD_FIELDS}
+    record['name'] = props.get('name', '')
+    record['website'] = props.get('website') or '#'
+    for field in CODE_FIELDS:
+        record[field] = _code_string(props.get(field, 'Unknown'))
+    return record
+
+
+def build_join_index(points, polygons):
+    """
+    Match every place polygon to the municipality points with the same name
+
+    Parameters:
+    points (dict): Point GeoJSON FeatureCollection
+    polygons (dict): TIGER place GeoJSON FeatureCollection
+
+    Returns:
+    dict: Mapping of GEOID -> {'name': polygon NAME, 'records': [record, ...]}
+          where each record holds the point's RECORD_FIELDS and its codes as strings
+    """
+    # Normalized point name -> record, later points win like the old name mapping
+    records_by_name = {}
+    for feature in points['features']:
+        if 'properties' not in feature:
+            continue
+        record = make_record(feature['properties'])
+        records_by_name[normalize_name(record['name'])] = record
+
+    # Look every point name up in the place name indexes once
+    resolver = PlaceResolver.from_features(polygons['features'])
+    name_matches = {}
+    namelsad_matches = {}
+    for name, record in records_by_name.items():
+        for polygon_id in resolver.exact(name, 'NAME'):
+            name_matches[polygon_id] = record
+        for polygon_id in resolver.exact(name, 'NAMELSAD'):
+            namelsad_matches[polygon_id] = record
+
+    index = {}
+    for feature in polygons['features']:
+        if 'properties' not in feature:
+            continue
+        props = feature['properties']
+        polygon_id = props.get('GEOID', '')
+
+        # First try matching on NAME, then fall back to NAMELSAD
+        record = name_matches.get(polygon_id)
+        if record is None:
+            record = namelsad_matches.get(polygon_id)
+
+        index[polygon_id] = {
+            'name': props.get('NAME', 'Unknown Area'),
+            'records': [record] if record is not None else []
+        }
+        if record is not None:
+            logger.debug(f"Matched '{record['name']}' to polygon '{props.get('NAME', '')}' (ID: {polygon_id})")
+
+    return index
+
+
+def _source_fingerprint(paths):
+    """Identify the source files by size and mtime so a stale index can be detected"""
+    # Keyed with the parent directory, binary stores all name their source manifest.json
+    return {
+        os.path.join(os.path.basename(os.path.dirname(path)), os.path.basename(path)):
+            [os.path.getsize(path), os.path.getmtime(path)]
+        for path in paths
+    }
+
+
+def load_join_index(index_path, point_path, polygon_path):
+    """
+    Load the persisted join index, returning None if it is missing or stale
+    """
+    if not os.path.exists(index_path):
+        return None
+    try:
+        with open(index_path) as f:
+            stored = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable join index {index_path}: {e}")
+        return None
+    if stored.get('sources') != _source_fingerprint([point_path, polygon_path]):
+        return None
+    return stored['index']
+
+
+def save_join_index(index, index_path, point_path, polygon_path):
+    """Persist a join index next to the data it was built from"""
+    payload = {
+        'sources': _source_fingerprint([point_path, polygon_path]),
+        'index': index
+    }
+    # Write to a temporary file first so readers never see a partial index
+    tmp_path = index_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(payload, f)
+    os.replace(tmp_path, index_path)
+
+
+def get_join_index(points, polygons, index_path, point_path, polygon_path):
+    """
+    Return the join index for the given data, building and persisting it if needed
+    """
+    index = load_join_index(index_path, point_path, polygon_path)
+    if index is not None:
+        return index
+
+    logger.info(f"Building join index {index_path}")
+    index = build_join_index(points, polygons)
+    try:
+        save_join_index(index, index_path, point_path, polygon_path)
+    except OSError as e:
+        logger.warning(f"Could not save join index {index_path}: {e}")
+    return index
+
+
+if __name__ == "__main__":
+    # Offline build: python -m building_code_map.join_index
+    from .data import get_store
+
+    logging.basicConfig(level=logging.INFO)
+    store = get_store()
+    dataset = store.get()
+    print(f"Join index for {len(dataset.join_index)} places saved to {store.join_index_path}")
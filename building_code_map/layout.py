@@ -1,8 +1,5 @@
-import os
 import dash_bootstrap_components as dbc
 import dash_leaflet as dl
-import json
-import re  # Add regex for name cleaning
 from dash import dcc, html
 from dash.dependencies import Input, Output
 from shapely.geometry import Point, shape
@@ -19,7 +16,9 @@ except ImportError:
         from shapely.topology import TopologyException as GEOSException
 import logging
 import copy
-from .config import GEOJSON_FILENAME
+from .callbacks import create_polygon_collection_layer, create_vector_tile_layer
+from .config import POLYGON_LAYER_MODE, USE_VECTOR_TILES
+from .data import get_dataset
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -33,53 +32,13 @@ logger.addHandler(console_handler)
 
 
 def create_layout():
-    # Compute the absolute path to the geojson file
-    base_path = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
-    
-    polygon_geojson_path = 'data/tl_2024_08_place/tl_2024_08_place.geojson'
-    with open(os.path.join(base_path, polygon_geojson_path)) as f:
-        polygons = json.load(f)
-    
-    # Load points geojson data
-    point_geojson_path = os.path.join(base_path, 'data', GEOJSON_FILENAME)
-    with open(point_geojson_path) as f:
-        points = json.load(f)
-
-    # Collect all unique codes (both IRC and IECC) into a single set
-    all_codes = set()
-    
-    # Add codes from points geojson
-    for feature in points['features']:
-        props = feature.get('properties', {})
-        irc_code = props.get('irc')
-        iecc_code = props.get('iecc')
-        
-        # Handle IRC codes
-        if isinstance(irc_code, (int, float)) and str(irc_code) != "Unknown":
-            all_codes.add(str(irc_code))
-        elif isinstance(irc_code, str) and irc_code != "Unknown":
-            all_codes.add(irc_code)
-            
-        # Handle IECC codes
-        if isinstance(iecc_code, (int, float)) and str(iecc_code) != "Unknown":
-            all_codes.add(str(iecc_code))
-        elif isinstance(iecc_code, str) and iecc_code != "Unknown":
-            all_codes.add(iecc_code)
-    
-    # Add "Unknown" as a special case
-    all_codes.add("Unknown")
-    
-    # Create a color map for all codes with simple colors that match available marker colors
-    available_colors = ['blue', 'gold', 'red', 'green', 'orange', 'yellow', 'violet', 'black'][::-1]
-    
-    # Create a consistent color mapping for all codes
-    color_mapping = {}
-    for i, code in enumerate(sorted(all_codes)):
-        color_index = i % len(available_colors)
-        color_mapping[code] = available_colors[color_index]
-    
-    # Make sure "Unknown" is always grey
-    color_mapping["Unknown"] = "grey"
+    # Parsed datasets and code colors are shared with the callbacks
+    dataset = get_dataset()
+    polygons = dataset.polygons
+    points = dataset.points
+    all_codes = dataset.all_codes
+    color_mapping = dataset.color_mapping
+    initial_zoom = 7
     
     # Create color to hex map for legend display
     color_to_hex = {
@@ -98,14 +57,6 @@ def create_layout():
     irc_markers = []
     iecc_markers = []
     
-    # Function to normalize place names for comparison
-    def normalize_name(name):
-        if not name:
-            return ""
-        # Remove characters like [*] and ? and convert to lowercase
-        cleaned_name = re.sub(r'\[.*?\]|\?', '', str(name)).strip().lower()
-        return cleaned_name
-    
     # Process each feature from the GeoJSON
     for feature in points['features']:
         if 'geometry' in feature and feature['geometry']['type'] == 'Point':
@@ -190,121 +141,87 @@ def create_layout():
             )
             iecc_markers.append(iecc_marker)
     
-    # Extract normalized point names for matching with polygons
-    point_name_mapping = {}
-    for feature in points['features']:
-        if 'properties' in feature:
-            raw_name = feature['properties'].get('name', '')
-            normalized_name = normalize_name(raw_name)
-            point_name_mapping[normalized_name] = raw_name
-    
-    # Match polygons to points by name
-    polygon_point_counts = {}
-    polygon_point_names = {}  # Track names of points in each polygon
+    # Polygon -> matched point records, precomputed once per dataset
+    join_index = dataset.join_index
     
-    # Process each polygon to find matching points by name
-    for feature in polygons['features']:
-        if 'properties' in feature:
-            polygon_id = feature['properties'].get('GEOID', '')
-            polygon_name = feature['properties'].get('NAME', '')
-            polygon_namelsad = feature['properties'].get('NAMELSAD', '')  # Also try NAMELSAD
-            normalized_polygon_name = normalize_name(polygon_name)
-            normalized_polygon_namelsad = normalize_name(polygon_namelsad)
-            
-            # Initialize counts and name lists
-            polygon_point_counts[polygon_id] = 0
-            polygon_point_names[polygon_id] = []
-            
-            # First try matching on NAME
-            if normalized_polygon_name in point_name_mapping:
-                original_point_name = point_name_mapping[normalized_polygon_name]
-                polygon_point_counts[polygon_id] += 1
-                polygon_point_names[polygon_id].append(original_point_name)
-                logger.info(f"Matched '{original_point_name}' to polygon '{polygon_name}' (ID: {polygon_id})")
-            # If no match with NAME, try NAMELSAD
-            elif normalized_polygon_namelsad in point_name_mapping:
-                original_point_name = point_name_mapping[normalized_polygon_namelsad]
-                polygon_point_counts[polygon_id] += 1
-                polygon_point_names[polygon_id].append(original_point_name)
-                logger.info(f"Matched '{original_point_name}' to polygon '{polygon_namelsad}' (ID: {polygon_id})")
+    if USE_VECTOR_TILES:
+        # Polygons are drawn from the tile endpoint instead of being embedded in the layout
+        polygon_layers = [create_vector_tile_layer('places', 'irc', False)]
+    elif POLYGON_LAYER_MODE == 'collection':
+        # One FeatureCollection styled in the browser, recolored by the polygon-colors store,
+        # with geometry simplified for the initial zoom
+        polygon_layers = [create_polygon_collection_layer(dataset.polygon_level(initial_zoom))]
+    else:
+        # Create a deep copy of the polygons GeoJSON to modify
+        styled_polygons = copy.deepcopy(polygons)
     
-    # Create a deep copy of the polygons GeoJSON to modify
-    styled_polygons = copy.deepcopy(polygons)
+        # Create individual polygon layers
+        polygon_layers = []
     
-    # Create individual polygon layers
-    polygon_layers = []
-    
-    for feature in styled_polygons['features']:
-        if 'properties' in feature and 'geometry' in feature:
-            polygon_id = feature['properties'].get('GEOID', None)
-            point_count = polygon_point_counts.get(polygon_id, 0)
-            point_names = polygon_point_names.get(polygon_id, [])
+        for feature in styled_polygons['features']:
+            if 'properties' in feature and 'geometry' in feature:
+                polygon_id = feature['properties'].get('GEOID', None)
+                records = join_index.get(polygon_id, {}).get('records', [])
+                point_count = len(records)
+                point_names = [record['name'] for record in records]
             
-            # Get city name from polygon properties
-            city_name = feature['properties'].get('NAME', 'Unknown Area')
+                # Get city name from polygon properties
+                city_name = feature['properties'].get('NAME', 'Unknown Area')
             
-            # Determine fill color based on matched points
-            fill_color = color_to_hex.get('grey')  # Default to Unknown/grey color
+                # Determine fill color based on matched points
+                fill_color = color_to_hex.get('grey')  # Default to Unknown/grey color
             
-            # If we have matched points, look up their codes and colors
-            if point_count > 0:
-                # Find the point in the original points data that matches our polygon
-                for point_feature in points['features']:
-                    if point_feature.get('properties', {}).get('name', '') in point_names:
-                        # Get the IRC code (could use IECC as well depending on requirements)
-                        irc_code = point_feature.get('properties', {}).get('irc', 'Unknown')
-                        # Convert numeric codes to strings
-                        if isinstance(irc_code, (int, float)):
-                            irc_code = str(irc_code)
-                        # Get the color for this code
-                        color_name = color_mapping.get(irc_code, 'grey')
-                        fill_color = color_to_hex.get(color_name, color_to_hex.get('grey'))
-                        # Just use the first match for now
-                        break
+                # If we have matched points, look up their codes and colors
+                if point_count > 0:
+                    # Get the IRC code of the first match (could use IECC as well depending on requirements)
+                    irc_code = records[0].get('irc', 'Unknown')
+                    # Get the color for this code
+                    color_name = color_mapping.get(irc_code, 'grey')
+                    fill_color = color_to_hex.get(color_name, color_to_hex.get('grey'))
             
-            # Define style based on point count and matched color
-            style = {
-                'weight': 2,
-                'opacity': 0.7,
-                'color': '#4A4A4A',
-                'fillOpacity': 0.4,
-                'fillColor': fill_color
-            }
+                # Define style based on point count and matched color
+                style = {
+                    'weight': 2,
+                    'opacity': 0.7,
+                    'color': '#4A4A4A',
+                    'fillOpacity': 0.4,
+                    'fillColor': fill_color
+                }
             
-            # Create single-feature GeoJSON
-            single_feature_geojson = {
-                "type": "FeatureCollection",
-                "features": [feature]
-            }
+                # Create single-feature GeoJSON
+                single_feature_geojson = {
+                    "type": "FeatureCollection",
+                    "features": [feature]
+                }
             
-            # Create tooltip content with list of points
-            if point_count > 0:
-                tooltip_content = f"{city_name}: {point_count} {'location' if point_count == 1 else 'locations'}"
-                popup_content = html.Div([
-                    html.H5(f"{city_name}"),
-                    html.P(f"{point_count} {'location' if point_count == 1 else 'locations'}:"),
-                    html.Ul([html.Li(name) for name in point_names])
-                ])
-            else:
-                tooltip_content = f"{city_name}: No data"
-                popup_content = html.Div([
-                    html.H5(f"{city_name}"),
-                    html.P("No building code data available")
-                ])
+                # Create tooltip content with list of points
+                if point_count > 0:
+                    tooltip_content = f"{city_name}: {point_count} {'location' if point_count == 1 else 'locations'}"
+                    popup_content = html.Div([
+                        html.H5(f"{city_name}"),
+                        html.P(f"{point_count} {'location' if point_count == 1 else 'locations'}:"),
+                        html.Ul([html.Li(name) for name in point_names])
+                    ])
+                else:
+                    tooltip_content = f"{city_name}: No data"
+                    popup_content = html.Div([
+                        html.H5(f"{city_name}"),
+                        html.P("No building code data available")
+                    ])
             
-            # Create individual polygon layer
-            polygon = dl.GeoJSON(
-                data=single_feature_geojson,
-                id=f'polygon-{polygon_id}',
-                style=style,
-                hoverStyle=dict(weight=3, color='#666', dashArray=''),
-                children=[
-                    dl.Tooltip(tooltip_content),
-                    dl.Popup(popup_content)
-                ]
-            )
+                # Create individual polygon layer
+                polygon = dl.GeoJSON(
+                    data=single_feature_geojson,
+                    id=f'polygon-{polygon_id}',
+                    style=style,
+                    hoverStyle=dict(weight=3, color='#666', dashArray=''),
+                    children=[
+                        dl.Tooltip(tooltip_content),
+                        dl.Popup(popup_content)
+                    ]
+                )
             
-            polygon_layers.append(polygon)
+                polygon_layers.append(polygon)
     
     # Create a layer group with all polygon layers
     polygon_layer = dl.LayerGroup(
@@ -375,7 +292,11 @@ def create_layout():
                         # Legend section updated
                         html.Hr(),
                         html.H6("Legend:"),
-                        html.Div(id="legend-div", style={'display': 'flex', 'flexWrap': 'wrap'})
+                        html.Div(id="legend-div", style={'display': 'flex', 'flexWrap': 'wrap'}),
+                        # GEOID -> fill color map for the polygon collection layer
+                        dcc.Store(id='polygon-colors'),
+                        # Simplification level currently drawn by the polygon collection layer
+                        dcc.Store(id='polygon-level', data=dataset.polygon_level(initial_zoom))
                     ])
                 ], className="shadow-sm", style={'position': 'absolute', 'top': '10px', 'left': '10px', 
                                                  'zIndex': 1000, 'width': '400px', 'maxWidth': '90%'})
@@ -389,7 +310,7 @@ def create_layout():
                     id='map',
                     style={'width': '100vw', 'height': '100vh'},
                     center=[39.0, -105.5],  # Center on Colorado
-                    zoom=7,  # Show the entire state
+                    zoom=initial_zoom,  # Show the entire state
                     zoomControl=False,  # Disable default zoom control
                     children=[
                         dl.TileLayer(),
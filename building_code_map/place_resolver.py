@@ -0,0 +1,160 @@
+import logging
+import re
+import unicodedata
+from collections import defaultdict
+
+from .utils import normalize_name
+
+logger = logging.getLogger(__name__)
+
+# Government words that municipality names and TIGER NAMELSAD values add to the core name
+PLACE_TYPE_WORDS = r'city and county|city|town|village|cdp|municipality|borough'
+_PREFIX = re.compile(rf'^(?:(?:{PLACE_TYPE_WORDS}) of )+')
+_SUFFIX = re.compile(rf'(?: (?:{PLACE_TYPE_WORDS}))+$')
+
+# Minimum trigram similarity (Jaccard) for a fuzzy match
+FUZZY_THRESHOLD = 0.5
+
+
+def core_name(name):
+    """
+    Normalized name without government words, so "City of Boulder", "Boulder city"
+    and "Boulder" all become "boulder"
+    """
+    # Fold accents so "Cañon City" and "Canon City" agree
+    name = unicodedata.normalize('NFKD', normalize_name(name)).encode('ascii', 'ignore').decode()
+    name = re.sub(r"[^\w\s]", ' ', name)
+    name = re.sub(r'\s+', ' ', name).strip()
+    stripped = _SUFFIX.sub('', _PREFIX.sub('', name)).strip()
+    return stripped or name
+
+
+def trigrams(name):
+    """Character trigrams of a name padded with spaces"""
+    padded = f"  {name} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class PlaceResolver:
+    """
+    Resolves place names to GEOIDs with hash indexes built once over the places.
+
+    Names are looked up in order: exact normalized NAME, exact normalized
+    NAMELSAD, the core name without government words ("City of X" -> "x"), and
+    finally a trigram index for misspellings.
+
+    Parameters:
+    places (list): Place property dicts (e.g. TIGER GeoJSON feature properties)
+    id_field (str): The property holding the place id
+    name_fields (tuple): Properties indexed for exact lookups, in priority order
+    """
+
+    def __init__(self, places, id_field='GEOID', name_fields=('NAME', 'NAMELSAD')):
+        self.id_field = id_field
+        self.name_fields = name_fields
+        self.ids = []
+        # place id -> its first name field, to report fuzzy matches
+        self.names = {}
+        # field -> normalized name -> [place ids], in input order
+        self._exact = {field: defaultdict(list) for field in name_fields}
+        self._core = defaultdict(list)
+        self._trigrams = defaultdict(set)
+
+        for props in places:
+            place_id = props.get(id_field)
+            if place_id is None:
+                continue
+            for field in name_fields:
+                if props.get(field):
+                    self._exact[field][normalize_name(props[field])].append(place_id)
+            core = core_name(props.get(name_fields[0]) or '')
+            if core and place_id not in self._core[core]:
+                self._core[core].append(place_id)
+            self.ids.append(place_id)
+            self.names.setdefault(place_id, props.get(name_fields[0]))
+
+        # Trigram postings over the distinct core names
+        self._core_names = list(self._core)
+        for position, core in enumerate(self._core_names):
+            for gram in trigrams(core):
+                self._trigrams[gram].add(position)
+
+    @classmethod
+    def from_features(cls, features, **kwargs):
+        """Build a resolver from GeoJSON features"""
+        return cls([feature['properties'] for feature in features if 'properties' in feature], **kwargs)
+
+    @classmethod
+    def from_dataframe(cls, df, **kwargs):
+        """Build a resolver from a (Geo)DataFrame with the id and name columns"""
+        columns = [kwargs.get('id_field', 'GEOID')] + list(kwargs.get('name_fields', ('NAME', 'NAMELSAD')))
+        return cls(df[[col for col in columns if col in df.columns]].to_dict('records'), **kwargs)
+
+    def exact(self, name, field):
+        """Ids of the places whose normalized name field equals the normalized name"""
+        return self._exact[field].get(normalize_name(name), [])
+
+    def fuzzy(self, name, threshold=FUZZY_THRESHOLD):
+        """
+        Ids of the places whose core name is most similar to the name
+
+        Every match is logged with its similarity, since it may be the wrong place.
+
+        Returns:
+        list: The best matching place ids, empty if no similarity reaches the threshold
+        """
+        grams = trigrams(core_name(name))
+        counts = defaultdict(int)
+        for gram in grams:
+            for position in self._trigrams.get(gram, ()):
+                counts[position] += 1
+        # Highest Jaccard similarity wins, ties go to the place indexed first
+        best, best_score = None, threshold
+        for position in sorted(counts):
+            shared = counts[position]
+            score = shared / (len(grams) + len(trigrams(self._core_names[position])) - shared)
+            if score > best_score or (best is None and score == best_score):
+                best, best_score = position, score
+        if best is None:
+            return []
+        ids = self._core[self._core_names[best]]
+        logger.warning(f"Fuzzy match: {name!r} -> {self.names.get(ids[0])!r} ({ids[0]}), "
+                       f"similarity {best_score:.2f}")
+        return ids
+
+    def resolve_one(self, name, fuzzy=True):
+        """
+        Resolve one name
+
+        Returns:
+        str: The GEOID of the best match, or None
+        """
+        if not name:
+            return None
+        for field in self.name_fields:
+            ids = self.exact(name, field)
+            if ids:
+                return ids[0]
+        ids = self._core.get(core_name(name))
+        if ids:
+            return ids[0]
+        if fuzzy:
+            ids = self.fuzzy(name)
+            if ids:
+                return ids[0]
+        return None
+
+    def resolve(self, names, fuzzy=True):
+        """
+        Resolve many names at once, repeated names are only looked up once
+
+        Returns:
+        list: The GEOID (or None) for each name, in order
+        """
+        resolved = {}
+        results = []
+        for name in names:
+            if name not in resolved:
+                resolved[name] = self.resolve_one(name, fuzzy)
+            results.append(resolved[name])
+        return results
@@ -0,0 +1,254 @@
+import logging
+import os
+from collections import Counter, defaultdict
+
+from shapely.geometry import LineString
+
+from .config import PLACE_SIMPLIFY_LEVELS
+from .geostore import MANIFEST, STORE_SUFFIX, load_geojson, read_store, source_path, store_is_valid, write_store
+
+logger = logging.getLogger(__name__)
+
+
+def level_store_path(geojson_path, min_zoom):
+    """The store holding one simplification level (data/x.geojson -> data/x.z8.geostore)"""
+    return f"{os.path.splitext(geojson_path)[0]}.z{min_zoom}{STORE_SUFFIX}"
+
+
+def _polygons_of(geometry):
+    """The polygons (lists of rings) of a Polygon or MultiPolygon geometry"""
+    if geometry is None:
+        return []
+    if geometry['type'] == 'Polygon':
+        return [geometry['coordinates']]
+    if geometry['type'] == 'MultiPolygon':
+        return geometry['coordinates']
+    return []
+
+
+def _ring_vertices(ring):
+    """Ring vertices as tuples without the closing repeat of the first vertex"""
+    vertices = [tuple(point[:2]) for point in ring]
+    if len(vertices) > 1 and vertices[0] == vertices[-1]:
+        vertices.pop()
+    return vertices
+
+
+def find_junctions(rings):
+    """
+    Vertices where shared borders begin or end
+
+    A vertex is a junction when its neighbors differ between the rings (or the
+    places in one ring) that use it, i.e. where two places stop sharing a border.
+    """
+    neighbors = defaultdict(set)
+    for vertices in rings:
+        count = len(vertices)
+        for i, vertex in enumerate(vertices):
+            previous, following = vertices[i - 1], vertices[(i + 1) % count]
+            neighbors[vertex].add(frozenset((previous, following)))
+    return {vertex for vertex, pairs in neighbors.items() if len(pairs) > 1}
+
+
+def _cut_ring(vertices, junctions):
+    """
+    Cut a ring into arcs that start and end at junctions
+
+    Rings without a junction become one closed arc starting at their smallest
+    vertex, so a ring shared by two places (an enclave and the hole around it)
+    is cut at the same point on both sides.
+    """
+    cuts = [i for i, vertex in enumerate(vertices) if vertex in junctions]
+    if not cuts:
+        start = vertices.index(min(vertices))
+        return [vertices[start:] + vertices[:start + 1]]
+    arcs = []
+    rotated = vertices[cuts[0]:] + vertices[:cuts[0]]
+    offsets = [cut - cuts[0] for cut in cuts] + [len(vertices)]
+    rotated.append(rotated[0])
+    for start, end in zip(offsets, offsets[1:]):
+        arcs.append(rotated[start:end + 1])
+    return arcs
+
+
+class ArcTopology:
+    """
+    Place rings decomposed into shared arcs, TopoJSON style
+
+    Every border between two places is stored once, so simplifying the arcs
+    simplifies both sides of a border identically and neighbors never gap or
+    overlap at any tolerance.
+
+    Parameters:
+    features (list): GeoJSON Polygon / MultiPolygon features
+    """
+
+    def __init__(self, features):
+        self.features = features
+        self.arcs = []
+        arc_ids = {}
+        # feature -> polygons -> rings -> [(arc id, reversed)]
+        self.shapes = []
+
+        feature_rings = [
+            [[_ring_vertices(ring) for ring in polygon] for polygon in _polygons_of(feature.get('geometry'))]
+            for feature in features
+        ]
+        junctions = find_junctions(
+            vertices for polygons in feature_rings for rings in polygons for vertices in rings
+        )
+        for polygons in feature_rings:
+            shape = []
+            for rings in polygons:
+                ring_arcs = []
+                for vertices in rings:
+                    refs = []
+                    for arc in _cut_ring(vertices, junctions) if len(vertices) >= 3 else []:
+                        key = tuple(arc)
+                        if key in arc_ids:
+                            refs.append((arc_ids[key], False))
+                        elif key[::-1] in arc_ids:
+                            refs.append((arc_ids[key[::-1]], True))
+                        else:
+                            arc_ids[key] = len(self.arcs)
+                            self.arcs.append(arc)
+                            refs.append((arc_ids[key], False))
+                    ring_arcs.append(refs)
+                shape.append(ring_arcs)
+            self.shapes.append(shape)
+        logger.info(f"{len(features)} places decomposed into {len(self.arcs)} arcs")
+
+    def simplified_arcs(self, tolerance):
+        """
+        Every arc simplified with Douglas-Peucker, the arc end points are kept
+
+        A closed arc (a whole ring, e.g. an enclave and the hole around it) that
+        would collapse keeps its full resolution on both sides.
+        """
+        if not tolerance:
+            return self.arcs
+        simplified = []
+        for arc in self.arcs:
+            if len(arc) > 2:
+                line = LineString(arc).simplify(tolerance, preserve_topology=False)
+                points = [tuple(point) for point in line.coords]
+                if not (arc[0] == arc[-1] and len(points) < 4):
+                    arc = points
+            simplified.append(arc)
+        return simplified
+
+    def _ring(self, refs, arcs):
+        """Stitch a ring back together from its arcs"""
+        coordinates = []
+        for arc_id, reverse in refs:
+            arc = arcs[arc_id][::-1] if reverse else arcs[arc_id]
+            # Consecutive arcs share their junction vertex
+            coordinates.extend(arc if not coordinates else arc[1:])
+        return [list(point) for point in coordinates]
+
+    def features_at(self, tolerance):
+        """
+        The features with their geometry simplified to a tolerance (in degrees)
+
+        A ring that collapses to fewer than four points keeps every one of its
+        arcs at full resolution, so small places stay visible and the rings
+        sharing those arcs stay gap free. Only holes that share no arc with
+        another ring are dropped instead.
+        """
+        arcs = list(self.simplified_arcs(tolerance))
+        uses = Counter(arc_id for shape in self.shapes for rings in shape
+                       for refs in rings for arc_id, _ in refs)
+        # Restoring arcs only adds vertices, so no other ring can collapse because of it
+        for shape in self.shapes:
+            for rings in shape:
+                for ring_index, refs in enumerate(rings):
+                    if len(self._ring(refs, arcs)) >= 4:
+                        continue
+                    if ring_index == 0 or any(uses[arc_id] > 1 for arc_id, _ in refs):
+                        for arc_id, _ in refs:
+                            arcs[arc_id] = self.arcs[arc_id]
+
+        simplified = []
+        for feature, shape in zip(self.features, self.shapes):
+            polygons = []
+            for rings in shape:
+                polygon = []
+                for ring_index, refs in enumerate(rings):
+                    ring = self._ring(refs, arcs)
+                    if len(ring) < 4:
+                        if ring_index:
+                            continue
+                        break
+                    polygon.append(ring)
+                if polygon:
+                    polygons.append(polygon)
+
+            geometry = feature.get('geometry')
+            if polygons and geometry['type'] == 'Polygon':
+                geometry = {'type': 'Polygon', 'coordinates': polygons[0]}
+            elif polygons:
+                geometry = {'type': 'MultiPolygon', 'coordinates': polygons}
+            simplified.append({**feature, 'geometry': geometry})
+        return simplified
+
+
+def build_levels(geojson_path, levels=PLACE_SIMPLIFY_LEVELS):
+    """
+    Write one simplified store per level next to a place GeoJSON file
+
+    Parameters:
+    geojson_path (str): The full resolution place GeoJSON (or its binary store)
+    levels (list): (min zoom, tolerance in degrees) pairs
+
+    Returns:
+    list: The store paths written
+    """
+    topology = ArcTopology(load_geojson(geojson_path)['features'])
+    written = []
+    for min_zoom, tolerance in levels:
+        path = level_store_path(geojson_path, min_zoom)
+        write_store(topology.features_at(tolerance), path)
+        written.append(path)
+        logger.info(f"Wrote zoom {min_zoom}+ places simplified to {tolerance} degrees to {path}")
+    return written
+
+
+def load_levels(geojson_path, levels=PLACE_SIMPLIFY_LEVELS):
+    """
+    Load the simplified level stores of a place file that are up to date
+
+    The levels are sent to the browser as GeoJSON, so they are read with
+    read_store into dicts rather than kept as arrays.
+
+    Returns:
+    dict: min zoom -> FeatureCollection, levels that are missing or older than
+          the source file are left out
+    """
+    source_mtime = os.path.getmtime(source_path(geojson_path))
+    loaded = {}
+    for min_zoom, _ in levels:
+        path = level_store_path(geojson_path, min_zoom)
+        if not store_is_valid(path):
+            continue
+        if os.path.getmtime(os.path.join(path, MANIFEST)) < source_mtime:
+            logger.warning(f"Ignoring {path}, it is older than {geojson_path}")
+            continue
+        loaded[min_zoom] = read_store(path)
+    return loaded
+
+
+def level_sources(geojson_path, levels=PLACE_SIMPLIFY_LEVELS):
+    """Manifests of the level stores that exist, used to watch for rebuilds"""
+    manifests = [os.path.join(level_store_path(geojson_path, min_zoom), MANIFEST) for min_zoom, _ in levels]
+    return [path for path in manifests if os.path.exists(path)]
+
+
+if __name__ == "__main__":
+    # Offline build: python -m building_code_map.simplify [data/tl_2024_08_place/tl_2024_08_place.geojson]
+    import sys
+
+    from .config import PLACE_GEOJSON_PATH
+
+    logging.basicConfig(level=logging.INFO)
+    base_path = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+    build_levels(sys.argv[1] if len(sys.argv) > 1 else os.path.join(base_path, PLACE_GEOJSON_PATH))
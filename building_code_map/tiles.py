@@ -0,0 +1,216 @@
+import logging
+import math
+import os
+import shutil
+import threading
+
+import mapbox_vector_tile
+import numpy as np
+import shapely
+from flask import Response, abort, request
+from shapely.geometry import shape
+
+from .callbacks import classify_points, create_voronoi_features, style_polygons
+from .config import (COLOR_TO_HEX, TILE_BUFFER, TILE_CACHE_DIR, TILE_EXTENT, TILE_MAX_ZOOM,
+                     TILE_SIMPLIFY_PIXELS)
+from .data import BASE_PATH, get_dataset
+
+logger = logging.getLogger(__name__)
+
+TILE_LAYERS = ('places', 'voronoi')
+CODE_TYPES = ('irc', 'iecc', 'combined')
+
+EARTH_RADIUS = 6378137.0
+MAX_LATITUDE = 85.0511287798
+WORLD_SIZE = 2 * math.pi * EARTH_RADIUS
+
+
+def lonlat_to_web_mercator(coords):
+    """Project an (N, 2) array of [lon, lat] to Web Mercator meters"""
+    lon = np.radians(coords[:, 0])
+    lat = np.radians(np.clip(coords[:, 1], -MAX_LATITUDE, MAX_LATITUDE))
+    return np.column_stack([EARTH_RADIUS * lon, EARTH_RADIUS * np.log(np.tan(np.pi / 4 + lat / 2))])
+
+
+def tile_bounds(z, x, y):
+    """Web Mercator bounds (min_x, min_y, max_x, max_y) of an XYZ tile"""
+    size = WORLD_SIZE / 2 ** z
+    min_x = -WORLD_SIZE / 2 + x * size
+    max_y = WORLD_SIZE / 2 - y * size
+    return min_x, max_y - size, min_x + size, max_y
+
+
+class TileSource:
+    """
+    Geometries for one tile layer, projected once and indexed for tile queries
+    """
+
+    def __init__(self, geometries, properties):
+        self.geometries = shapely.transform(np.asarray(geometries, dtype=object), lonlat_to_web_mercator)
+        self.properties = properties
+        self.tree = shapely.STRtree(self.geometries)
+
+    def encode(self, layer_name, z, x, y):
+        """
+        Encode the features touching a tile as a Mapbox Vector Tile
+
+        Geometry is clipped to the tile plus a small buffer and simplified to
+        about TILE_SIMPLIFY_PIXELS tile pixels, so detail follows the zoom level.
+        """
+        bounds = tile_bounds(z, x, y)
+        pixel = (bounds[2] - bounds[0]) / TILE_EXTENT
+        buffer = TILE_BUFFER * pixel
+        buffered = (bounds[0] - buffer, bounds[1] - buffer, bounds[2] + buffer, bounds[3] + buffer)
+
+        indices = self.tree.query(shapely.box(*buffered))
+        geometries = shapely.clip_by_rect(self.geometries[indices], *buffered)
+        geometries = shapely.simplify(geometries, TILE_SIMPLIFY_PIXELS * pixel, preserve_topology=True)
+
+        features = [
+            {'geometry': geometry, 'properties': self.properties[index]}
+            for geometry, index in zip(geometries, indices.tolist())
+            if not geometry.is_empty
+        ]
+        return mapbox_vector_tile.encode(
+            [{'name': layer_name, 'features': features}],
+            default_options={'quantize_bounds': bounds, 'extents': TILE_EXTENT}
+        )
+
+
+def build_tile_source(layer, selected_code, show_unknown):
+    """
+    Build the TileSource for a layer as the callbacks would display it
+
+    Parameters:
+    layer (str): 'places' or 'voronoi'
+    selected_code (str): The selected code type ('irc', 'iecc' or 'combined')
+    show_unknown (bool): Whether to include places and cells with unknown codes
+    """
+    geometries = []
+    properties = []
+    if layer == 'places':
+        dataset = get_dataset()
+        place_geometries = dataset.polygon_geometries()
+        feature_index = {id(feature): index for index, feature in enumerate(dataset.polygons['features'])}
+        for feature, fill_color, point_names, code_value in style_polygons(selected_code, show_unknown):
+            props = feature['properties']
+            index = feature_index.get(id(feature))
+            # A feature of a dataset that was reloaded in the meantime is converted on its own
+            geometries.append(place_geometries[index] if index is not None else shape(feature['geometry']))
+            properties.append({
+                'GEOID': props.get('GEOID', ''),
+                'NAME': props.get('NAME', 'Unknown Area'),
+                'fillColor': fill_color,
+                'code': f"{selected_code.upper()}: {code_value}" if code_value is not None else '',
+                'locations': len(point_names),
+            })
+    else:
+        point_data = [(position, color, code)
+                      for _, position, color, code, _, _ in classify_points(selected_code, show_unknown)]
+        if point_data:
+            # The whole tessellation, not just the current viewport
+            lats = [pos[0] for pos, _, _ in point_data]
+            lons = [pos[1] for pos, _, _ in point_data]
+            bounds = [min(lons) - 1, min(lats) - 1, max(lons) + 1, max(lats) + 1]
+            for feature in create_voronoi_features(point_data, selected_code, show_unknown, bounds):
+                # Voronoi features are in Leaflet [lat, lon] order
+                ring = feature['geometry']['coordinates'][0]
+                geometries.append(shapely.Polygon([(lon, lat) for lat, lon in ring]))
+                props = feature['properties']
+                properties.append({
+                    'fillColor': COLOR_TO_HEX.get(props['color'], '#000000'),
+                    'opacity': props['opacity'],
+                    'code': props['code'],
+                })
+    return TileSource(geometries, properties)
+
+
+class TileServer:
+    """
+    Serves encoded tiles, caching sources in memory and tiles on disk
+
+    Both caches are keyed by the dataset version, so edited source data is
+    picked up without clearing anything by hand. Tiles of older versions are
+    deleted from disk when a new version is first served.
+    """
+
+    def __init__(self, cache_dir=os.path.join(BASE_PATH, TILE_CACHE_DIR)):
+        self.cache_dir = cache_dir
+        self._lock = threading.Lock()
+        self._sources = {}
+        self._sources_version = None
+        self._disk_version = None
+
+    def _source(self, version, layer, selected_code, show_unknown):
+        key = (layer, selected_code, show_unknown)
+        with self._lock:
+            if self._sources_version != version:
+                self._sources = {}
+                self._sources_version = version
+            source = self._sources.get(key)
+        if source is None:
+            source = build_tile_source(layer, selected_code, show_unknown)
+            with self._lock:
+                if self._sources_version == version:
+                    self._sources[key] = source
+        return source
+
+    def _prune_disk_cache(self, version):
+        """Delete the cached tile trees of every other dataset version"""
+        with self._lock:
+            if self._disk_version == version:
+                return
+            self._disk_version = version
+        if not os.path.isdir(self.cache_dir):
+            return
+        for entry in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, entry)
+            if entry != version and os.path.isdir(path):
+                logger.info(f"Removing stale tile cache {path}")
+                shutil.rmtree(path, ignore_errors=True)
+
+    def get_tile(self, layer, z, x, y, selected_code, show_unknown):
+        """Return the encoded tile bytes, from the disk cache when possible"""
+        version = get_dataset().version
+        self._prune_disk_cache(version)
+        variant = f"{selected_code}-{int(show_unknown)}"
+        path = os.path.join(self.cache_dir, version, layer, variant, str(z), str(x), f"{y}.pbf")
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                return f.read()
+
+        tile = self._source(version, layer, selected_code, show_unknown).encode(layer, z, x, y)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write to a temporary file first so concurrent readers never see a partial tile
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(tile)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not cache tile {path}: {e}")
+        return tile
+
+
+def register_tile_routes(server, tile_server=None):
+    """
+    Add the /tiles/<layer>/<z>/<x>/<y>.pbf vector tile route to a Flask server
+
+    The code type and unknown visibility are passed as ?code=irc&unknown=0.
+    """
+    tile_server = tile_server or TileServer()
+
+    @server.route('/tiles/<layer>/<int:z>/<int:x>/<int:y>.pbf')
+    def vector_tile(layer, z, x, y):
+        selected_code = request.args.get('code', 'irc')
+        show_unknown = request.args.get('unknown', '0') == '1'
+        if layer not in TILE_LAYERS or selected_code not in CODE_TYPES:
+            abort(404)
+        if not 0 <= z <= TILE_MAX_ZOOM or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+            abort(404)
+
+        tile = tile_server.get_tile(layer, z, x, y, selected_code, show_unknown)
+        return Response(tile, mimetype='application/vnd.mapbox-vector-tile',
+                        headers={'Cache-Control': 'public, max-age=3600'})
+
+    return tile_server
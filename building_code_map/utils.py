@@ -1,11 +1,36 @@
+import re
+from itertools import chain
 import numpy as np
 from scipy.spatial import Voronoi
-import geopandas as gpd
-from shapely.geometry import Polygon, MultiPolygon
+import shapely
 import pyproj
 from shapely.ops import transform
 from functools import partial
 
+def parse_bounds(bounds):
+    """
+    Normalize map bounds to (min_lon, min_lat, max_lon, max_lat)
+    
+    Parameters:
+    bounds (list): Map bounds as [[min_lat, min_lon], [max_lat, max_lon]] (Leaflet format)
+                  or [min_lon, min_lat, max_lon, max_lat] (direct format)
+    
+    Returns:
+    tuple: (min_lon, min_lat, max_lon, max_lat), Colorado's bounds if the format is invalid
+    """
+    # Handle Leaflet format: [[min_lat, min_lon], [max_lat, max_lon]]
+    if isinstance(bounds[0], (list, tuple)) and len(bounds) == 2:
+        min_lat, min_lon = bounds[0]
+        max_lat, max_lon = bounds[1]
+    # Handle direct format: [min_lon, min_lat, max_lon, max_lat]
+    elif len(bounds) == 4:
+        min_lon, min_lat, max_lon, max_lat = bounds
+    else:
+        # Default bounds for Colorado if format is invalid
+        min_lon, min_lat = -109.5, 37.0
+        max_lon, max_lat = -102.0, 41.0
+    return min_lon, min_lat, max_lon, max_lat
+
 def compute_voronoi_polygons(points, bounds=None):
     """
     Compute Voronoi polygons for a set of points
@@ -24,17 +49,7 @@ def compute_voronoi_polygons(points, bounds=None):
     
     # Process bounds based on format
     if bounds:
-        # Handle Leaflet format: [[min_lat, min_lon], [max_lat, max_lon]]
-        if isinstance(bounds[0], (list, tuple)) and len(bounds) == 2:
-            min_lat, min_lon = bounds[0]
-            max_lat, max_lon = bounds[1]
-        # Handle direct format: [min_lon, min_lat, max_lon, max_lat]
-        elif len(bounds) == 4:
-            min_lon, min_lat, max_lon, max_lat = bounds
-        else:
-            # Default bounds for Colorado if format is invalid
-            min_lon, min_lat = -109.5, 37.0
-            max_lon, max_lat = -102.0, 41.0
+        min_lon, min_lat, max_lon, max_lat = parse_bounds(bounds)
             
         # Add far points at corners to bound the Voronoi diagram
         far_points = np.array([
@@ -73,66 +88,128 @@ def clip_polygons_to_bounds(polygons, bounds):
     
     Returns:
     list: List of clipped polygons with format [(polygon_coords, point_index), ...]
+          where polygon_coords is a list of [lat, lon] lists
     """
     # Process bounds based on format
-    if isinstance(bounds[0], (list, tuple)) and len(bounds) == 2:
-        min_lat, min_lon = bounds[0]
-        max_lat, max_lon = bounds[1]
-    elif len(bounds) == 4:
-        min_lon, min_lat, max_lon, max_lat = bounds
-    else:
-        # Default bounds for Colorado if format is invalid
-        min_lon, min_lat = -109.5, 37.0
-        max_lon, max_lat = -102.0, 41.0
+    min_lon, min_lat, max_lon, max_lat = parse_bounds(bounds)
     
-    # Create a GeoDataFrame for the polygons
-    geometries = []
-    indices = []
-    for polygon_coords, point_index in polygons:
-        # Convert to Shapely polygon (Leaflet format is already [lat, lon], need to swap to [lon, lat] for Shapely)
-        shapely_coords = [(lon, lat) for lat, lon in polygon_coords]
-        if len(shapely_coords) >= 3:  # Need at least 3 vertices for a polygon
-            try:
-                geom = Polygon(shapely_coords)
-                if geom.is_valid:
-                    geometries.append(geom)
-                    indices.append(point_index)
-            except:
-                pass
-    
-    if not geometries:
+    geometries, point_indices = polygons_from_leaflet(polygons)
+    if not len(geometries):
         return []
     
-    gdf = gpd.GeoDataFrame({'geometry': geometries, 'index': indices})
-    
-    # Create a bounding box polygon
-    bound_box = Polygon([
-        (min_lon, min_lat),
-        (min_lon, max_lat),
-        (max_lon, max_lat),
-        (max_lon, min_lat)
-    ])
-    
-    # Clip the polygons
-    clipped = gdf.copy()
-    clipped['geometry'] = gdf.intersection(bound_box)
-    
-    # Extract clipped polygons
-    clipped_polygons = []
-    for idx, row in clipped.iterrows():
-        geometry = row['geometry']
-        point_index = row['index']
-        
-        if geometry.is_empty:
-            continue
+    # Clip the polygons to the bounding box
+    clipped = shapely.clip_by_rect(geometries, min_lon, min_lat, max_lon, max_lat)
+    return polygons_to_leaflet(clipped, point_indices)
+
+def polygons_from_leaflet(polygons):
+    """
+    Build Shapely polygons for Voronoi cells in one vectorized pass
+    
+    Parameters:
+    polygons (list): List of (polygon_coords, point_index) tuples with [lat, lon] coordinates
+    
+    Returns:
+    tuple: (geometries, point_indices) arrays holding the valid cells in [lon, lat] order
+    """
+    # Keep only cells with enough vertices to form a polygon
+    polygons = [(polygon_coords, point_index) for polygon_coords, point_index in polygons
+                if len(polygon_coords) >= 3]
+    if not polygons:
+        return np.array([], dtype=object), np.array([], dtype=np.intp)
+    
+    # Build every cell at once from one flat coordinate array
+    # (Leaflet format is [lat, lon], Shapely needs [lon, lat])
+    lengths = np.array([len(polygon_coords) for polygon_coords, _ in polygons])
+    coords = np.array(list(chain.from_iterable(polygon_coords for polygon_coords, _ in polygons)),
+                      dtype=np.float64)[:, ::-1]
+    point_indices = np.array([point_index for _, point_index in polygons])
+    rings = shapely.linearrings(coords, indices=np.repeat(np.arange(len(polygons)), lengths))
+    geometries = shapely.polygons(rings)
+    
+    valid = shapely.is_valid(geometries)
+    return geometries[valid], point_indices[valid]
+
+def polygons_to_leaflet(geometries, point_indices):
+    """
+    Convert clipped Shapely cells back to Leaflet polygons
+    
+    Parameters:
+    geometries (array): Polygon/MultiPolygon geometries in [lon, lat] order
+    point_indices (array): Point index of each geometry
+    
+    Returns:
+    list: List of polygons with format [(polygon_coords, point_index), ...], one entry
+          per polygon part, where polygon_coords is the exterior ring as [lat, lon] lists
+    """
+    keep = (~shapely.is_empty(geometries)) & np.isin(
+        shapely.get_type_id(geometries), [shapely.GeometryType.POLYGON, shapely.GeometryType.MULTIPOLYGON])
+    geometries, point_indices = geometries[keep], point_indices[keep]
+    if not len(geometries):
+        return []
+    
+    # Flatten to ragged arrays; single polygons are treated as one-part multipolygons
+    geom_type, coords, offsets = shapely.to_ragged_array(geometries)
+    if geom_type == shapely.GeometryType.POLYGON:
+        ring_offsets, polygon_offsets = offsets
+        part_offsets = np.arange(len(geometries) + 1)
+    else:
+        ring_offsets, polygon_offsets, part_offsets = offsets
+    
+    # Exterior ring of every part and the point index of the cell it came from
+    exterior_starts = ring_offsets[polygon_offsets[:-1]]
+    exterior_ends = ring_offsets[polygon_offsets[:-1] + 1]
+    part_point_indices = np.repeat(point_indices, np.diff(part_offsets))
+    
+    # Convert back to Leaflet format [lat, lon] as GeoJSON-ready nested lists
+    latlon = coords[:, ::-1]
+    return [
+        (latlon[start:end].tolist(), point_index)
+        for start, end, point_index in zip(exterior_starts, exterior_ends, part_point_indices.tolist())
+    ]
+
+def collect_all_codes(points):
+    """Collect all unique codes from the GeoJSON data"""
+    all_codes = set()
+    
+    for feature in points['features']:
+        props = feature.get('properties', {})
+        irc_code = props.get('irc')
+        iecc_code = props.get('iecc')
         
-        if isinstance(geometry, Polygon):
-            # Convert back to Leaflet format [lat, lon]
-            coords = [(float(lat), float(lon)) for lon, lat in geometry.exterior.coords]
-            clipped_polygons.append((coords, point_index))
-        elif isinstance(geometry, MultiPolygon):
-            for poly in geometry.geoms:
-                coords = [(float(lat), float(lon)) for lon, lat in poly.exterior.coords]
-                clipped_polygons.append((coords, point_index))
-    
-    return clipped_polygons
+        # Handle IRC codes
+        if isinstance(irc_code, (int, float)) and str(irc_code) != "Unknown":
+            all_codes.add(str(irc_code))
+        elif isinstance(irc_code, str) and irc_code != "Unknown":
+            all_codes.add(irc_code)
+            
+        # Handle IECC codes
+        if isinstance(iecc_code, (int, float)) and str(iecc_code) != "Unknown":
+            all_codes.add(str(iecc_code))
+        elif isinstance(iecc_code, str) and iecc_code != "Unknown":
+            all_codes.add(iecc_code)
+    
+    # Add "Unknown" as a special case
+    all_codes.add("Unknown")
+    
+    return all_codes
+
+def create_color_mapping(all_codes):
+    """Create a mapping of codes to colors"""
+    available_colors = ['blue', 'gold', 'red', 'green', 'orange', 'yellow', 'violet', 'black'][::-1]
+    
+    color_mapping = {}
+    for i, code in enumerate(sorted(all_codes)):
+        color_index = i % len(available_colors)
+        color_mapping[code] = available_colors[color_index]
+    
+    # Make sure "Unknown" is always grey
+    color_mapping["Unknown"] = "grey"
+    
+    return color_mapping
+
+def normalize_name(name):
+    """Normalize a place name for matching points to polygons"""
+    if not name:
+        return ""
+    # Remove characters like [*] and ? and convert to lowercase
+    return re.sub(r'\[.*?\]|\?', '', str(name)).strip().lower()
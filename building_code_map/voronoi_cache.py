@@ -0,0 +1,165 @@
+import hashlib
+import math
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from .boundaries import get_boundary
+from .config import VORONOI_BOUNDS_QUANTUM, VORONOI_CACHE_MAX_VERTICES, VORONOI_CLIP_MODE
+from .utils import compute_voronoi_polygons, clip_polygons_to_bounds, parse_bounds
+
+
+def hash_points(points):
+    """Stable hash of a list of [lat, lon] points"""
+    points_array = np.ascontiguousarray(points, dtype=np.float64)
+    return hashlib.blake2b(points_array.tobytes(), digest_size=16).hexdigest()
+
+
+def quantize_bounds(bounds, quantum=VORONOI_BOUNDS_QUANTUM):
+    """
+    Snap bounds outward to a grid so that nearby viewports share a cache entry
+
+    Returns:
+    tuple: (min_lon, min_lat, max_lon, max_lat) on multiples of quantum
+    """
+    min_lon, min_lat, max_lon, max_lat = parse_bounds(bounds)
+    return (
+        math.floor(min_lon / quantum) * quantum,
+        math.floor(min_lat / quantum) * quantum,
+        math.ceil(max_lon / quantum) * quantum,
+        math.ceil(max_lat / quantum) * quantum,
+    )
+
+
+def _vertex_count(polygons):
+    return sum(len(coords) for coords, _ in polygons)
+
+
+class _LRU:
+    """OrderedDict-backed LRU that evicts by total vertex count"""
+
+    def __init__(self, max_vertices):
+        self.max_vertices = max_vertices
+        self.entries = OrderedDict()
+        self.vertices = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        polygons = self.entries.get(key)
+        if polygons is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return polygons
+
+    def put(self, key, polygons):
+        if key in self.entries:
+            self.vertices -= _vertex_count(self.entries.pop(key))
+        self.entries[key] = polygons
+        self.vertices += _vertex_count(polygons)
+        # Always keep the newest entry, even if it alone exceeds the budget
+        while self.vertices > self.max_vertices and len(self.entries) > 1:
+            _, evicted = self.entries.popitem(last=False)
+            self.vertices -= _vertex_count(evicted)
+            self.evictions += 1
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': len(self.entries),
+            'vertices': self.vertices,
+        }
+
+
+class VoronoiCache:
+    """
+    Memoizes Voronoi tessellations for the callbacks.
+
+    Two levels are kept: the base tessellation of a point set, and the base
+    clipped to a quantized viewport for a given code mode. The base covers the
+    points' extent, widened to the viewport when the viewport reaches past it,
+    so a viewport change within the points' extent only re-clips the cached base.
+    """
+
+    def __init__(self, max_vertices=VORONOI_CACHE_MAX_VERTICES):
+        self._lock = threading.Lock()
+        self._base = _LRU(max_vertices)
+        self._clipped = _LRU(max_vertices)
+
+    def _base_tessellation(self, points, points_key, clip_bounds):
+        # The far helper points are placed around the union of the points' extent and
+        # the viewport, so the outer cells reach every edge of the viewport
+        lats = [point[0] for point in points]
+        lons = [point[1] for point in points]
+        frame = (
+            min(min(lons), clip_bounds[0]),
+            min(min(lats), clip_bounds[1]),
+            max(max(lons), clip_bounds[2]),
+            max(max(lats), clip_bounds[3]),
+        )
+        key = (points_key, frame)
+        with self._lock:
+            polygons = self._base.get(key)
+        if polygons is not None:
+            return polygons
+
+        polygons = compute_voronoi_polygons(points, list(frame))
+        with self._lock:
+            self._base.put(key, polygons)
+        return polygons
+
+    def get_polygons(self, points, code_mode, bounds):
+        """
+        Return clipped Voronoi polygons for the points, computing them only on a cache miss
+
+        Cells are clipped to the map bounds and, in "boundary" clip mode, to the
+        state/county outline from boundaries.get_boundary().
+
+        Parameters:
+        points (list): List of [lat, lon] points
+        code_mode (str): The selected code type ('irc', 'iecc' or 'combined')
+        bounds (list): Map bounds in any format accepted by parse_bounds
+
+        Returns:
+        list: List of clipped polygons with format [(polygon_coords, point_index), ...]
+              Callers must not modify the returned list, it is shared between requests.
+        """
+        points_key = hash_points(points)
+        clip_bounds = quantize_bounds(bounds)
+        key = (points_key, code_mode, clip_bounds)
+
+        with self._lock:
+            polygons = self._clipped.get(key)
+        if polygons is not None:
+            return polygons
+
+        base = self._base_tessellation(points, points_key, clip_bounds)
+        boundary = get_boundary() if VORONOI_CLIP_MODE == 'boundary' else None
+        if boundary is not None:
+            polygons = boundary.clip(base, list(clip_bounds))
+        else:
+            polygons = clip_polygons_to_bounds(base, list(clip_bounds))
+        with self._lock:
+            self._clipped.put(key, polygons)
+        return polygons
+
+    def stats(self):
+        """Hit/miss counters and sizes for both cache levels"""
+        with self._lock:
+            return {'clipped': self._clipped.stats(), 'base': self._base.stats()}
+
+    def clear(self):
+        with self._lock:
+            max_vertices = self._clipped.max_vertices
+            self._base = _LRU(max_vertices)
+            self._clipped = _LRU(max_vertices)
+
+
+# Shared by all callbacks in the process
+voronoi_cache = VoronoiCache()
@@ -0,0 +1,148 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+# Bump when the stored payload format changes; entries with another version are ignored
+CACHE_VERSION = 1
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'data', 'census_cache.sqlite')
+# ACS releases do not change once published, so responses can be kept for a long time
+DEFAULT_TTL = 30 * 24 * 60 * 60
+
+
+class CacheMiss(Exception):
+    """Raised in offline mode when a response is not in the cache"""
+
+
+def make_key(kind, year, dataset, group, ucgids=None):
+    """
+    Build the cache key for a Census API response.
+
+    The UCGIDs are treated as a set, so the same places requested in another
+    order share an entry.
+
+    Parameters:
+    - kind (str): 'data' for group data, 'variables' for group metadata.
+    - year (int): The data year.
+    - dataset (str): The dataset path, e.g. 'acs/acs5'.
+    - group (str): The table/group name.
+    - ucgids (list, optional): The requested UCGIDs.
+
+    Returns:
+    - str: A hex digest identifying the request.
+    """
+    ucgid_part = ",".join(sorted(set(ucgids))) if ucgids is not None else ""
+    raw = f"{kind}|{year}|{dataset}|{group}|{ucgid_part}"
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class CensusCache:
+    """
+    Persistent cache of Census API responses in a SQLite file.
+
+    Payloads are stored as zlib-compressed JSON. Entries older than ttl seconds
+    are refetched, except in offline mode, where every cached entry is served
+    and a missing entry raises CacheMiss instead of touching the network.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl=DEFAULT_TTL, offline=False):
+        self.path = path
+        self.ttl = ttl
+        self.offline = offline
+        self._lock = threading.Lock()
+        self._initialized = False
+        # sqlite3.connect does not create missing directories
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30)
+        if not self._initialized:
+            connection.execute(
+                """CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    kind TEXT,
+                    year INTEGER,
+                    dataset TEXT,
+                    grp TEXT,
+                    ucgid_count INTEGER,
+                    version INTEGER,
+                    fetched_at REAL,
+                    payload BLOB
+                )"""
+            )
+            connection.commit()
+            self._initialized = True
+        return connection
+
+    def get(self, key):
+        """
+        Return the cached payload for a key, or None if it is missing or expired.
+
+        In offline mode expired entries are returned and a missing entry raises CacheMiss.
+        """
+        with self._lock:
+            connection = self._connect()
+            try:
+                row = connection.execute(
+                    "SELECT version, fetched_at, payload FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+            finally:
+                connection.close()
+
+        if row is not None and row[0] == CACHE_VERSION:
+            version, fetched_at, payload = row
+            if self.offline or self.ttl is None or time.time() - fetched_at < self.ttl:
+                return json.loads(zlib.decompress(payload))
+        if self.offline:
+            raise CacheMiss(f"Census response {key} is not cached and offline mode is on")
+        return None
+
+    def set(self, key, payload, kind, year, dataset, group, ucgids=None):
+        """Store a JSON-serializable payload along with the request it answers"""
+        blob = zlib.compress(json.dumps(payload).encode())
+        with self._lock:
+            connection = self._connect()
+            try:
+                connection.execute(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (key, kind, year, dataset, group, len(ucgids) if ucgids is not None else 0,
+                     CACHE_VERSION, time.time(), blob)
+                )
+                connection.commit()
+            finally:
+                connection.close()
+
+    def clear(self, kind=None):
+        """Delete every entry, or only the entries of one kind"""
+        with self._lock:
+            connection = self._connect()
+            try:
+                if kind is None:
+                    connection.execute("DELETE FROM responses")
+                else:
+                    connection.execute("DELETE FROM responses WHERE kind = ?", (kind,))
+                connection.commit()
+            finally:
+                connection.close()
+
+
+def cache_from_env():
+    """
+    Create a CensusCache configured by environment variables.
+
+    - CENSUS_CACHE_PATH: SQLite file (default data/census_cache.sqlite).
+    - CENSUS_CACHE_TTL: Entry lifetime in seconds (default 30 days).
+    - CENSUS_OFFLINE: Set to 1 to serve only from the cache.
+    - CENSUS_CACHE_DISABLE: Set to 1 to always hit the API (returns None).
+    """
+    if os.getenv("CENSUS_CACHE_DISABLE") == "1":
+        return None
+    return CensusCache(
+        path=os.getenv("CENSUS_CACHE_PATH", DEFAULT_CACHE_PATH),
+        ttl=float(os.getenv("CENSUS_CACHE_TTL", DEFAULT_TTL)),
+        offline=os.getenv("CENSUS_OFFLINE") == "1",
+    )
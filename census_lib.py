@@ -5,112 +5,461 @@ import numpy as np
 
 from openai import OpenAI
 
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
 import pandas as pd
+from requests.adapters import HTTPAdapter
+from scipy import sparse
+
+from census_cache import cache_from_env, make_key
+from variable_catalog import VariableCatalog
 
 ai = OpenAI()
 
+DATASET = "acs/acs5"
 
-def aggregate_blockgroups(table, block_group_gdf):
-    percent_overlap = block_group_gdf['percent_overlap'] if 'percent_overlap' in block_group_gdf.columns else np.ones(len(block_group_gdf))
-    ucgids = block_group_gdf['GEOIDFQ']
-    block_group_gdf[['GEOIDFQ', 'percent_overlap']].to_csv('block_group_gdf.csv', index=False)
-    bg_data = fetch_census_data(table, ucgids)
-    
-    # parse numbers
-    for col in bg_data.columns:
-        try:
-            bg_data[col] = pd.to_numeric(bg_data[col])
-        except ValueError:
-            pass
-    
-    # dot product every numeric column with percent_overlap
-    data = {}
-    for col in bg_data.columns:
-        col_type = bg_data[col].dtype
-        if col_type == np.float64 or col_type == np.int64:
-            bg_data[col] = bg_data[col].astype(np.float64)
-            data[col] = np.dot(bg_data[col], percent_overlap)
-    
-    vars = variables(table)
-    rows = [
-        {'VarID': key, 'Variable': vars[key]['label'].replace('!!', ' '), 'Value': value}
-        for key, value in data.items()
-    ]
-    
-    df = pd.DataFrame(rows).dropna(how='all')
-    return df
+# The API accepts at most this many UCGIDs per request
+MAX_UCGIDS_PER_REQUEST = 100
 
+# Concurrency and retry settings for chunked requests, the response cache is
+# configured by the CENSUS_CACHE_* and CENSUS_OFFLINE variables (see census_cache)
+MAX_WORKERS = int(os.getenv("CENSUS_MAX_WORKERS", 8))
+RATE_LIMIT = float(os.getenv("CENSUS_RATE_LIMIT", 10))  # requests per second
+MAX_RETRIES = int(os.getenv("CENSUS_MAX_RETRIES", 5))
+BACKOFF_SECONDS = float(os.getenv("CENSUS_BACKOFF_SECONDS", 0.5))
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
 
+# ACS estimate variables end in E, their margins of error in M (e.g. B01003_001E/_001M)
+ESTIMATE_PATTERN = re.compile(r'^[A-Z0-9]+_\d+E$')
+# Negative sentinels the API returns instead of values (too few samples, open-ended median, ...)
+ACS_JAM_VALUES = [-999999999, -888888888, -666666666, -555555555, -333333333, -222222222]
+# Margin sentinel for estimates that are controlled and have no sampling error
+ACS_NO_SAMPLING_ERROR = -555555555
+
+BASE_URL = os.getenv("CENSUS_BASE_URL", "https://api.census.gov/data")
+# (connect, read) timeouts in seconds
+TIMEOUT = (float(os.getenv("CENSUS_CONNECT_TIMEOUT", 5)), float(os.getenv("CENSUS_READ_TIMEOUT", 60)))
 
-    
 
+class TokenBucket:
+    """
+    Thread-safe token bucket: allows bursts of up to capacity requests and
+    rate requests per second on average.
+    """
 
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
 
+    def acquire(self):
+        """Block until a token is available and take it"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
 
-def fetch_census_data(group_name, ucgid_list, year=2023):
-    print(group_name, ucgid_list)
+
+class CensusFetchError(Exception):
     """
-    Fetches data from the U.S. Census Bureau API for a specified group and list of ucgids.
+    Raised when some chunks of a request could not be fetched.
+
+    Attributes:
+    - failures (list): (chunk_index, ucgids, error) for every failed chunk.
+    - partial (pd.DataFrame): The rows of the chunks that succeeded.
+    """
+
+    def __init__(self, group_name, failures, partial):
+        self.failures = failures
+        self.partial = partial
+        failed = sum(len(ucgids) for _, ucgids, _ in failures)
+        super().__init__(
+            f"{len(failures)} chunk(s) of {group_name} failed ({failed} UCGIDs): "
+            + "; ".join(f"chunk {index}: {error}" for index, _, error in failures)
+        )
+
+
+class CensusClient:
+    """
+    Client for the Census API that owns a pooled, keep-alive requests.Session.
+
+    The session's connection pool is sized for max_workers concurrent requests,
+    so chunked fetches reuse connections instead of paying a new TCP and TLS
+    handshake per request. All requests share the client's rate limit, retry
+    policy, timeouts and response cache.
 
     Parameters:
-    - group_name (str): The name of the data group to retrieve.
-    - ucgid_list (list): A list of ucgids (Uniform Census Geography Identifiers).
+    - api_key (str, optional): Census API key (default: the CENSUS_API_KEY variable).
+    - base_url (str): API root, override to point at a local stand-in server.
+    - dataset (str): The dataset path, e.g. 'acs/acs5'.
+    - max_workers (int): Concurrent chunk requests, also the connection pool size;
+      per-call max_workers are capped at it so every thread gets a pooled connection.
+    - rate_limit (float): Requests per second across all threads, 0 for no limit.
+    - timeout (tuple): (connect, read) timeouts in seconds.
+    - max_retries (int): Retries for 429/5xx responses and connection errors.
+    - backoff_seconds (float): Base delay of the exponential backoff.
+    - cache (CensusCache, optional): Response cache, None to always hit the API.
+    """
+
+    def __init__(self, api_key=None, base_url=BASE_URL, dataset=DATASET, max_workers=MAX_WORKERS,
+                 rate_limit=RATE_LIMIT, timeout=TIMEOUT, max_retries=MAX_RETRIES,
+                 backoff_seconds=BACKOFF_SECONDS, cache=None):
+        self.api_key = api_key if api_key is not None else os.getenv("CENSUS_API_KEY")
+        self.base_url = base_url.rstrip("/")
+        self.dataset = dataset
+        self.max_workers = max_workers
+        self.pool_maxsize = max_workers
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.cache = cache
+        self.rate_limiter = TokenBucket(rate_limit) if rate_limit > 0 else None
+
+        self.session = requests.Session()
+        self.session.headers.update({"Accept-Encoding": "gzip, deflate", "Connection": "keep-alive"})
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=self.pool_maxsize)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def close(self):
+        self.session.close()
+
+    def get(self, url, params):
+        """
+        GET a Census API URL, retrying 429/5xx responses and connection errors with
+        exponential backoff. Retry-After is honored when the server sends it.
+
+        Returns:
+        - requests.Response: The last response received.
+        """
+        params = dict(params, key=self.api_key)
+        for attempt in range(self.max_retries + 1):
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            try:
+                response = self.session.get(url, params=params, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.max_retries:
+                    raise
+                response = None
+            if response is not None and response.status_code not in RETRY_STATUS_CODES:
+                return response
+            if attempt == self.max_retries:
+                return response
+
+            retry_after = response.headers.get("Retry-After") if response is not None else None
+            if retry_after is not None and retry_after.isdigit():
+                delay = float(retry_after)
+            else:
+                delay = self.backoff_seconds * 2 ** attempt * (1 + random.random())
+            time.sleep(delay)
+
+    def fetch_census_data(self, group_name, ucgid_list, year=2023, max_workers=None):
+        """
+        Fetches data for a group and list of ucgids, see the module-level fetch_census_data.
+        """
+        ucgid_list = list(ucgid_list)
+        chunks = [ucgid_list[i:i + MAX_UCGIDS_PER_REQUEST]
+                  for i in range(0, len(ucgid_list), MAX_UCGIDS_PER_REQUEST)]
+        if len(chunks) <= 1:
+            return self.fetch_chunk(group_name, ucgid_list, year)
+
+        def fetch(chunk):
+            try:
+                return self.fetch_chunk(group_name, chunk, year), None
+            except Exception as e:
+                return None, e
+
+        # More threads than pooled connections would open throwaway connections
+        max_workers = min(max_workers if max_workers is not None else self.max_workers, self.pool_maxsize)
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(chunks)))) as executor:
+            results = list(executor.map(fetch, chunks))
+
+        frames = [df for df, _ in results if df is not None]
+        failures = [(index, chunk, error) for index, (chunk, (_, error)) in enumerate(zip(chunks, results))
+                    if error is not None]
+        partial = pd.concat(frames) if frames else pd.DataFrame()
+        if failures:
+            raise CensusFetchError(group_name, failures, partial)
+        return partial
+
+    def fetch_chunk(self, group_name, ucgid_list, year=2023):
+        """Fetch one request's worth of UCGIDs, from the cache when possible"""
+        # Serve repeated requests from the persistent cache
+        key = make_key('data', year, self.dataset, group_name, ucgid_list)
+        data = self.cache.get(key) if self.cache is not None else None
+        if data is not None:
+            return pd.DataFrame(data[1:], columns=data[0])
+
+        # Construct the API request parameters
+        params = {
+            "get": f"group({group_name})",
+            "ucgid": ",".join(ucgid_list),
+        }
+
+        # Make the API request
+        response = self.get(f"{self.base_url}/{year}/{self.dataset}", params)
+
+        # Check for a successful response
+        if response.status_code != 200:
+            raise Exception(f"API request failed with status code {response.status_code}: {response.text}")
+
+        # The first row contains the column headers, the subsequent rows contain the data
+        data = response.json()
+        if self.cache is not None:
+            self.cache.set(key, data, 'data', year, self.dataset, group_name, ucgid_list)
+        return pd.DataFrame(data[1:], columns=data[0])
+
+    def variables(self, table, year=2023):
+        """
+        Returns the variables of a group, keyed by variable name.
+        """
+        key = make_key('variables', year, self.dataset, table)
+        group_variables = self.cache.get(key) if self.cache is not None else None
+        if group_variables is not None:
+            return group_variables
+
+        resp = self.get(f"{self.base_url}/{year}/{self.dataset}/groups/{table}.json", {})
+        group_variables = resp.json()['variables']
+        if self.cache is not None:
+            self.cache.set(key, group_variables, 'variables', year, self.dataset, table)
+        return group_variables
+
+    def dataset_variables(self, year=2023):
+        """
+        Returns the metadata of every variable of the dataset, keyed by variable name.
+        """
+        key = make_key('variables', year, self.dataset, '*')
+        all_variables = self.cache.get(key) if self.cache is not None else None
+        if all_variables is not None:
+            return all_variables
+
+        resp = self.get(f"{self.base_url}/{year}/{self.dataset}/variables.json", {})
+        all_variables = resp.json()['variables']
+        if self.cache is not None:
+            self.cache.set(key, all_variables, 'variables', year, self.dataset, '*')
+        return all_variables
+
+
+# Shared by the module-level functions below
+client = CensusClient(cache=cache_from_env())
+
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+
+
+def catalog(year=2023):
+    """
+    Returns the VariableCatalog of the client's dataset for a year.
+
+    The dataset's variables.json is fetched (or read from the response cache)
+    once and indexed; later calls in the process reuse the same catalog.
+    """
+    key = (year, client.dataset)
+    with _catalogs_lock:
+        if key not in _catalogs:
+            _catalogs[key] = VariableCatalog(client.dataset_variables(year))
+        return _catalogs[key]
+
+
+def canonical_ucgid(ucgid):
+    """
+    Summary level and geography id of a UCGID, so the short form of a request
+    (16000US0807850) and the GEO_ID of the response (1600000US0807850) compare equal
+    """
+    level, separator, geoid = str(ucgid).partition('US')
+    return f"{level[:3]}US{geoid}" if separator else ucgid
+
+
+def index_by_ucgid(data):
+    """
+    Index a group response by canonical UCGID, keeping the first row of each.
+
+    The rows are identified by the ucgid column when the API echoes the predicate
+    and by GEO_ID otherwise, which every group() response includes.
+
+    Raises:
+    - KeyError: If a non-empty response has neither column.
+    """
+    column = 'ucgid' if 'ucgid' in data.columns else 'GEO_ID'
+    if column not in data.columns:
+        if data.empty:
+            return data
+        raise KeyError("Census response has neither a ucgid nor a GEO_ID column")
+    keys = data[column].map(canonical_ucgid)
+    return data.set_index(pd.Index(keys, name='ucgid'))[~keys.duplicated().to_numpy()]
+
+
+def split_estimates_and_margins(bg_data, ucgids=None):
+    """
+    Parse the estimate and margin of error columns of an ACS group response.
+
+    Columns are selected by variable suffix (<group>_<nnn>E and <group>_<nnn>M) and
+    converted in one pass. ACS jam values (large negative sentinels) become NaN,
+    except a margin of -555555555, which means the estimate has no sampling error.
+
+    Parameters:
+    - bg_data (pd.DataFrame): A fetch_census_data response.
+    - ucgids (list, optional): Reorder the rows to these UCGIDs (see index_by_ucgid);
+      missing UCGIDs get NaN rows.
 
     Returns:
-    - pd.DataFrame: A DataFrame containing the retrieved data.
+    - tuple: (estimates, margins) DataFrames with the same estimate variable names as
+      columns; margins is NaN where the group has no margin for a variable.
     """
-    if len(ucgid_list) > 100:
-        chunks = [ucgid_list[i:i + 100] for i in range(0, len(ucgid_list), 100)]
-        return pd.concat([fetch_census_data(group_name, chunk) for chunk in chunks])
-    
-    # Base URL for the Census API
-    base_url = f"https://api.census.gov/data/{year}/acs/acs5"
+    if ucgids is not None:
+        bg_data = index_by_ucgid(bg_data).reindex([canonical_ucgid(ucgid) for ucgid in ucgids])
 
-    # Convert the list of ucgids into a comma-separated string
-    ucgid_str = ",".join(ucgid_list)
+    estimate_cols = [col for col in bg_data.columns if ESTIMATE_PATTERN.match(col)]
+    margin_cols = [col[:-1] + 'M' for col in estimate_cols]
 
-    # Construct the API request parameters
-    params = {
-        "get": f"group({group_name})",
-        "ucgid": ucgid_str,
-        "key": os.getenv("CENSUS_API_KEY"),
-    }
+    estimates = bg_data[estimate_cols].apply(pd.to_numeric, errors='coerce')
+    estimates = estimates.where(~estimates.isin(ACS_JAM_VALUES))
 
-    # Make the API request
-    response = requests.get(base_url, params=params)
+    margins = bg_data.reindex(columns=margin_cols).apply(pd.to_numeric, errors='coerce')
+    margins = margins.mask(margins == ACS_NO_SAMPLING_ERROR, 0.0)
+    margins = margins.where(~margins.isin(ACS_JAM_VALUES))
+    margins.columns = estimate_cols
+    return estimates, margins
 
-    # Check for a successful response
-    if response.status_code == 200:
-        # Parse the JSON response
-        data = response.json()
 
-        # The first row contains the column headers
-        headers = data[0]
+def overlap_matrix(overlaps, target_col, source_col='GEOIDFQ', weight_col='percent_overlap'):
+    """
+    Build a sparse target x block group weight matrix from long-form overlaps.
 
-        # The subsequent rows contain the data
-        rows = data[1:]
+    Parameters:
+    - overlaps (pd.DataFrame): One row per (target, block group) pair.
+    - target_col (str): Column identifying the target area, e.g. a place GEOID.
+    - source_col (str): Column holding the block group UCGID.
+    - weight_col (str): Column holding the share of the block group in the target.
 
-        # Create a DataFrame
-        df = pd.DataFrame(rows, columns=headers)
+    Returns:
+    - tuple: (weights, target_ids, ucgids) where weights is a scipy.sparse CSR matrix
+      with a row per target_ids entry and a column per ucgids entry. Repeated pairs are summed.
+    """
+    rows, target_ids = pd.factorize(overlaps[target_col])
+    cols, ucgids = pd.factorize(overlaps[source_col])
+    weights = sparse.coo_matrix(
+        (overlaps[weight_col].to_numpy(dtype=np.float64), (rows, cols)),
+        shape=(len(target_ids), len(ucgids))
+    ).tocsr()
+    return weights, list(target_ids), list(ucgids)
 
-        return df
-    else:
-        # Handle errors
-        raise Exception(f"API request failed with status code {response.status_code}: {response.text}")
 
+def interpolate_tables(tables, weights, target_ids, ucgids, year=2023):
+    """
+    Interpolate ACS tables from block groups onto many target areas at once.
 
-def variables(table, year=2023):
+    Each table is fetched once for all block groups. Estimates of every table are
+    then weighted in a single sparse matrix product, and margins of error follow
+    the Census approximation for sums, sqrt(sum((w * MOE)^2)).
+
+    Parameters:
+    - tables (list): Group names, e.g. ['B01003', 'B19013'].
+    - weights (scipy.sparse matrix): Targets x block groups, see overlap_matrix or
+      overlap_weights.build_overlap_weights.
+    - target_ids (list): Labels of the weight rows.
+    - ucgids (list): Block group UCGIDs of the weight columns.
+
+    Returns:
+    - pd.DataFrame: One row per target, with each estimate variable (<group>_<nnn>E)
+      followed by the margins of error of the table (<group>_<nnn>M).
     """
-    Returns a list of the variables available from this source.
+    weights = sparse.csr_matrix(weights, dtype=np.float64)
+    estimate_frames = []
+    margin_frames = []
+    for table in tables:
+        bg_data = fetch_census_data(table, ucgids, year)
+        estimates, margins = split_estimates_and_margins(bg_data, ucgids)
+        estimate_frames.append(estimates)
+        margin_frames.append(margins)
+    estimates = pd.concat(estimate_frames, axis=1)
+    margins = pd.concat(margin_frames, axis=1)
+
+    values = weights @ estimates.to_numpy(dtype=np.float64)
+    moes = np.sqrt(weights.multiply(weights) @ np.square(margins.to_numpy(dtype=np.float64)))
+
+    columns = []
+    data = []
+    start = 0
+    # Keep each table's estimates and margins together
+    for frame in estimate_frames:
+        stop = start + frame.shape[1]
+        columns += list(frame.columns) + [col[:-1] + 'M' for col in frame.columns]
+        data += [values[:, start:stop], moes[:, start:stop]]
+        start = stop
+    return pd.DataFrame(np.hstack(data), index=pd.Index(target_ids, name='target'), columns=columns)
+
+
+def aggregate_blockgroups(table, block_group_gdf, year=2023):
+    """
+    Estimate a table for an area from the block groups overlapping it.
+
+    Each block group is weighted by its percent_overlap (1 if the column is missing).
+    This is interpolate_tables for a single target and table. Labels come from the
+    group's variables of the same year.
+
+    Returns:
+    - pd.DataFrame: Columns VarID, Variable, Value and MOE, one row per estimate variable.
     """
+    percent_overlap = block_group_gdf['percent_overlap'] if 'percent_overlap' in block_group_gdf.columns else np.ones(len(block_group_gdf))
+    ucgids = list(block_group_gdf['GEOIDFQ'])
+    weights = sparse.csr_matrix(np.asarray(percent_overlap, dtype=np.float64).reshape(1, -1))
     
-    tables_url = f'https://api.census.gov/data/{year}/acs/acs5/groups/{table}.json'
+    result = interpolate_tables([table], weights, ['area'], ucgids, year).iloc[0]
+    estimate_cols = [col for col in result.index if col.endswith('E')]
     
-    params = {
-        "key": os.getenv("CENSUS_API_KEY"),
-    }
-    resp = requests.get(tables_url, params=params)
+    labels = VariableCatalog(variables(table, year)).label
+    df = pd.DataFrame({
+        'VarID': estimate_cols,
+        'Variable': [labels(key) for key in estimate_cols],
+        'Value': result[estimate_cols].to_numpy(),
+        'MOE': result[[col[:-1] + 'M' for col in estimate_cols]].to_numpy(),
+    })
+    return df.dropna(subset=['Value'])
+
 
-    # Pass it out
-    return resp.json()['variables']
\ No newline at end of file
+def fetch_census_data(group_name, ucgid_list, year=2023, max_workers=None):
+    """
+    Fetches data from the U.S. Census Bureau API for a specified group and list of ucgids.
+
+    Lists longer than MAX_UCGIDS_PER_REQUEST are split into chunks that are fetched
+    concurrently by up to max_workers threads, subject to the shared rate limit.
+
+    Parameters:
+    - group_name (str): The name of the data group to retrieve.
+    - ucgid_list (list): A list of ucgids (Uniform Census Geography Identifiers).
+    - max_workers (int, optional): The maximum number of chunks fetched at the same time,
+      capped at the client's connection pool size.
+
+    Returns:
+    - pd.DataFrame: A DataFrame containing the retrieved data, in chunk order.
+
+    Raises:
+    - CensusFetchError: If any chunk fails after retries; the successful chunks
+      are available as its partial attribute.
+    """
+    return client.fetch_census_data(group_name, ucgid_list, year, max_workers)
+
+
+def variables(table, year=2023):
+    """
+    Returns a list of the variables available from this source.
+
+    Only the group's own metadata is fetched (groups/<table>.json, cached by the
+    client); use catalog(year) for lookups across the whole dataset.
+    """
+    return client.variables(table, year)
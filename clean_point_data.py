@@ -1,12 +1,12 @@
 import json
+import os
 import re
 
-file = 'data/gracy_3-9.geojson'
+from building_code_map.geostore import store_path_for, write_store
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'data')
+
 
-with open(file) as f:
-    data = json.load(f)
-    
-    
 def clean_strings(data):
     if isinstance(data, dict):
         for key, value in data.items():
@@ -23,7 +23,20 @@ def clean_strings(data):
             clean_strings(item)
     return data
 
-cleaned_data = clean_strings(data)
 
-with open('data/cleaned_gracy_3-9.geojson', 'w') as f:
-    json.dump(cleaned_data, f, indent=4)
\ No newline at end of file
+def clean_point_data(input_path, output_path):
+    """Strip '?' and '[...]' annotations from every string except websites"""
+    with open(input_path) as f:
+        data = json.load(f)
+
+    cleaned_data = clean_strings(data)
+
+    with open(output_path, 'w') as f:
+        json.dump(cleaned_data, f, indent=4)
+
+    # Binary store the app loads instead of parsing the GeoJSON
+    write_store(cleaned_data['features'], store_path_for(output_path))
+
+
+if __name__ == "__main__":
+    clean_point_data(os.path.join(DATA_DIR, 'gracy_3-9.geojson'), os.path.join(DATA_DIR, 'cleaned_gracy_3-9.geojson'))
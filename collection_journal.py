@@ -0,0 +1,104 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from census_cache import CACHE_VERSION
+
+DEFAULT_JOURNAL_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'data', 'census_journal.sqlite')
+
+
+def run_id_for(*paths):
+    """
+    Identify a collection run by CACHE_VERSION and the content of its input files.
+
+    Checkpoints of a run with other inputs (an updated municipality list or new
+    TIGER/Line places) or another payload format are then never resumed.
+
+    Parameters:
+    - paths (str): The input files of the run.
+
+    Returns:
+    - str: A hex digest identifying the run.
+    """
+    digest = hashlib.sha256(f"v{CACHE_VERSION}".encode())
+    for path in paths:
+        digest.update(b"\0")
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+class CollectionJournal:
+    """
+    Checkpoints of a census collection run in a SQLite file.
+
+    Every fetched (table, UCGID) value is committed as soon as its request
+    finishes, so a run that crashes or stalls can be resumed and only fetches
+    what is still missing. Checkpoints are keyed by run_id (see run_id_for),
+    so only a run with the same inputs resumes them. A UCGID the API returned
+    no row for is not recorded and is requested again on the next run.
+    """
+
+    def __init__(self, path=DEFAULT_JOURNAL_PATH, run_id=''):
+        self.path = path
+        self.run_id = run_id
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with self._connect() as connection:
+            columns = [row[1] for row in connection.execute("PRAGMA table_info(values_done)")]
+            if columns and 'run_id' not in columns:
+                # Checkpoints written before runs were keyed cannot be attributed to a run
+                connection.execute("DROP TABLE values_done")
+            connection.execute(
+                """CREATE TABLE IF NOT EXISTS values_done (
+                    run_id TEXT,
+                    table_id TEXT,
+                    year INTEGER,
+                    ucgid TEXT,
+                    value TEXT,
+                    recorded_at REAL,
+                    PRIMARY KEY (run_id, table_id, year, ucgid)
+                )"""
+            )
+
+    @contextmanager
+    def _connect(self):
+        """Connection that commits on success and is always closed"""
+        connection = sqlite3.connect(self.path, timeout=30)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def completed(self, table_id, year=2023):
+        """
+        Values already collected for a table in this run.
+
+        Returns:
+        - dict: UCGID -> value.
+        """
+        with self._lock, self._connect() as connection:
+            rows = connection.execute(
+                "SELECT ucgid, value FROM values_done WHERE run_id = ? AND table_id = ? AND year = ?",
+                (self.run_id, table_id, year)
+            ).fetchall()
+        return {ucgid: json.loads(value) for ucgid, value in rows}
+
+    def record(self, table_id, values, year=2023):
+        """Commit a batch of UCGID -> value results in one transaction, None values are skipped"""
+        now = time.time()
+        rows = [(self.run_id, table_id, year, ucgid, json.dumps(value), now)
+                for ucgid, value in values.items() if value is not None]
+        with self._lock, self._connect() as connection:
+            connection.executemany("INSERT OR REPLACE INTO values_done VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+    def reset(self):
+        """Forget the checkpoints of this run, the next run with its inputs starts over"""
+        with self._lock, self._connect() as connection:
+            connection.execute("DELETE FROM values_done WHERE run_id = ?", (self.run_id,))
@@ -1,26 +1,34 @@
 import json
+import os
 
+DATA_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'data')
 
-with open('data/counties.json') as f:
-    counties = json.load(f)
 
-updated = {
-    "type": "FeatureCollection",
-    "features": []
-}
+def format_counties(input_path, output_path):
+    """Wrap the bare ring coordinates of the county outlines into GeoJSON Polygons"""
+    with open(input_path) as f:
+        counties = json.load(f)
 
-for feature in counties['features']:
-    geometry = feature['geometry']
-    updated_geometry = {
-        "type": "Polygon",
-        "coordinates": [geometry['coordinates']]
+    updated = {
+        "type": "FeatureCollection",
+        "features": []
     }
-    updated['features'].append({
-        "type": "Feature",
-        "geometry": updated_geometry,
-        "properties": feature['properties']
-    })
 
+    for feature in counties['features']:
+        geometry = feature['geometry']
+        updated_geometry = {
+            "type": "Polygon",
+            "coordinates": [geometry['coordinates']]
+        }
+        updated['features'].append({
+            "type": "Feature",
+            "geometry": updated_geometry,
+            "properties": feature['properties']
+        })
 
-with open('data/counties_updated.json', 'w') as f:
-    json.dump(updated, f, indent=4)
\ No newline at end of file
+    with open(output_path, 'w') as f:
+        json.dump(updated, f, indent=4)
+
+
+if __name__ == "__main__":
+    format_counties(os.path.join(DATA_DIR, 'counties.json'), os.path.join(DATA_DIR, 'counties_updated.json'))
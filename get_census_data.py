@@ -5,40 +5,168 @@
 import pandas as pd
 import geopandas as gpd
 import json
-from census_lib import fetch_census_data, variables
+from census_lib import (MAX_UCGIDS_PER_REQUEST, CensusFetchError, canonical_ucgid, catalog, client,
+                        fetch_census_data, index_by_ucgid)
+from collection_journal import CollectionJournal, run_id_for
+from building_code_map.place_resolver import PlaceResolver
 import os
 import traceback  # Added import for stack trace functionality
 
-def main():
+BASE_DIR = os.path.dirname(os.path.realpath(__file__))
+DATA_DIR = os.path.join(BASE_DIR, 'data')
+
+# Census tables we want to fetch
+TABLES = {
+    "B01003": "Total Population",
+    "B19013": "Median Household Income",
+    "B25105": "Median Monthly Housing Costs"
+}
+
+
+def clean_municipality_name(name):
+    """Remove the '?' and '[...]' annotations from a municipality name"""
+    return name.split('?')[0].split('[')[0].strip()
+
+
+def main_variable(table_id):
+    """Return the table's main estimate variable (the one ending in 001E)"""
+    return catalog().main_estimate(table_id)
+
+
+def resolve_geoids(municipalities_gdf, places_gdf, fuzzy=False):
     """
-    Main function to collect census data for Colorado municipalities and save it to a spreadsheet.
-    Uses data from the American Community Survey (ACS) 5-year estimates.
-    - Total Population: B01003
-    - Median household income: B19013
-    - Median monthly housing costs: B25105
+    Match every municipality to a TIGER/Line place by name.
+
+    Names are resolved with a PlaceResolver built once over the places' NAME and
+    NAMELSAD, so "City of X" style names also match. With fuzzy=True small
+    misspellings match too; every fuzzy match is logged so it can be reviewed,
+    because a wrong match would silently attach another place's census values.
+
+    Parameters:
+    - municipalities_gdf (GeoDataFrame): Municipalities with a 'name' column.
+    - places_gdf (GeoDataFrame): TIGER/Line places with NAME, NAMELSAD and GEOID columns.
+    - fuzzy (bool): Fall back to trigram similarity for names without an exact match.
+
+    Returns:
+    - pd.Series: The matched GEOID for each municipality (None if there is no match),
+      aligned with municipalities_gdf. The first place wins when names repeat.
+    """
+    resolver = PlaceResolver.from_dataframe(places_gdf)
+    names = municipalities_gdf['name'].map(clean_municipality_name)
+    return pd.Series(resolver.resolve(names.tolist(), fuzzy), index=municipalities_gdf.index, dtype=object)
+
+
+def fetch_table_values(table_id, ucgids, journal=None):
+    """
+    Fetch a table's main estimate for many places, checkpointing as it goes.
+
+    Places already in the journal are skipped. The rest are fetched in batches
+    sized to keep every worker busy, and each batch is written to the journal as
+    soon as it finishes. Places whose chunk failed or that have no data are not
+    journaled, so they are requested again on the next run.
+
+    Returns:
+    - dict: UCGID -> value (None where the API returned no row) for the places
+      that were collected.
+    """
+    main_var = main_variable(table_id)
+    values = journal.completed(table_id) if journal is not None else {}
+    todo = [ucgid for ucgid in ucgids if ucgid not in values]
+    if values:
+        print(f"  Resuming: {len(ucgids) - len(todo)} of {len(ucgids)} places already collected")
+
+    batch_size = MAX_UCGIDS_PER_REQUEST * client.max_workers
+    for start in range(0, len(todo), batch_size):
+        batch = todo[start:start + batch_size]
+        try:
+            data = fetch_census_data(table_id, batch)
+            fetched = batch
+        except CensusFetchError as e:
+            # Keep the chunks that succeeded, the failed places stay unjournaled
+            print(f"  ⚠️ {e}")
+            data = e.partial
+            failed = {ucgid for _, chunk, _ in e.failures for ucgid in chunk}
+            fetched = [ucgid for ucgid in batch if ucgid not in failed]
+        except Exception as e:
+            # A batch of a single chunk fails as a whole; retry it on the next run
+            print(f"  ⚠️ Batch of {len(batch)} places failed: {e}")
+            continue
+
+        if not data.empty and main_var in data.columns:
+            found = index_by_ucgid(data)[main_var]
+        else:
+            found = pd.Series(dtype=object)
+        batch_values = {ucgid: found.get(canonical_ucgid(ucgid)) for ucgid in fetched}
+        if journal is not None:
+            journal.record(table_id, batch_values)
+        values.update(batch_values)
+    return values
+
+
+def collect_batched(municipalities_gdf, places_gdf, tables=TABLES, journal=None, fuzzy=False):
+    """
+    Collect census data for all municipalities with one chunked request per table.
+
+    Every place GEOID is resolved first. Each table is then fetched for all places at
+    once (fetch_census_data splits the request into chunks of 100 UCGIDs) and joined
+    back onto the municipalities by UCGID. With a journal, completed places are
+    checkpointed and skipped when the collection is run again. fuzzy is passed to
+    resolve_geoids.
+
+    Returns:
+    - pd.DataFrame: One row per municipality with a column per table.
+    """
+    geoids = resolve_geoids(municipalities_gdf, places_gdf, fuzzy)
+    for name in municipalities_gdf.loc[geoids.isna(), 'name']:
+        print(f"  ⚠️ Could not find {clean_municipality_name(name)} in TIGER/Line data")
+
+    results_df = pd.DataFrame({
+        'Name': municipalities_gdf['name'],
+        'Government': municipalities_gdf['government'],
+        'County': municipalities_gdf['county'],
+        'IRC': municipalities_gdf['irc'],
+        'IECC': municipalities_gdf['iecc'],
+        'ucgid': "16000US" + geoids.astype("string"),
+    }).reset_index(drop=True)
+
+    ucgids = results_df['ucgid'].dropna().unique().tolist()
+    print(f"Resolved {len(ucgids)} of {len(results_df)} municipalities to places")
+
+    for table_id, table_name in tables.items():
+        if not ucgids:
+            results_df[table_name] = None
+            continue
+        try:
+            print(f"Fetching {table_name} for {len(ucgids)} places...")
+            values = fetch_table_values(table_id, ucgids, journal)
+            if not any(value is not None for value in values.values()):
+                print(f"  ⚠️ No data for {table_name}")
+            results_df[table_name] = results_df['ucgid'].map(values)
+        except Exception as e:
+            print(f"  ❌ Error fetching {table_name}: {e}")
+            print("  📋 Stack trace:")
+            print(traceback.format_exc())  # Print detailed stack trace
+            results_df[table_name] = None
+
+    return results_df.drop(columns='ucgid')
+
+
+def collect_per_place(municipalities_gdf, places_gdf, tables=TABLES, journal=None, fuzzy=False):
+    """
+    Collect census data with one request per municipality per table.
+    With a journal, every fetched value is checkpointed and reused on the next run.
+    Names are matched as in resolve_geoids.
+
+    Returns:
+    - pd.DataFrame: One row per municipality with a column per table.
     """
-    print("Loading municipality data...")
-    # Load the municipalities data from the GeoJSON file
-    municipalities_file = "/home/bill/dev/school/holt-research/building-code-map/data/gracy_3-9.geojson"
-    municipalities_gdf = gpd.read_file(municipalities_file)
-    
-    print(f"Loaded {len(municipalities_gdf)} municipalities")
-    
-    # Load the TIGER/Line Places data which contains the GEOID needed for census API
-    places_file = "/home/bill/dev/school/holt-research/building-code-map/data/tl_2024_08_place/tl_2024_08_place.geojson"
-    places_gdf = gpd.read_file(places_file)
-    
-    print(f"Loaded {len(places_gdf)} places from TIGER/Line data")
-    
     # Create a dataframe to store our results
     results = []
     
-    # Census tables we want to fetch
-    tables = {
-        "B01003": "Total Population",
-        "B19013": "Median Household Income",
-        "B25105": "Median Monthly Housing Costs"
-    }
+    # Name -> GEOID lookups, built once
+    resolver = PlaceResolver.from_dataframe(places_gdf)
+    # Checkpoints of earlier attempts, loaded once per table
+    done = {table_id: journal.completed(table_id) if journal is not None else {} for table_id in tables}
     
     # Loop through each municipality
     for idx, municipality in municipalities_gdf.iterrows():
@@ -47,29 +175,10 @@ def main():
         
         # Try to find the matching place in the TIGER/Line data
         # Remove any special characters that might be in the name
-        clean_name = name.split('?')[0].split('[')[0].strip()
+        clean_name = clean_municipality_name(name)
         
         # Find matching place in TIGER/Line data
-        match = places_gdf[places_gdf['NAME'].str.upper() == clean_name.upper()]
-        
-        if len(match) == 0:
-            print(f"  ⚠️ Could not find {clean_name} in TIGER/Line data")
-            # Add row with just municipality data but no census data
-            municipality_data = {
-                'Name': name,
-                'Government': municipality['government'],
-                'County': municipality['county'],
-                'IRC': municipality['irc'],
-                'IECC': municipality['iecc'],
-                'Population': None,
-                'Median Household Income': None,
-                'Median Monthly Housing Costs': None
-            }
-            results.append(municipality_data)
-            continue
-        
-        # Get the GEOID (used to fetch census data)
-        geoid = match.iloc[0]['GEOID']
+        geoid = resolver.resolve_one(clean_name, fuzzy)
         
         # Create a dictionary to store municipality data
         municipality_data = {
@@ -80,17 +189,28 @@ def main():
             'IECC': municipality['iecc']
         }
         
+        if geoid is None:
+            print(f"  ⚠️ Could not find {clean_name} in TIGER/Line data")
+            # Add row with just municipality data but no census data
+            for table_name in tables.values():
+                municipality_data[table_name] = None
+            results.append(municipality_data)
+            continue
+        
         # Fetch census data for each table
         for table_id, table_name in tables.items():
             try:
-                print(f"  Fetching {table_name}...")
                 # Construct the UCGID from the GEOID
                 ucgid = f"16000US{geoid}"
+                if ucgid in done[table_id]:
+                    municipality_data[table_name] = done[table_id][ucgid]
+                    continue
+                
+                print(f"  Fetching {table_name}...")
                 data = fetch_census_data(table_id, [ucgid])
                 
                 # Get the variable name for the main estimate
-                var_info = variables(table_id)
-                main_var = [var for var in var_info if var.endswith('001E')][0]
+                main_var = main_variable(table_id)
                 
                 # Add the value to our municipality data
                 if not data.empty and main_var in data.columns:
@@ -99,6 +219,8 @@ def main():
                 else:
                     municipality_data[table_name] = None
                     print(f"  ⚠️ No data for {table_name}")
+                if journal is not None:
+                    journal.record(table_id, {ucgid: municipality_data[table_name]})
             except Exception as e:
                 print(f"  ❌ Error fetching {table_name}: {e}")
                 print("  📋 Stack trace:")
@@ -109,23 +231,67 @@ def main():
         results.append(municipality_data)
     
     # Convert results to a DataFrame
-    results_df = pd.DataFrame(results)
+    return pd.DataFrame(results)
+
+
+def main(batched=True, resume=True, fuzzy=False,
+         municipalities_file=os.path.join(DATA_DIR, 'gracy_3-9.geojson'),
+         places_file=os.path.join(DATA_DIR, 'tl_2024_08_place', 'tl_2024_08_place.geojson'),
+         output_file=os.path.join(BASE_DIR, 'municipality_census_data.csv'),
+         excel_file=os.path.join(BASE_DIR, 'municipality_census_data.xlsx')):
+    """
+    Main function to collect census data for Colorado municipalities and save it to a spreadsheet.
+    Uses data from the American Community Survey (ACS) 5-year estimates.
+    - Total Population: B01003
+    - Median household income: B19013
+    - Median monthly housing costs: B25105
+
+    With batched=True (the default) each table is fetched for all places in chunks
+    of 100 UCGIDs; batched=False makes one request per municipality per table.
+    Municipalities are matched to places by exact name only unless fuzzy=True, see
+    resolve_geoids.
+
+    Progress is checkpointed in a CollectionJournal keyed by the input files, so a
+    failed run with the same inputs picks up where it stopped. The checkpoints are
+    cleared once the results are saved. Pass resume=False to discard them and start over.
+    Input and output paths default to the repository's data directory.
+    """
+    print("Loading municipality data...")
+    # Load the municipalities data from the GeoJSON file
+    municipalities_gdf = gpd.read_file(municipalities_file)
+    
+    print(f"Loaded {len(municipalities_gdf)} municipalities")
+    
+    # Load the TIGER/Line Places data which contains the GEOID needed for census API
+    places_gdf = gpd.read_file(places_file)
+    
+    print(f"Loaded {len(places_gdf)} places from TIGER/Line data")
+    
+    journal = CollectionJournal(run_id=run_id_for(municipalities_file, places_file))
+    if not resume:
+        journal.reset()
+    
+    if batched:
+        results_df = collect_batched(municipalities_gdf, places_gdf, journal=journal, fuzzy=fuzzy)
+    else:
+        results_df = collect_per_place(municipalities_gdf, places_gdf, journal=journal, fuzzy=fuzzy)
     
     # Clean up and format the data
-    for col in ['Population', 'Median Household Income', 'Median Monthly Housing Costs']:
+    for col in TABLES.values():
         if col in results_df:
             results_df[col] = pd.to_numeric(results_df[col], errors='coerce')
     
     # Save to CSV
-    output_file = "/home/bill/dev/school/holt-research/building-code-map/municipality_census_data.csv"
     results_df.to_csv(output_file, index=False)
     print(f"\nData saved to {output_file}")
     
     # Also save to Excel for easier viewing
-    excel_file = "/home/bill/dev/school/holt-research/building-code-map/municipality_census_data.xlsx"
     results_df.to_excel(excel_file, index=False)
     print(f"Data saved to {excel_file}")
 
+    # The run is complete, the next one with these inputs starts from scratch
+    journal.reset()
+
 if __name__ == "__main__":
     try:
         main()
@@ -0,0 +1,113 @@
+import hashlib
+import os
+
+import numpy as np
+import shapely
+from scipy import sparse
+
+# Areas are measured in CONUS Albers Equal Area so shares are not distorted by latitude
+EQUAL_AREA_CRS = "EPSG:5070"
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'data', 'weights_cache')
+
+
+def _cache_path(cache_dir, vintage, target_ids, ucgids):
+    """Cache file for a vintage and the exact sets of places and block groups"""
+    digest = hashlib.sha256()
+    for value in list(target_ids) + ['|'] + list(ucgids):
+        digest.update(str(value).encode())
+        digest.update(b',')
+    return os.path.join(cache_dir, f"overlap_{vintage}_{digest.hexdigest()[:16]}.npz")
+
+
+def load_weights(path):
+    """
+    Load weights saved by save_weights.
+
+    Returns:
+    - tuple: (weights, target_ids, ucgids), see build_overlap_weights.
+    """
+    with np.load(path, allow_pickle=False) as f:
+        weights = sparse.csr_matrix((f['data'], f['indices'], f['indptr']), shape=tuple(f['shape']))
+        return weights, f['target_ids'].tolist(), f['ucgids'].tolist()
+
+
+def save_weights(path, weights, target_ids, ucgids):
+    """Write weights to a compressed .npz file, atomically"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.tmp.npz"
+    np.savez_compressed(
+        tmp_path,
+        data=weights.data, indices=weights.indices, indptr=weights.indptr,
+        shape=np.array(weights.shape),
+        target_ids=np.array(target_ids, dtype=str), ucgids=np.array(ucgids, dtype=str),
+    )
+    os.replace(tmp_path, path)
+
+
+def compute_overlap_weights(places, block_groups):
+    """
+    Share of every block group's area that falls inside every place.
+
+    Candidate pairs come from one STRtree query. Block groups lying completely
+    inside a place get a weight of 1 without computing their intersection; the
+    remaining pairs are intersected in one vectorized call.
+
+    Parameters:
+    - places (np.ndarray): Place geometries in an equal-area projection.
+    - block_groups (np.ndarray): Block group geometries in the same projection.
+
+    Returns:
+    - scipy.sparse.csr_matrix: places x block groups weights.
+    """
+    tree = shapely.STRtree(block_groups)
+    place_idx, bg_idx = tree.query(places, predicate='intersects')
+
+    weights = np.ones(len(place_idx), dtype=np.float64)
+    shapely.prepare(places)
+    partial = ~shapely.contains_properly(places[place_idx], block_groups[bg_idx])
+    overlap = shapely.area(shapely.intersection(places[place_idx[partial]], block_groups[bg_idx[partial]]))
+    bg_area = shapely.area(block_groups[bg_idx[partial]])
+    weights[partial] = np.divide(overlap, bg_area, out=np.zeros_like(overlap), where=bg_area > 0)
+
+    # Pairs that only touch along an edge have no area in common
+    keep = weights > 0
+    return sparse.coo_matrix(
+        (weights[keep], (place_idx[keep], bg_idx[keep])),
+        shape=(len(places), len(block_groups))
+    ).tocsr()
+
+
+def build_overlap_weights(places_gdf, block_groups_gdf, vintage=None, place_id_col='GEOID',
+                          bg_id_col='GEOIDFQ', cache_dir=DEFAULT_CACHE_DIR):
+    """
+    Build the place x block group apportionment weights used by census_lib.interpolate_tables.
+
+    The weight of a pair is the share of the block group's area inside the place,
+    measured in EQUAL_AREA_CRS. With a vintage (e.g. the TIGER year 2024) the
+    result is cached on disk, keyed by the vintage and the place and block group ids.
+
+    Parameters:
+    - places_gdf (GeoDataFrame): Target places.
+    - block_groups_gdf (GeoDataFrame): TIGER block groups.
+    - vintage (int or str, optional): TIGER vintage of the geometries; None disables the cache.
+    - place_id_col (str): Place id column, used as the weight row labels.
+    - bg_id_col (str): Block group UCGID column, used as the weight column labels.
+
+    Returns:
+    - tuple: (weights, target_ids, ucgids), a scipy.sparse CSR matrix with its row and column labels.
+    """
+    target_ids = places_gdf[place_id_col].astype(str).tolist()
+    ucgids = block_groups_gdf[bg_id_col].astype(str).tolist()
+
+    path = _cache_path(cache_dir, vintage, target_ids, ucgids) if vintage is not None else None
+    if path is not None and os.path.exists(path):
+        return load_weights(path)
+
+    places = places_gdf.to_crs(EQUAL_AREA_CRS).geometry.to_numpy()
+    block_groups = block_groups_gdf.to_crs(EQUAL_AREA_CRS).geometry.to_numpy()
+    weights = compute_overlap_weights(shapely.make_valid(places), shapely.make_valid(block_groups))
+
+    if path is not None:
+        save_weights(path, weights, target_ids, ucgids)
+    return weights, target_ids, ucgids
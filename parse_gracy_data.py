@@ -0,0 +1,78 @@
+import json
+import os
+
+import pandas as pd
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'data')
+
+
+def read_gracy_csv(csv_path):
+    """
+    Load the municipality spreadsheet export, keeping rows with a parsable location
+
+    Parameters:
+    - csv_path (str): The gracy CSV export (latin1, degrees written as 'ø').
+
+    Returns:
+    - DataFrame: The rows with 'latitude' and 'longitude' columns added.
+    """
+    df = pd.read_csv(csv_path, encoding='latin1')
+    df.columns = ['name', 'government', 'county', 'irc', 'iecc', 'notes', 'website', 'source', 'map', 'lat-long', 'column-1']
+    df[['latitude', 'longitude']] = df['lat-long'].str.extract(r'([0-9.]+)ø[N|S]\s([0-9.]+)ø[E|W]')
+    # drop where latitute or longitude is missing
+    return df.dropna(subset=['latitude', 'longitude'])
+
+
+def csv_to_points(csv_path, output_path):
+    """
+    Convert the municipality spreadsheet to GeoJSON points, as parse_gracy_data.ipynb does
+
+    Returns:
+    - int: The number of points written.
+    """
+    df = read_gracy_csv(csv_path)
+
+    # Create a GeoJSON file from the dataframe
+    geojson_points = {
+        "type": "FeatureCollection",
+        "features": []
+    }
+
+    # Convert each row in the dataframe to a GeoJSON point feature
+    for idx, row in df.iterrows():
+        try:
+            lat = float(row['latitude'])
+            lon = float(row['longitude'])
+
+            # Create feature with properties
+            feature = {
+                "type": "Feature",
+                "geometry": {
+                    "type": "Point",
+                    "coordinates": [lon, lat]  # GeoJSON uses [longitude, latitude] order
+                },
+                "properties": {
+                    "name": row['name'],
+                    "government": row['government'],
+                    "county": row['county'],
+                    "irc": int(row['irc']) if pd.notna(row['irc']) else "Unknown",
+                    "iecc": int(row['iecc']) if pd.notna(row['iecc']) else "Unknown",
+                    "website": row['source']
+                }
+            }
+
+            geojson_points["features"].append(feature)
+        except (ValueError, TypeError) as e:
+            print(f"Error with row {idx}: {e}")
+
+    # Save the GeoJSON file
+    with open(output_path, 'w') as f:
+        json.dump(geojson_points, f, indent=4)
+
+    return len(geojson_points['features'])
+
+
+if __name__ == "__main__":
+    output = os.path.join(DATA_DIR, 'gracy_3-3.geojson')
+    written = csv_to_points(os.path.join(DATA_DIR, 'gracy_3-3.csv'), output)
+    print(f"Created GeoJSON file with {written} points")
@@ -1,11 +1,17 @@
 # server.py
 from flask import Flask
-from building_code_map import create_dash_app
+from building_code_map import create_dash_app, register_detail_routes, register_tile_routes
 
 server = Flask(__name__)
 
 # Create the Dash app by passing in the Flask server
 app = create_dash_app(server, url_base_pathname="/")
 
+# Serve Mapbox Vector Tiles for the place polygons and Voronoi cells
+register_tile_routes(server)
+
+# Popup details are fetched on demand when a point or place popup opens
+register_detail_routes(server)
+
 if __name__ == "__main__":
     server.run(debug=True)
@@ -0,0 +1,136 @@
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+# census_lib builds an OpenAI client and a response cache at import time
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ["CENSUS_CACHE_DISABLE"] = "1"
+
+import census_lib  # noqa: E402
+import get_census_data  # noqa: E402
+from census_lib import MAX_UCGIDS_PER_REQUEST, CensusClient, split_estimates_and_margins  # noqa: E402
+
+
+class CensusStandIn(ThreadingHTTPServer):
+    """Local stand-in for the Census API that counts the connections it accepts"""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), CensusHandler)
+        self.connections = 0
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def process_request(self, request, client_address):
+        with self._lock:
+            self.connections += 1
+        super().process_request(request, client_address)
+
+
+def place_value(ucgid):
+    """The stand-in's B01003_001E for a place, derived from its GEOID"""
+    return str(int(ucgid.rpartition('US')[2]))
+
+
+class CensusHandler(BaseHTTPRequestHandler):
+    """
+    Answers group requests like the API does without an explicit ucgid variable:
+    one row per requested place, identified only by GEO_ID in its long form, in
+    reverse request order
+    """
+
+    # Keep-alive needs HTTP/1.1 and a Content-Length on every response
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        with self.server._lock:
+            self.server.requests += 1
+        ucgids = parse_qs(urlparse(self.path).query)['ucgid'][0].split(',')
+        rows = [["GEO_ID", "B01003_001E", "B01003_001M"]]
+        for ucgid in reversed(ucgids):
+            level, _, geoid = ucgid.partition('US')
+            rows.append([f"{level[:3]}0000US{geoid}", place_value(ucgid), "10"])
+        body = json.dumps(rows).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = CensusStandIn()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def make_client(server, max_workers):
+    host, port = server.server_address
+    return CensusClient(api_key="test", base_url=f"http://{host}:{port}", max_workers=max_workers,
+                        rate_limit=0, cache=None)
+
+
+def test_sequential_requests_reuse_one_connection(server):
+    client = make_client(server, max_workers=2)
+    for _ in range(10):
+        client.fetch_chunk("B01003", ["0400000US08"])
+    client.close()
+
+    assert server.requests == 10
+    assert server.connections == 1
+
+
+def test_chunked_fetch_uses_fewer_connections_than_requests(server):
+    client = make_client(server, max_workers=2)
+    chunk_count = 12
+    ucgids = [f"1600000US08{i:05d}" for i in range(chunk_count * MAX_UCGIDS_PER_REQUEST)]
+    # More workers than pooled connections are capped at the pool size
+    data = client.fetch_census_data("B01003", ucgids, max_workers=8)
+    client.close()
+
+    assert len(data) == len(ucgids)
+    assert server.requests == chunk_count
+    assert server.connections <= client.pool_maxsize < chunk_count
+
+
+def test_batched_values_are_matched_by_geo_id(server, monkeypatch):
+    client = make_client(server, max_workers=2)
+    monkeypatch.setattr(census_lib, "client", client)
+    monkeypatch.setattr(get_census_data, "client", client)
+    monkeypatch.setattr(get_census_data, "main_variable", lambda table_id: f"{table_id}_001E")
+    # The short request form, answered with 1600000US... GEO_IDs
+    ucgids = [f"16000US08{i:05d}" for i in range(1, 3 * MAX_UCGIDS_PER_REQUEST + 2)]
+
+    values = get_census_data.fetch_table_values("B01003", ucgids)
+    client.close()
+
+    assert values == {ucgid: place_value(ucgid) for ucgid in ucgids}
+
+
+def test_split_estimates_reorders_rows_by_geo_id():
+    response = census_lib.pd.DataFrame({
+        "GEO_ID": ["1500000US080010001001", "1500000US080010001002"],
+        "B01003_001E": ["20", "10"],
+        "B01003_001M": ["4", "-555555555"],
+    })
+
+    estimates, margins = split_estimates_and_margins(
+        response, ["1500000US080010001002", "1500000US080010001001", "1500000US089999999999"])
+
+    assert estimates["B01003_001E"].tolist()[:2] == [10, 20]
+    assert margins["B01003_001E"].tolist()[:2] == [0.0, 4]
+    assert estimates["B01003_001E"].isna().tolist() == [False, False, True]
@@ -0,0 +1,100 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from building_code_map import voronoi_cache as voronoi_module  # noqa: E402
+from building_code_map.coordinate_codec import decode_polygons, encode_polygons  # noqa: E402
+from building_code_map.voronoi_cache import VoronoiCache, _LRU, quantize_bounds  # noqa: E402
+
+POINTS = [[39.0, -105.0], [39.1, -105.2], [39.05, -104.9], [39.2, -105.1], [38.9, -104.95]]
+
+
+def polygon_feature(ring, **properties):
+    return {'type': 'Feature', 'geometry': {'type': 'Polygon', 'coordinates': [ring]}, 'properties': properties}
+
+
+def test_encode_decode_round_trip():
+    rng = np.random.default_rng(0)
+    features = []
+    for index in range(20):
+        center = rng.uniform([-109, 37], [-102, 41])
+        ring = (center + rng.normal(scale=0.05, size=(6, 2))).tolist()
+        features.append(polygon_feature(ring + [ring[0]], color='blue', opacity=0.2, code=str(index)))
+
+    decoded = decode_polygons(encode_polygons(features, precision=5))
+
+    assert len(decoded['features']) == len(features)
+    for original, feature in zip(features, decoded['features']):
+        assert feature['properties'] == original['properties']
+        expected = np.array(original['geometry']['coordinates'][0])
+        actual = np.array(feature['geometry']['coordinates'][0])
+        # Rounding to 5 decimals moves a coordinate by at most half a step
+        assert np.abs(actual - expected).max() <= 0.5e-5 + 1e-12
+
+
+def test_encode_swaps_axes_and_keeps_holes():
+    outer = [[39.0, -105.0], [39.0, -104.0], [40.0, -104.0], [39.0, -105.0]]
+    hole = [[39.2, -104.8], [39.2, -104.6], [39.4, -104.6], [39.2, -104.8]]
+    feature = {'type': 'Feature', 'geometry': {'type': 'Polygon', 'coordinates': [outer, hole]},
+               'properties': {'code': 'Unknown'}}
+
+    decoded = decode_polygons(encode_polygons([feature], precision=6, swap_axes=True))
+
+    rings = decoded['features'][0]['geometry']['coordinates']
+    assert rings == [[[lon, lat] for lat, lon in ring] for ring in (outer, hole)]
+
+
+def test_encode_rejects_deltas_beyond_32_bits():
+    feature = polygon_feature([[0.0, 0.0], [1e6, 0.0], [0.0, 0.0]])
+    with pytest.raises(ValueError):
+        encode_polygons([feature], precision=5)
+
+
+def test_lru_evicts_least_recently_used_by_vertex_count():
+    lru = _LRU(max_vertices=10)
+    square = [([(0, 0), (0, 1), (1, 1), (1, 0)], 0)]
+    lru.put('a', square)
+    lru.put('b', square)
+    lru.get('a')
+    lru.put('c', square)
+
+    assert lru.get('b') is None
+    assert lru.get('a') is square and lru.get('c') is square
+    assert lru.stats()['evictions'] == 1 and lru.stats()['vertices'] == 8
+
+
+def test_viewports_inside_the_points_share_one_base(monkeypatch):
+    monkeypatch.setattr(voronoi_module, 'VORONOI_CLIP_MODE', 'bounds')
+    cache = VoronoiCache()
+    points = [[37.0 + i * 0.5, -109.0 + j * 0.5] for i in range(9) for j in range(14)]
+
+    first = cache.get_polygons(points, 'irc', [[38.0, -107.0], [39.0, -106.0]])
+    cache.get_polygons(points, 'irc', [[39.0, -106.0], [40.0, -105.0]])
+    again = cache.get_polygons(points, 'irc', [[38.0, -107.0], [39.0, -106.0]])
+
+    stats = cache.stats()
+    assert again is first
+    assert stats['base']['entries'] == 1
+    assert stats['clipped'] == dict(stats['clipped'], hits=1, misses=2, entries=2)
+
+
+def test_viewport_past_the_points_gets_its_own_base(monkeypatch):
+    monkeypatch.setattr(voronoi_module, 'VORONOI_CLIP_MODE', 'bounds')
+    cache = VoronoiCache()
+    bounds = [[20.0, -130.0], [60.0, -80.0]]
+
+    polygons = cache.get_polygons(POINTS, 'irc', bounds)
+
+    # The outer cells reach the edges of a viewport far larger than the points' extent
+    min_lon, min_lat, max_lon, max_lat = quantize_bounds(bounds)
+    lats = [lat for coords, _ in polygons for lat, _ in coords]
+    lons = [lon for coords, _ in polygons for _, lon in coords]
+    assert (min(lons), min(lats), max(lons), max(lats)) == pytest.approx((min_lon, min_lat, max_lon, max_lat))
+    assert sorted(index for _, index in polygons) == list(range(len(POINTS)))
+
+    cache.get_polygons(POINTS, 'irc', [[38.5, -105.5], [39.5, -104.5]])
+    assert cache.stats()['base']['entries'] == 2
@@ -1,68 +1,111 @@
-import shapefile
+import argparse
 import json
 import os
 
-# Check if the necessary files are present
-shapefile_path = "data/tl_2024_08_place/tl_2024_08_place.shp"
-dbf_path = shapefile_path.replace(".shp", ".dbf")
-
-if not os.path.exists(shapefile_path) or not os.path.exists(dbf_path):
-    raise FileNotFoundError("Required shapefile components (.shp and .dbf) are missing.")
-
-# Read the shapefile
-reader = shapefile.Reader(shapefile_path)
-fields = [field[0] for field in reader.fields[1:]]  # Skip the DeletionFlag field
-records = reader.records()
-shapes = reader.shapes()
-
-# Convert to GeoJSON format
-geojson = {
-    "type": "FeatureCollection",
-    "features": []
-}
-
-
-for record, shape in zip(records, shapes):
-    # Convert shapefile shape type number to GeoJSON type string
-    shape_type = {
-        1: "Point",
-        3: "LineString",
-        5: "Polygon",
-        8: "MultiPoint",
-        11: "PointZ",
-        13: "LineStringZ",
-        15: "PolygonZ",
-        18: "MultiPointZ",
-        21: "PointM",
-        23: "LineStringM",
-        25: "PolygonM",
-        28: "MultiPointM",
-        31: "MultiPatch"
-    }.get(shape.shapeType, "Unknown")
-    
-    # Format coordinates based on shape type
-    # Store points as lon, lat (instead of default lat, lon)
-    coords = [(point[0], point[1]) for point in shape.points]
-    if shape_type == "Polygon" or shape_type == "PolygonZ" or shape_type == "PolygonM":
-        # For polygons, we need to group by parts
-        parts = shape.parts
-        parts.append(len(shape.points))
-        coords = []
-        for i in range(len(parts) - 1):
-            coords.append([(point[0], point[1]) for point in shape.points[parts[i]:parts[i+1]]])
-    
-    feature = {
+import shapefile
+
+from building_code_map.geostore import store_path_for, write_store
+
+DEFAULT_SHAPEFILE = "data/tl_2024_08_place/tl_2024_08_place.shp"
+
+
+def shape_record_to_feature(shape_record, fields):
+    """
+    Convert one shapefile shape and record to a GeoJSON feature.
+
+    pyshp's geo interface groups polygon rings by orientation: every outer ring
+    starts a new polygon and holes are attached to the outer ring containing
+    them, so multipart shapes become MultiPolygons instead of one Polygon with
+    every extra part as a hole. Coordinates are lon, lat.
+    """
+    shape = shape_record.shape
+    geometry = shape.__geo_interface__ if shape.shapeType != shapefile.NULL else None
+    return {
         "type": "Feature",
-        "geometry": {
-            "type": shape_type,
-            "coordinates": coords
-        },
-        "properties": {field: value for field, value in zip(fields, record)}
+        "geometry": geometry,
+        "properties": {field: value for field, value in zip(fields, shape_record.record)}
     }
-    geojson["features"].append(feature)
 
-# Save to GeoJSON file with same base name as input
-output_geojson = os.path.splitext(shapefile_path)[0] + ".geojson"
-with open(output_geojson, "w") as geojson_file:
-    json.dump(geojson, geojson_file, indent=4)
-print(f"Saved to {output_geojson}")
+
+def convert(shapefile_path, output_path, ndjson=False, indent=None):
+    """
+    Stream a shapefile to GeoJSON one feature at a time.
+
+    Only one feature is held in memory at a time, so national files convert with
+    flat memory use. The output is written to a temporary file and moved into
+    place when complete.
+
+    Parameters:
+    - shapefile_path (str): The .shp file; its .dbf must sit next to it.
+    - output_path (str): The GeoJSON (or GeoJSONSeq) file to write.
+    - ndjson (bool): Write newline-delimited features instead of a FeatureCollection.
+    - indent (int, optional): Pretty-print each feature; compact by default. Ignored
+      with ndjson, where every feature must stay on one line.
+
+    Returns:
+    - int: The number of features written.
+    """
+    dbf_path = os.path.splitext(shapefile_path)[0] + ".dbf"
+    if not os.path.exists(shapefile_path) or not os.path.exists(dbf_path):
+        raise FileNotFoundError("Required shapefile components (.shp and .dbf) are missing.")
+
+    if ndjson:
+        indent = None
+    separators = (',', ':') if indent is None else (',', ': ')
+    count = 0
+    tmp_path = output_path + ".tmp"
+    with shapefile.Reader(shapefile_path) as reader, open(tmp_path, "w") as out:
+        fields = [field[0] for field in reader.fields[1:]]  # Skip the DeletionFlag field
+        if not ndjson:
+            out.write('{"type":"FeatureCollection","features":[\n')
+        for shape_record in reader.iterShapeRecords():
+            feature = shape_record_to_feature(shape_record, fields)
+            if count and not ndjson:
+                out.write(",\n")
+            # default=str covers date fields
+            json.dump(feature, out, indent=indent, separators=separators, default=str)
+            if ndjson:
+                out.write("\n")
+            count += 1
+        if not ndjson:
+            out.write("\n]}\n")
+    os.replace(tmp_path, output_path)
+    return count
+
+
+def write_shapefile_store(shapefile_path, store_path):
+    """Write the binary geometry store the app loads instead of parsing the GeoJSON"""
+    with shapefile.Reader(shapefile_path) as reader:
+        fields = [field[0] for field in reader.fields[1:]]
+        features = (shape_record_to_feature(sr, fields) for sr in reader.iterShapeRecords())
+        return write_store(features, store_path)
+
+
+def convert_with_store(shapefile_path, output_path):
+    """Convert a shapefile to GeoJSON and write its binary store next to it"""
+    count = convert(shapefile_path, output_path)
+    write_shapefile_store(shapefile_path, store_path_for(output_path))
+    return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert a shapefile to GeoJSON")
+    parser.add_argument("shapefile", nargs="?", default=DEFAULT_SHAPEFILE)
+    parser.add_argument("-o", "--output", help="Output path (default: input with a .geojson or .geojsonl extension)")
+    # Pretty-printing would split NDJSON features across lines
+    layout = parser.add_mutually_exclusive_group()
+    layout.add_argument("--ndjson", action="store_true", help="Write newline-delimited GeoJSON features")
+    layout.add_argument("--indent", type=int, default=None, help="Pretty-print with this indent")
+    parser.add_argument("--no-store", action="store_true", help="Skip writing the binary geometry store")
+    args = parser.parse_args()
+
+    # Save next to the input with the same base name by default
+    extension = ".geojsonl" if args.ndjson else ".geojson"
+    output_geojson = args.output or os.path.splitext(args.shapefile)[0] + extension
+    written = convert(args.shapefile, output_geojson, ndjson=args.ndjson, indent=args.indent)
+    print(f"Saved {written} features to {output_geojson}")
+
+    if not args.no_store:
+        store_path = store_path_for(output_geojson)
+        write_shapefile_store(args.shapefile, store_path)
+        print(f"Saved binary geometry store to {store_path}")
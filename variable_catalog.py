@@ -0,0 +1,83 @@
+import re
+from collections import defaultdict
+
+# <group>_<number><suffix>, e.g. B01003_001E, B01003_001M, B01003_001EA
+VARIABLE_PATTERN = re.compile(r'^(?P<group>[A-Z0-9]+)_(?P<number>\d+)(?P<suffix>E|M|EA|MA|PE|PM)$')
+
+
+def label_path(label):
+    """Split a Census label like 'Estimate!!Total:!!Male:' into ('Estimate', 'Total', 'Male')"""
+    return tuple(part.rstrip(':').strip() for part in label.split('!!'))
+
+
+class VariableCatalog:
+    """
+    Indexed metadata for every variable of one year and dataset.
+
+    Built once from the dataset's variables.json, so label lookups and main
+    estimate resolution are dictionary lookups instead of API calls.
+
+    Indexes:
+    - by group: group name -> {variable: metadata}, the format of census_lib.variables.
+    - by suffix type: (group, 'E' | 'M' | 'EA' | 'MA' | ...) -> sorted variable names.
+    - by label hierarchy: (group, label path) -> variable, and variable -> child variables.
+    """
+
+    def __init__(self, variables):
+        self.variables = variables
+        self._by_group = defaultdict(dict)
+        self._by_suffix = defaultdict(list)
+        self._by_label = {}
+        self._children = defaultdict(list)
+
+        for name, meta in variables.items():
+            match = VARIABLE_PATTERN.match(name)
+            group = meta.get('group') or (match.group('group') if match else None)
+            if not group or group == 'N/A':
+                continue
+            self._by_group[group][name] = meta
+            if match:
+                self._by_suffix[(group, match.group('suffix'))].append(name)
+            if 'label' in meta:
+                self._by_label[(group, label_path(meta['label']))] = name
+
+        for names in self._by_suffix.values():
+            names.sort()
+        for (group, path), name in self._by_label.items():
+            parent = self._by_label.get((group, path[:-1]))
+            if parent is not None:
+                self._children[parent].append(name)
+
+    def group(self, group):
+        """All variables of a group keyed by name, like census_lib.variables"""
+        return self._by_group.get(group, {})
+
+    def by_suffix(self, group, suffix='E'):
+        """Variable names of a group with a suffix type, in variable order"""
+        return self._by_suffix.get((group, suffix), [])
+
+    def main_estimate(self, group):
+        """The group's first estimate (<group>_001E, usually the total)"""
+        estimates = self.by_suffix(group, 'E')
+        return estimates[0] if estimates else None
+
+    def label(self, name):
+        """Readable label of a variable ('!!' replaced by spaces), or the name if unknown"""
+        meta = self.variables.get(name)
+        return meta['label'].replace('!!', ' ') if meta and 'label' in meta else name
+
+    def by_label(self, group, path):
+        """The variable of a group with a label path, e.g. ('Estimate', 'Total', 'Male')"""
+        return self._by_label.get((group, tuple(path)))
+
+    def children(self, name):
+        """Variables one level below a variable in its group's label hierarchy"""
+        return self._children.get(name, [])
+
+    def margin_of(self, name):
+        """The margin of error variable of an estimate, if the group has one"""
+        match = VARIABLE_PATTERN.match(name)
+        if not match or match.group('suffix') != 'E':
+            return None
+        margin = f"{match.group('group')}_{match.group('number')}M"
+        return margin if margin in self.variables else None